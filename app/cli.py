@@ -0,0 +1,133 @@
+"""Maintenance commands, run as ``python -m app.cli <command>``."""
+
+import argparse
+import logging
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud, media_worker, models, score_recompute, voice_storage
+from .db import SessionLocal, init_db
+
+logger = logging.getLogger(__name__)
+
+
+def _cmd_rebuild_score_stats(db: Session, args: argparse.Namespace) -> None:
+    count = crud.rebuild_driver_score_stats(db, driver_id=args.driver_id)
+    print(f"rebuilt driver_score_stats rows={count}")
+    buckets = crud.rebuild_driver_score_daily(db, driver_id=args.driver_id)
+    print(f"rebuilt driver_score_daily buckets={buckets}")
+
+
+def _cmd_rebuild_live_status(db: Session, args: argparse.Namespace) -> None:
+    count = crud.rebuild_driver_live_status(db, driver_id=args.driver_id)
+    print(f"rebuilt driver_live_status rows={count}")
+
+
+def _cmd_rebuild_harsh_events(db: Session, args: argparse.Namespace) -> None:
+    count = crud.rebuild_harsh_events(db)
+    print(f"rebuilt harsh_events rows={count}")
+
+
+def _cmd_purge_sessions(db: Session, args: argparse.Namespace) -> None:
+    revoked, sessions = crud.purge_expired_tokens(db)
+    print(f"purged revoked_tokens={revoked} sessions={sessions}")
+
+
+def _cmd_migrate_voice_storage(db: Session, args: argparse.Namespace) -> None:
+    migrated, deduplicated, missing = voice_storage.migrate_to_blobs(
+        db, voice_storage.storage, batch_size=args.batch_size, grace_sec=args.grace_sec, dry_run=args.dry_run
+    )
+    print(f"migrated voice_messages={migrated} deduplicated={deduplicated} missing_files={missing}")
+
+
+def _cmd_probe_voice_media(db: Session, args: argparse.Namespace) -> None:
+    count = media_worker.process_pending(db, batch_size=args.batch_size)
+    print(f"probed voice_messages={count}")
+
+
+def _print_snapshot_table(db: Session, run: models.ScoreRecomputeRun, top: int) -> None:
+    rows = score_recompute.list_snapshots(db, run.id, limit=top)
+    print(f"run={run.id} org={run.organization_id} status={run.status} drivers={run.driver_count} events={run.event_count}")
+    print(f"{'rank':>5} {'driver':>8} {'trips':>6} {'events':>9} {'harsh':>7} {'ratio':>6} {'avg_kmh':>8} {'score':>6}")
+    for row in rows:
+        avg = f"{row.avg_speed_kmh:.1f}" if row.avg_speed_kmh is not None else "-"
+        print(
+            f"{row.rank:>5} {row.driver_id:>8} {row.total_trips:>6} {row.total_events:>9} {row.harsh_events:>7} "
+            f"{row.harsh_ratio:>6.3f} {avg:>8} {row.score_0_100:>6.1f}"
+        )
+
+
+def _cmd_recompute_org_scores(db: Session, args: argparse.Namespace) -> None:
+    if args.all:
+        org_ids = [row[0] for row in db.query(models.Organization.id).order_by(models.Organization.id)]
+    else:
+        org_ids = args.org_id or []
+    if not org_ids:
+        raise SystemExit("pass --org-id (repeatable) or --all")
+
+    for org_id in org_ids:
+        last_logged = [0]
+
+        def progress(scanned: int, total: int) -> None:
+            if scanned - last_logged[0] >= args.progress_every or scanned >= total:
+                last_logged[0] = scanned
+                pct = 100.0 * scanned / total if total else 100.0
+                logger.info("org=%s scanned=%s/%s (%.1f%%)", org_id, scanned, total, pct)
+
+        run = score_recompute.recompute_organization_scores(db, org_id, chunk_rows=args.chunk_rows, progress=progress)
+        _print_snapshot_table(db, run, args.top)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = sub.add_parser("rebuild-score-stats", help="Regenerate driver_score_stats and driver_score_daily from raw trips and telemetry")
+    rebuild.add_argument("--driver-id", type=int, default=None, help="Only rebuild this driver")
+    rebuild.set_defaults(handler=_cmd_rebuild_score_stats)
+
+    live = sub.add_parser("rebuild-live-status", help="Regenerate driver_live_status from the newest trip and telemetry rows")
+    live.add_argument("--driver-id", type=int, default=None, help="Only rebuild this driver")
+    live.set_defaults(handler=_cmd_rebuild_live_status)
+
+    harsh = sub.add_parser("rebuild-harsh-events", help="Regenerate the harsh_events feed table from telemetry")
+    harsh.set_defaults(handler=_cmd_rebuild_harsh_events)
+
+    purge = sub.add_parser("purge-sessions", help="Delete revoked tokens and idle sessions older than SESSION_TOKEN_TTL_SEC")
+    purge.set_defaults(handler=_cmd_purge_sessions)
+
+    voice = sub.add_parser("migrate-voice-storage", help="Move voice files from per-driver directories into the sharded blob store")
+    voice.add_argument("--batch-size", type=int, default=500, help="Messages re-pointed per transaction")
+    voice.add_argument("--grace-sec", type=float, default=5.0, help="Wait before deleting originals, for in-flight downloads")
+    voice.add_argument("--dry-run", action="store_true", help="Only hash and count the files that would move")
+    voice.set_defaults(handler=_cmd_migrate_voice_storage)
+
+    media = sub.add_parser("probe-voice-media", help="Fill duration and waveform peaks of unprocessed voice messages in this process")
+    media.add_argument("--batch-size", type=int, default=50, help="Messages written per UPDATE batch")
+    media.set_defaults(handler=_cmd_probe_voice_media)
+
+    recompute = sub.add_parser("recompute-org-scores", help="Recompute all driver scores of an organization and store a ranked snapshot")
+    recompute.add_argument("--org-id", type=int, action="append", help="Organization id (repeatable)")
+    recompute.add_argument("--all", action="store_true", help="Recompute every organization")
+    recompute.add_argument("--chunk-rows", type=int, default=score_recompute.DEFAULT_CHUNK_ROWS, help="Telemetry rows fetched per chunk")
+    recompute.add_argument("--progress-every", type=int, default=200000, help="Log progress every N telemetry rows")
+    recompute.add_argument("--top", type=int, default=20, help="Rows of the results table to print")
+    recompute.set_defaults(handler=_cmd_recompute_org_scores)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args = build_parser().parse_args(argv)
+    init_db()
+    db = SessionLocal()
+    try:
+        args.handler(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional, Tuple
 
-from sqlalchemy import case, func
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, and_, case, event, func, insert, inspect, literal, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from . import models, schemas
+from . import fleet_events, geo_index, models, rate_limit, schemas, session_cache, session_tokens, touch_tracker
+
+logger = logging.getLogger(__name__)
 
 
 def create_driver(db: Session, driver: schemas.DriverCreate) -> models.Driver:
@@ -100,15 +105,105 @@ def get_session_by_token(db: Session, token: str) -> Optional[models.SessionToke
 
 
 def touch_session(db: Session, session: models.SessionToken) -> None:
-    session.last_seen_at = datetime.utcnow()
+    now = datetime.utcnow()
+    tracker = touch_tracker.tracker
+    if tracker.is_fresh(session.last_seen_at, now) or tracker.record("session", session.id, now):
+        return
+    session.last_seen_at = now
     db.commit()
 
 
+def touch_operator_token(db: Session, row: models.OperatorToken) -> None:
+    now = datetime.utcnow()
+    tracker = touch_tracker.tracker
+    if tracker.is_fresh(row.last_used_at, now) or tracker.record("operator_token", row.id, now):
+        return
+    row.last_used_at = now
+    db.commit()
+
+
+def resolve_operator_token(db: Session, token_hash: str) -> Optional[session_cache.CachedOperatorToken]:
+    """Scope and expiry of an operator token, from the in-process cache when possible (no SQL on a hit)."""
+    cached = session_cache.operator_tokens.get(token_hash)
+    if cached is not None:
+        touch_tracker.tracker.record("operator_token", cached.token_id)
+        return cached
+    row = db.query(models.OperatorToken).filter(models.OperatorToken.token_hash == token_hash).first()
+    if not row:
+        return None
+    cached = session_cache.operator_tokens.put(
+        token_hash, session_cache.CachedOperatorToken(row.id, row.group_tag, row.organization_id, row.expires_at)
+    )
+    touch_operator_token(db, row)
+    return cached
+
+
+def _detached_snapshot(obj):
+    """Column-only detached copy of a loaded ORM object, safe to share across sessions via merge(load=False)."""
+    mapper = inspect(obj).mapper
+    copy = mapper.class_()
+    for attr in mapper.column_attrs:
+        setattr(copy, attr.key, getattr(obj, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+def _resolve_signed_session(db: Session, token: str) -> Optional[models.Driver]:
+    # Signature, expiry and the in-memory revocation set replace the sessions table for these tokens.
+    claims = session_tokens.verify(token)
+    if claims is None or session_tokens.revocations.contains(db, token):
+        return None
+    cached = session_cache.cache.get(token)
+    if cached is not None:
+        return db.merge(cached.driver, load=False)
+    driver = get_driver(db, claims.driver_id)
+    if driver and session_cache.cache.enabled:
+        session_cache.cache.put(token, session_cache.CachedSession(driver.id, None, _detached_snapshot(driver)))
+    return driver
+
+
+def resolve_session_driver(db: Session, token: str) -> Optional[models.Driver]:
+    """Driver behind a bearer token, or None if the token is unknown or revoked.
+
+    Hits in the in-process session cache are attached to ``db`` without any SQL (``last_seen_at`` is
+    queued for the batched flush); misses do the revocation, session and driver lookups and fill the cache.
+    """
+    if not token:
+        return None
+    if session_tokens.is_signed(token):
+        return _resolve_signed_session(db, token)
+    cached = session_cache.cache.get(token)
+    if cached is not None:
+        touch_tracker.tracker.record("session", cached.session_id)
+        return db.merge(cached.driver, load=False)
+
+    if is_token_revoked(db, token):
+        return None
+    session = get_session_by_token(db, token)
+    if not session or session.last_seen_at < datetime.utcnow() - session_tokens.session_token_ttl():
+        # Idle past the session lifetime: the garbage collector is about to delete it anyway.
+        return None
+    driver = get_driver(db, session.driver_id)
+    if not driver:
+        return None
+    snapshot = _detached_snapshot(driver) if session_cache.cache.enabled else None
+    session_id = session.id
+    touch_session(db, session)
+    if snapshot is not None:
+        session_cache.cache.put(token, session_cache.CachedSession(snapshot.id, session_id, snapshot))
+    return driver
+
+
 def start_trip(db: Session, req: schemas.TripStartRequest, driver_id: int) -> models.Trip:
     trip = models.Trip(driver_id=driver_id, origin=req.origin, destination=req.destination, notes=req.notes, assignment_id=req.assignment_id)
     db.add(trip)
+    _bump_score_stats(db, {driver_id: {"trip_count": 1}})
+    _bump_score_daily(db, {(driver_id, datetime.utcnow().date()): {"trip_count": 1}})
+    db.flush()
+    _set_live_trip(db, driver_id, trip.id, "active", trip.started_at)
     db.commit()
     db.refresh(trip)
+    _publish_trip(db, trip, "active")
     return trip
 
 
@@ -126,30 +221,674 @@ def finish_trip(db: Session, trip_id: int, req: schemas.TripFinishRequest, drive
         trip.safety_score = req.safety_score
     if req.notes:
         trip.notes = (trip.notes or "") + f"\n{req.notes}"
+    live = models.DriverLiveStatus
+    db.query(live).filter(live.driver_id == driver_id, live.trip_id == trip.id).update(
+        {live.trip_status: "completed", live.version: next_change_version(db), live.updated_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
     db.commit()
     db.refresh(trip)
+    _publish_trip(db, trip, "completed")
     return trip
 
 
+def _driver_scopes(db: Session, driver_ids) -> dict:
+    rows = db.query(models.Driver.id, models.Driver.group_tag, models.Driver.organization_id).filter(models.Driver.id.in_(set(driver_ids)))
+    return {row.id: (row.group_tag, row.organization_id) for row in rows}
+
+
+def sync_geo_scope(db: Session, scope: geo_index.ScopeKey) -> None:
+    """Bring the live map's members of one tenant scope in line with the drivers table before it is queried.
+
+    The index is per process and only re-scoped by the process that committed a group/organization
+    change, so another worker could still hold a moved or deleted driver under the old tenant.
+    """
+    kind, value = scope
+    if kind == "all":
+        return
+    column = models.Driver.organization_id if kind == "org" else models.Driver.group_tag
+    current = {row[0] for row in db.query(models.Driver.id).filter(column == value)}
+    indexed = geo_index.index.members(scope)
+    moved = (indexed - current) | {driver_id for driver_id in current - indexed if geo_index.index.scope_tuple(driver_id) is not None}
+    if not moved:
+        return
+    scopes = _driver_scopes(db, moved)
+    for driver_id in moved:
+        if driver_id in scopes:
+            geo_index.index.rescope(driver_id, *scopes[driver_id])
+        else:
+            geo_index.index.remove(driver_id)
+
+
+def load_live_position_index(db: Session) -> int:
+    """Seed the in-memory live map from driver_live_status (e.g. at startup); returns drivers indexed."""
+    live = models.DriverLiveStatus
+    rows = (
+        db.query(live.driver_id, live.last_latitude, live.last_longitude, live.last_ts, live.last_speed_kmh, models.Driver.group_tag, models.Driver.organization_id)
+        .join(models.Driver, models.Driver.id == live.driver_id)
+        .filter(live.last_ts.isnot(None))
+    )
+    count = 0
+    for row in rows:
+        count += geo_index.index.update(
+            row.driver_id, row.last_latitude, row.last_longitude, row.last_ts, row.last_speed_kmh, row.group_tag, row.organization_id
+        )
+    return count
+
+
+def _publish_trip(db: Session, trip: models.Trip, status: str) -> None:
+    if not fleet_events.hub.has_subscribers():
+        return
+    try:
+        group_tag, organization_id = _driver_scopes(db, [trip.driver_id]).get(trip.driver_id, (None, None))
+        fleet_events.hub.publish(
+            "trip",
+            {"driver_id": trip.driver_id, "trip_id": trip.id, "status": status, "started_at": trip.started_at, "finished_at": trip.finished_at},
+            group_tag,
+            organization_id,
+        )
+    except Exception:
+        logger.exception("fleet_events trip publish failed trip=%s", trip.id)
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_telemetry_row(req: schemas.TelemetryCreate, driver_id: int, now: Optional[datetime] = None) -> dict:
+    # Event time is the device capture time when given, so late uploads keep their place in the timeline.
+    received_at = now or datetime.utcnow()
+    device_ts = to_naive_utc(req.device_ts) if req.device_ts else None
+    return {
+        "driver_id": driver_id,
+        "trip_id": req.trip_id,
+        "ts": device_ts or received_at,
+        "device_ts": device_ts,
+        "seq": req.seq,
+        "received_at": received_at,
+        "client_event_id": req.client_event_id or None,
+        "latitude": req.latitude,
+        "longitude": req.longitude,
+        "speed_kmh": req.speed_kmh,
+        "accel": req.accel,
+        "brake_hard": req.brake_hard,
+        "accel_hard": req.accel_hard,
+        "cornering_hard": req.cornering_hard,
+        "road_type": req.road_type,
+        "weather": req.weather,
+        "raw_notes": req.raw_notes,
+    }
+
+
 def create_telemetry(db: Session, req: schemas.TelemetryCreate, driver_id: int) -> models.TelemetryEvent:
-    ev = models.TelemetryEvent(
+    [(event_id, _inserted)] = bulk_insert_telemetry(db, [build_telemetry_row(req, driver_id)])
+    return db.get(models.TelemetryEvent, event_id)
+
+
+def _dialect_insert(db, model):
+    bind = db.get_bind() if isinstance(db, Session) else db
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _insert_or_ignore(db: Session, model):
+    return _dialect_insert(db, model).on_conflict_do_nothing()
+
+
+def bulk_insert_telemetry(db: Session, rows: List[dict]) -> List[Tuple[int, bool]]:
+    """Insert prepared telemetry rows in a single transaction.
+
+    Returns ``(id, inserted)`` per row in input order. Rows whose ``client_event_id`` is already
+    stored for the driver (or repeated within ``rows``) are not written again; they report the id
+    of the existing row with ``inserted=False``.
+    """
+    if not rows:
+        return []
+    out: List[Optional[Tuple[int, bool]]] = [None] * len(rows)
+    plain: List[int] = []
+    keyed: dict[tuple[int, str], List[int]] = {}
+    for idx, row in enumerate(rows):
+        if row.get("client_event_id"):
+            keyed.setdefault((row["driver_id"], row["client_event_id"]), []).append(idx)
+        else:
+            plain.append(idx)
+
+    tel = models.TelemetryEvent
+    if plain:
+        stmt = insert(tel).returning(tel.id, sort_by_parameter_order=True)
+        for idx, row in zip(plain, db.execute(stmt, [rows[i] for i in plain])):
+            out[idx] = (row[0], True)
+
+    if keyed:
+        stmt = _insert_or_ignore(db, tel).returning(tel.id, tel.driver_id, tel.client_event_id)
+        inserted = {(r.driver_id, r.client_event_id): r.id for r in db.execute(stmt, [rows[idxs[0]] for idxs in keyed.values()])}
+        missing = [key for key in keyed if key not in inserted]
+        existing: dict[tuple[int, str], int] = {}
+        if missing:
+            q = db.query(tel.id, tel.driver_id, tel.client_event_id).filter(
+                tel.driver_id.in_({key[0] for key in missing}),
+                tel.client_event_id.in_({key[1] for key in missing}),
+            )
+            existing = {(r.driver_id, r.client_event_id): r.id for r in q}
+        for key, idxs in keyed.items():
+            if key in inserted:
+                out[idxs[0]] = (inserted[key], True)
+                idxs = idxs[1:]
+            for idx in idxs:
+                out[idx] = (inserted.get(key) or existing[key], False)
+
+    new_rows = [row for row, result in zip(rows, out) if result[1]]
+    # Read inside the ingest transaction: the scope decides which tenant sees these rows.
+    scopes = _driver_scopes(db, {row["driver_id"] for row in new_rows}) if new_rows else {}
+    _bump_score_stats(db, _score_deltas(new_rows, key=lambda row: row["driver_id"]))
+    # Daily buckets follow the event time, so replayed backlog points land on the day they were recorded.
+    _bump_score_daily(db, _score_deltas(new_rows, key=lambda row: (row["driver_id"], row["ts"].date())))
+    _update_live_positions(db, new_rows)
+    _insert_harsh_events(db, [(event_id, row) for row, (event_id, inserted) in zip(rows, out) if inserted and _is_harsh(row)], scopes)
+    db.commit()
+    if new_rows:
+        try:
+            geo_index.feed(new_rows, scopes)
+            if fleet_events.hub.has_subscribers():
+                fleet_events.publish_telemetry(new_rows, scopes)
+        except Exception:
+            logger.exception("live position fan-out failed rows=%s", len(new_rows))
+    return out
+
+
+_SCORE_STAT_FIELDS = ("event_count", "harsh_count", "speed_sum", "speed_count", "trip_count")
+
+
+def _is_harsh(row: dict) -> bool:
+    return bool(row.get("brake_hard") or row.get("accel_hard") or row.get("cornering_hard"))
+
+
+def _score_deltas(rows, key) -> dict:
+    deltas: dict = {}
+    for row in rows:
+        delta = deltas.setdefault(key(row), {})
+        delta["event_count"] = delta.get("event_count", 0) + 1
+        if _is_harsh(row):
+            delta["harsh_count"] = delta.get("harsh_count", 0) + 1
+        if row.get("speed_kmh") is not None:
+            delta["speed_sum"] = delta.get("speed_sum", 0.0) + float(row["speed_kmh"])
+            delta["speed_count"] = delta.get("speed_count", 0) + 1
+    return deltas
+
+
+def _upsert_score_counters(db: Session, model, params: List[dict], key_fields: List[str]) -> None:
+    stmt = _dialect_insert(db, model)
+    set_ = {field: getattr(model, field) + getattr(stmt.excluded, field) for field in _SCORE_STAT_FIELDS}
+    if "updated_at" in params[0]:
+        set_["updated_at"] = stmt.excluded.updated_at
+    stmt = stmt.on_conflict_do_update(index_elements=[getattr(model, f) for f in key_fields], set_=set_)
+    db.execute(stmt, params)
+
+
+def _bump_score_stats(db: Session, deltas: dict[int, dict]) -> None:
+    """Add per-driver counter deltas to driver_score_stats inside the caller's transaction."""
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    params = [
+        {"driver_id": driver_id, "updated_at": now, **{field: delta.get(field, 0) for field in _SCORE_STAT_FIELDS}}
+        for driver_id, delta in deltas.items()
+    ]
+    _upsert_score_counters(db, models.DriverScoreStats, params, ["driver_id"])
+
+
+def _bump_score_daily(db: Session, deltas: dict[tuple[int, date], dict]) -> None:
+    """Add per-driver, per-day counter deltas to driver_score_daily inside the caller's transaction."""
+    if not deltas:
+        return
+    params = [
+        {"driver_id": driver_id, "day": day, **{field: delta.get(field, 0) for field in _SCORE_STAT_FIELDS}}
+        for (driver_id, day), delta in deltas.items()
+    ]
+    _upsert_score_counters(db, models.DriverScoreDaily, params, ["driver_id", "day"])
+
+
+_LIVE_POSITION_FIELDS = (
+    "last_latitude",
+    "last_longitude",
+    "last_speed_kmh",
+    "last_brake_hard",
+    "last_accel_hard",
+    "last_cornering_hard",
+)
+
+
+def _live_position(row) -> dict:
+    """Map a telemetry row (dict or TelemetryEvent) onto driver_live_status position columns."""
+    get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+    return {
+        "last_ts": get("ts"),
+        "last_latitude": get("latitude"),
+        "last_longitude": get("longitude"),
+        "last_speed_kmh": get("speed_kmh"),
+        "last_brake_hard": bool(get("brake_hard")),
+        "last_accel_hard": bool(get("accel_hard")),
+        "last_cornering_hard": bool(get("cornering_hard")),
+    }
+
+
+DRIVER_STATE_COUNTER = "driver_state"
+
+
+def next_change_version(db, name: str = DRIVER_STATE_COUNTER) -> int:
+    """Increment and return a named change counter.
+
+    The counter row stays locked until the caller commits, so versions become visible in commit
+    order and a reader holding cursor ``v`` never misses a later commit with a version <= ``v``.
+    Every call within one transaction returns the same value: the counter moves once per commit,
+    not once per flush or touched row.
+    """
+    conn = db.connection() if isinstance(db, Session) else db
+    txn = conn.get_transaction()
+    issued = conn.info.setdefault("change_versions", {})
+    cached = issued.get(name)
+    if cached is not None and txn is not None and cached[0] is txn:
+        return cached[1]
+    counter = models.ChangeCounter
+    stmt = _dialect_insert(db, counter).values(name=name, value=1)
+    stmt = stmt.on_conflict_do_update(index_elements=[counter.name], set_={"value": counter.value + 1}).returning(counter.value)
+    value = conn.execute(stmt).scalar_one()
+    issued[name] = (txn, value)
+    return value
+
+
+def current_change_version(db: Session, name: str = DRIVER_STATE_COUNTER) -> int:
+    return db.query(models.ChangeCounter.value).filter(models.ChangeCounter.name == name).scalar() or 0
+
+
+def touch_driver_state(db, driver_ids) -> None:
+    """Bump the driver_live_status version for drivers whose dashboard-visible state changed."""
+    ids = sorted(set(driver_ids))
+    if not ids:
+        return
+    version = next_change_version(db)
+    live = models.DriverLiveStatus
+    stmt = _dialect_insert(db, live)
+    stmt = stmt.on_conflict_do_update(index_elements=[live.driver_id], set_={"version": stmt.excluded.version})
+    now = datetime.utcnow()
+    db.execute(stmt, [{"driver_id": driver_id, "trip_status": "none", "version": version, "updated_at": now} for driver_id in ids])
+
+
+SCOPE_EXITS_FLOOR_COUNTER = "driver_scope_exits_floor"
+
+
+def _scope_exit_retention_sec() -> int:
+    return max(60, int(os.getenv("DASHBOARD_SCOPE_EXIT_RETENTION_SEC", str(7 * 86400))))
+
+
+def record_scope_exits(conn, exits: List[dict]) -> None:
+    """Store ``driver_scope_exits`` rows and prune those past retention.
+
+    The floor counter remembers the newest pruned version; a delta requested from an older cursor
+    could miss a pruned exit, so it is answered with the full list instead.
+    """
+    if not exits:
+        return
+    version = next_change_version(conn)
+    now = datetime.utcnow()
+    table = models.DriverScopeExit.__table__
+    conn.execute(insert(table), [{**row, "version": version, "created_at": now} for row in exits])
+    horizon = now - timedelta(seconds=_scope_exit_retention_sec())
+    pruned = conn.execute(select(func.max(table.c.version)).where(table.c.created_at < horizon)).scalar()
+    if pruned is None:
+        return
+    conn.execute(table.delete().where(table.c.version <= pruned))
+    counter = models.ChangeCounter
+    stmt = _dialect_insert(conn, counter).values(name=SCOPE_EXITS_FLOOR_COUNTER, value=pruned)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[counter.name],
+        set_={"value": case((counter.value < stmt.excluded.value, stmt.excluded.value), else_=counter.value)},
+    )
+    conn.execute(stmt)
+
+
+_DASHBOARD_DRIVER_FIELDS = ("name", "phone", "company_name", "group_tag", "organization_id", "approved", "kyc_status", "last_login_at")
+_OPERATOR_TOKEN_SCOPE_FIELDS = ("token_hash", "group_tag", "organization_id", "expires_at")
+
+
+@event.listens_for(Session, "after_flush")
+def _touch_changed_drivers(session: Session, flush_context) -> None:
+    # Driver rows are edited from many endpoints; catching them at flush keeps the dashboard delta cursor exact.
+    changed = []
+    exits = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, models.Driver) or obj.id is None:
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[f].history.has_changes() for f in _DASHBOARD_DRIVER_FIELDS):
+            changed.append(obj.id)
+        group_hist = state.attrs["group_tag"].history
+        org_hist = state.attrs["organization_id"].history
+        if group_hist.has_changes() or org_hist.has_changes():
+            # Applied to the live map only once the change is committed.
+            session.info.setdefault("geo_rescope", {})[obj.id] = (obj.group_tag, obj.organization_id)
+            if obj not in session.new:
+                # Operators of the previous scope must drop the driver from their delta-synced list.
+                exits.append(
+                    {
+                        "driver_id": obj.id,
+                        "group_tag": group_hist.deleted[0] if group_hist.deleted else obj.group_tag,
+                        "organization_id": org_hist.deleted[0] if org_hist.deleted else obj.organization_id,
+                        "deleted": False,
+                    }
+                )
+        if obj not in session.new:
+            # Cached bearer lookups hold a snapshot of the driver row; the next request reloads it.
+            session_cache.cache.invalidate_driver(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, models.Driver):
+            exits.append({"driver_id": obj.id, "group_tag": obj.group_tag, "organization_id": obj.organization_id, "deleted": True})
+    # Core statements on the flush connection: an ORM execute here would try to autoflush again.
+    if changed:
+        touch_driver_state(session.connection(), changed)
+    record_scope_exits(session.connection(), exits)
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.OperatorToken):
+            continue
+        # Re-scoped, re-dated or deleted operator tokens must not keep authenticating from the cache.
+        state = inspect(obj)
+        if obj in session.deleted or any(state.attrs[f].history.has_changes() for f in _OPERATOR_TOKEN_SCOPE_FIELDS):
+            for token_hash in {obj.token_hash, *state.attrs["token_hash"].history.deleted}:
+                session_cache.operator_tokens.invalidate(token_hash)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_rescopes(session: Session) -> None:
+    for driver_id, (group_tag, organization_id) in session.info.pop("geo_rescope", {}).items():
+        geo_index.index.rescope(driver_id, group_tag, organization_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_rescopes(session: Session, previous_transaction) -> None:
+    if session.in_transaction():
+        return
+    session.info.pop("geo_rescope", None)
+
+
+def _set_live_trip(db: Session, driver_id: int, trip_id: int, status: str, started_at: Optional[datetime]) -> None:
+    stmt = _dialect_insert(db, models.DriverLiveStatus).values(
         driver_id=driver_id,
-        trip_id=req.trip_id,
-        latitude=req.latitude,
-        longitude=req.longitude,
-        speed_kmh=req.speed_kmh,
-        accel=req.accel,
-        brake_hard=req.brake_hard,
-        accel_hard=req.accel_hard,
-        cornering_hard=req.cornering_hard,
-        road_type=req.road_type,
-        weather=req.weather,
-        raw_notes=req.raw_notes,
+        trip_id=trip_id,
+        trip_status=status,
+        trip_started_at=started_at,
+        version=next_change_version(db),
+        updated_at=datetime.utcnow(),
     )
-    db.add(ev)
+    set_ = {field: getattr(stmt.excluded, field) for field in ("trip_id", "trip_status", "trip_started_at", "version", "updated_at")}
+    db.execute(stmt.on_conflict_do_update(index_elements=[models.DriverLiveStatus.driver_id], set_=set_))
+
+
+def _insert_harsh_events(db: Session, events: List[Tuple[int, dict]], scopes: dict) -> None:
+    """Copy harsh telemetry rows into the narrow harsh_events feed table inside the caller's transaction."""
+    if not events:
+        return
+    params = []
+    for event_id, row in events:
+        group_tag, organization_id = scopes.get(row["driver_id"], (None, None))
+        params.append(
+            {
+                "telemetry_event_id": event_id,
+                "driver_id": row["driver_id"],
+                "trip_id": row.get("trip_id"),
+                "group_tag": group_tag,
+                "organization_id": organization_id,
+                "ts": row["ts"],
+                "brake_hard": bool(row.get("brake_hard")),
+                "accel_hard": bool(row.get("accel_hard")),
+                "cornering_hard": bool(row.get("cornering_hard")),
+                "speed_kmh": row.get("speed_kmh"),
+                "latitude": row.get("latitude"),
+                "longitude": row.get("longitude"),
+            }
+        )
+    db.execute(insert(models.HarshEvent), params)
+
+
+def rebuild_harsh_events(db: Session) -> int:
+    """Regenerate harsh_events from telemetry_events, using each driver's current scope; returns rows written."""
+    tel = models.TelemetryEvent
+    source = (
+        select(
+            tel.id,
+            tel.driver_id,
+            tel.trip_id,
+            models.Driver.group_tag,
+            models.Driver.organization_id,
+            tel.ts,
+            func.coalesce(tel.brake_hard, False),
+            func.coalesce(tel.accel_hard, False),
+            func.coalesce(tel.cornering_hard, False),
+            tel.speed_kmh,
+            tel.latitude,
+            tel.longitude,
+        )
+        .join(models.Driver, models.Driver.id == tel.driver_id)
+        .where((tel.brake_hard == True) | (tel.accel_hard == True) | (tel.cornering_hard == True))  # noqa: E712
+        .order_by(tel.id)
+    )
+    columns = [
+        "telemetry_event_id",
+        "driver_id",
+        "trip_id",
+        "group_tag",
+        "organization_id",
+        "ts",
+        "brake_hard",
+        "accel_hard",
+        "cornering_hard",
+        "speed_kmh",
+        "latitude",
+        "longitude",
+    ]
+    db.query(models.HarshEvent).delete(synchronize_session=False)
+    result = db.execute(insert(models.HarshEvent).from_select(columns, source))
     db.commit()
-    db.refresh(ev)
-    return ev
+    return result.rowcount
+
+
+def _update_live_positions(db: Session, rows: List[dict]) -> None:
+    """Move each driver's live position to its newest event in ``rows``; older (replayed) points never win."""
+    if not rows:
+        return
+    latest: dict[int, dict] = {}
+    seen: dict[int, datetime] = {}
+    for row in rows:
+        driver_id = row["driver_id"]
+        current = latest.get(driver_id)
+        if current is None or row["ts"] >= current["ts"]:
+            latest[driver_id] = row
+        received = row.get("received_at") or row["ts"]
+        seen[driver_id] = max(seen.get(driver_id, received), received)
+
+    now = datetime.utcnow()
+    live = models.DriverLiveStatus
+    stmt = _dialect_insert(db, live)
+    newer = (live.last_ts.is_(None)) | (stmt.excluded.last_ts >= live.last_ts)
+    set_ = {field: case((newer, getattr(stmt.excluded, field)), else_=getattr(live, field)) for field in ("last_ts", *_LIVE_POSITION_FIELDS)}
+    set_["last_seen_at"] = case(
+        (live.last_seen_at.is_(None) | (stmt.excluded.last_seen_at > live.last_seen_at), stmt.excluded.last_seen_at),
+        else_=live.last_seen_at,
+    )
+    set_["version"] = stmt.excluded.version
+    set_["updated_at"] = stmt.excluded.updated_at
+    version = next_change_version(db)
+    params = [
+        {"driver_id": driver_id, "trip_status": "none", **_live_position(row), "last_seen_at": seen[driver_id], "version": version, "updated_at": now}
+        for driver_id, row in latest.items()
+    ]
+    db.execute(stmt.on_conflict_do_update(index_elements=[live.driver_id], set_=set_), params)
+
+
+def _latest_per_driver(db: Session, model, driver_ids, *order_by) -> dict:
+    """Newest row per driver for ``driver_ids`` (a select of ids) in one windowed query."""
+    rn = func.row_number().over(partition_by=model.driver_id, order_by=order_by).label("rn")
+    ranked = select(model.id.label("id"), rn).where(model.driver_id.in_(driver_ids)).subquery()
+    rows = db.query(model).join(ranked, ranked.c.id == model.id).filter(ranked.c.rn == 1).all()
+    return {row.driver_id: row for row in rows}
+
+
+def rebuild_driver_live_status(db: Session, driver_id: Optional[int] = None) -> int:
+    """Regenerate driver_live_status for every driver from its newest trip and telemetry row; returns rows written."""
+    driver_ids = select(models.Driver.id)
+    if driver_id is not None:
+        driver_ids = driver_ids.where(models.Driver.id == driver_id)
+    driver_ids = driver_ids.scalar_subquery()
+    tel = models.TelemetryEvent
+    last_trips = _latest_per_driver(db, models.Trip, driver_ids, models.Trip.started_at.desc(), models.Trip.id.desc())
+    last_tels = _latest_per_driver(db, tel, driver_ids, tel.ts.desc(), tel.id.desc())
+    last_seen = dict(
+        db.query(tel.driver_id, func.max(func.coalesce(tel.received_at, tel.ts))).filter(tel.driver_id.in_(driver_ids)).group_by(tel.driver_id)
+    )
+
+    now = datetime.utcnow()
+    version = next_change_version(db)
+    params = []
+    for (did,) in db.execute(select(models.Driver.id).where(models.Driver.id.in_(driver_ids)).order_by(models.Driver.id)):
+        trip = last_trips.get(did)
+        tel_row = last_tels.get(did)
+        params.append(
+            {
+                "driver_id": did,
+                "trip_id": trip.id if trip else None,
+                "trip_status": ("active" if trip.finished_at is None else "completed") if trip else "none",
+                "trip_started_at": trip.started_at if trip else None,
+                **(_live_position(tel_row) if tel_row else {"last_ts": None, **{f: None for f in _LIVE_POSITION_FIELDS}}),
+                "last_seen_at": last_seen.get(did),
+                "version": version,
+                "updated_at": now,
+            }
+        )
+
+    q = db.query(models.DriverLiveStatus)
+    if driver_id is not None:
+        q = q.filter(models.DriverLiveStatus.driver_id == driver_id)
+    q.delete(synchronize_session=False)
+    if params:
+        db.execute(insert(models.DriverLiveStatus), params)
+    db.commit()
+    return len(params)
+
+
+def rebuild_driver_score_stats(db: Session, driver_id: Optional[int] = None) -> int:
+    """Regenerate driver_score_stats from raw trips and telemetry; returns the number of rows written."""
+    tel = models.TelemetryEvent
+    stats = models.DriverScoreStats
+    harsh = case((tel.brake_hard | tel.accel_hard | tel.cornering_hard, 1), else_=0)
+    tel_agg = select(
+        tel.driver_id.label("driver_id"),
+        func.count(tel.id).label("event_count"),
+        func.sum(harsh).label("harsh_count"),
+        func.sum(tel.speed_kmh).label("speed_sum"),
+        func.count(tel.speed_kmh).label("speed_count"),
+    ).group_by(tel.driver_id)
+    trip_agg = select(models.Trip.driver_id.label("driver_id"), func.count(models.Trip.id).label("trip_count")).group_by(models.Trip.driver_id)
+    drivers = select(models.Driver.id)
+    if driver_id is not None:
+        tel_agg = tel_agg.where(tel.driver_id == driver_id)
+        trip_agg = trip_agg.where(models.Trip.driver_id == driver_id)
+        drivers = drivers.where(models.Driver.id == driver_id)
+    tel_agg = tel_agg.subquery()
+    trip_agg = trip_agg.subquery()
+    source = (
+        select(
+            models.Driver.id,
+            func.coalesce(tel_agg.c.event_count, 0),
+            func.coalesce(tel_agg.c.harsh_count, 0),
+            func.coalesce(tel_agg.c.speed_sum, 0.0),
+            func.coalesce(tel_agg.c.speed_count, 0),
+            func.coalesce(trip_agg.c.trip_count, 0),
+            literal(datetime.utcnow(), DateTime),
+        )
+        .select_from(models.Driver)
+        .outerjoin(tel_agg, tel_agg.c.driver_id == models.Driver.id)
+        .outerjoin(trip_agg, trip_agg.c.driver_id == models.Driver.id)
+        .where(models.Driver.id.in_(drivers))
+    )
+
+    q = db.query(stats)
+    if driver_id is not None:
+        q = q.filter(stats.driver_id == driver_id)
+    q.delete(synchronize_session=False)
+    result = db.execute(insert(stats).from_select(["driver_id", *_SCORE_STAT_FIELDS, "updated_at"], source))
+    db.commit()
+    return result.rowcount
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def rebuild_driver_score_daily(db: Session, driver_id: Optional[int] = None) -> int:
+    """Regenerate driver_score_daily from raw trips and telemetry; returns the number of buckets written."""
+    tel = models.TelemetryEvent
+    harsh = case((tel.brake_hard | tel.accel_hard | tel.cornering_hard, 1), else_=0)
+    tel_day = func.date(tel.ts)
+    tel_q = select(
+        tel.driver_id,
+        tel_day,
+        func.count(tel.id),
+        func.sum(harsh),
+        func.sum(tel.speed_kmh),
+        func.count(tel.speed_kmh),
+    ).group_by(tel.driver_id, tel_day)
+    trip_day = func.date(models.Trip.started_at)
+    trip_q = select(models.Trip.driver_id, trip_day, func.count(models.Trip.id)).group_by(models.Trip.driver_id, trip_day)
+    if driver_id is not None:
+        tel_q = tel_q.where(tel.driver_id == driver_id)
+        trip_q = trip_q.where(models.Trip.driver_id == driver_id)
+
+    buckets: dict[tuple[int, date], dict] = {}
+    for drv, day, events, harsh_events, speed_sum, speed_count in db.execute(tel_q):
+        buckets[(drv, _as_date(day))] = {
+            "event_count": events or 0,
+            "harsh_count": int(harsh_events or 0),
+            "speed_sum": float(speed_sum or 0.0),
+            "speed_count": speed_count or 0,
+        }
+    for drv, day, trips in db.execute(trip_q):
+        buckets.setdefault((drv, _as_date(day)), {})["trip_count"] = trips
+
+    q = db.query(models.DriverScoreDaily)
+    if driver_id is not None:
+        q = q.filter(models.DriverScoreDaily.driver_id == driver_id)
+    q.delete(synchronize_session=False)
+    if buckets:
+        db.execute(
+            insert(models.DriverScoreDaily),
+            [
+                {"driver_id": drv, "day": day, **{field: bucket.get(field, 0) for field in _SCORE_STAT_FIELDS}}
+                for (drv, day), bucket in buckets.items()
+            ],
+        )
+    db.commit()
+    return len(buckets)
+
+
+def _backfill_once(db: Session, table: str, populated, rebuild) -> None:
+    # An empty derived table is normal (e.g. a fleet without harsh events), so the marker row in
+    # change_counters, not emptiness, records that the one-off backfill already ran.
+    marker = f"backfill:{table}"
+    if db.get(models.ChangeCounter, marker) is not None:
+        return
+    if populated.first() is None:
+        rebuild(db)
+    db.execute(_dialect_insert(db, models.ChangeCounter).values(name=marker, value=1).on_conflict_do_nothing())
+    db.commit()
+
+
+def backfill_derived_tables(db: Session) -> None:
+    """Populate aggregate tables once, right after they were introduced."""
+    _backfill_once(db, "driver_score_stats", db.query(models.DriverScoreStats.driver_id), rebuild_driver_score_stats)
+    _backfill_once(db, "driver_score_daily", db.query(models.DriverScoreDaily.driver_id), rebuild_driver_score_daily)
+    _backfill_once(db, "driver_live_status", db.query(models.DriverLiveStatus.driver_id), rebuild_driver_live_status)
+    _backfill_once(db, "harsh_events", db.query(models.HarshEvent.id), rebuild_harsh_events)
 
 
 def list_telemetry_for_driver(db: Session, driver_id: int, limit: int = 100) -> List[models.TelemetryEvent]:
@@ -188,38 +927,35 @@ def count_driver_telemetry(db: Session, driver_id: int) -> int:
     return db.query(models.TelemetryEvent).filter(models.TelemetryEvent.driver_id == driver_id).count()
 
 
-def compute_driver_score(db: Session, driver_id: int) -> Tuple[int, int, int, float, Optional[float], float]:
-    total_trips = db.query(models.Trip).filter(models.Trip.driver_id == driver_id).count()
-
-    total_events, harsh_events, avg_speed = db.query(
-        func.count(models.TelemetryEvent.id),
-        func.sum(
-            case(
-                (
-                    models.TelemetryEvent.brake_hard
-                    | models.TelemetryEvent.accel_hard
-                    | models.TelemetryEvent.cornering_hard,
-                    1,
-                ),
-                else_=0,
-            )
-        ),
-        func.avg(models.TelemetryEvent.speed_kmh),
-    ).filter(models.TelemetryEvent.driver_id == driver_id).one()
+SCORE_HARSH_RATIO_WEIGHT = 40.0
+SCORE_SPEED_LIMIT_KMH = 55.0
+SCORE_SPEED_PENALTY_PER_KMH = 0.5
+SCORE_SPEED_PENALTY_MAX = 30.0
 
-    total_events = total_events or 0
-    harsh_events = int(harsh_events or 0)
-    avg_speed = float(avg_speed) if avg_speed is not None else None
 
+def score_from_totals(total_events: int, harsh_events: int, avg_speed: Optional[float]) -> Tuple[float, float]:
+    """Return ``(harsh_ratio, score_0_100)`` for aggregated telemetry totals."""
     harsh_ratio = float(harsh_events) / float(total_events) if total_events > 0 else 0.0
 
     score = 100.0
-    score -= harsh_ratio * 40.0
-    if avg_speed is not None and avg_speed > 55:
-        score -= min((avg_speed - 55.0) * 0.5, 30.0)
+    score -= harsh_ratio * SCORE_HARSH_RATIO_WEIGHT
+    if avg_speed is not None and avg_speed > SCORE_SPEED_LIMIT_KMH:
+        score -= min((avg_speed - SCORE_SPEED_LIMIT_KMH) * SCORE_SPEED_PENALTY_PER_KMH, SCORE_SPEED_PENALTY_MAX)
 
     score = max(0.0, min(score, 100.0))
-    return total_trips, total_events, harsh_events, harsh_ratio, avg_speed, score
+    return harsh_ratio, score
+
+
+def compute_driver_score(db: Session, driver_id: int) -> Tuple[int, int, int, float, Optional[float], float]:
+    stats = db.get(models.DriverScoreStats, driver_id)
+    if stats is None:
+        return 0, 0, 0, 0.0, None, 100.0
+
+    total_events = int(stats.event_count or 0)
+    harsh_events = int(stats.harsh_count or 0)
+    avg_speed = float(stats.speed_sum) / stats.speed_count if stats.speed_count else None
+    harsh_ratio, score = score_from_totals(total_events, harsh_events, avg_speed)
+    return int(stats.trip_count or 0), total_events, harsh_events, harsh_ratio, avg_speed, score
 
 
 def create_voice_message(
@@ -233,11 +969,15 @@ def create_voice_message(
     status: str = "received",
     group_tag: Optional[str] = None,
     organization_id: Optional[int] = None,
+    file_size: Optional[int] = None,
+    content_sha256: Optional[str] = None,
 ) -> models.VoiceMessage:
     msg = models.VoiceMessage(
         driver_id=driver_id,
         trip_id=trip_id,
         file_path=file_path,
+        file_size=file_size,
+        content_sha256=content_sha256,
         duration_sec=duration_sec,
         target=target,
         note=note,
@@ -262,47 +1002,49 @@ def list_recent_voice_messages(db: Session, limit: int = 20) -> List[models.Voic
     )
 
 
-def get_operator_dashboard(db: Session, group_tag: Optional[str] = None, organization_id: Optional[int] = None) -> dict:
-    q = db.query(models.Driver)
+def _live_flags(live: models.DriverLiveStatus) -> List[str]:
+    flags = []
+    if live.last_brake_hard:
+        flags.append("brake_hard")
+    if live.last_accel_hard:
+        flags.append("accel_hard")
+    if live.last_cornering_hard:
+        flags.append("cornering_hard")
+    return flags
+
+
+def get_operator_dashboard(
+    db: Session, group_tag: Optional[str] = None, organization_id: Optional[int] = None, since: Optional[int] = None
+) -> dict:
+    """Fleet overview for an operator scope.
+
+    With ``since`` (a previously returned ``cursor``) only drivers whose state changed after it are
+    listed, and ``removed`` holds the ids that left the scope or were deleted since; ``active_drivers``
+    always covers the whole scope. A cursor older than the retained exits gets the full list.
+    """
+    live = models.DriverLiveStatus
+    # Read the cursor first: anything committed after this is re-sent next time rather than missed.
+    cursor = current_change_version(db)
+    if since is not None and since < current_change_version(db, SCOPE_EXITS_FLOOR_COUNTER):
+        since = None
+    q = db.query(models.Driver, live).outerjoin(live, live.driver_id == models.Driver.id)
     if organization_id:
         q = q.filter(models.Driver.organization_id == organization_id)
     elif group_tag:
         q = q.filter(models.Driver.group_tag == group_tag)
-    drivers = q.order_by(models.Driver.id.desc()).all()
+    active_count = None
+    if since is not None:
+        active_count = q.filter(live.trip_status == "active").with_entities(func.count(models.Driver.id)).scalar() or 0
+        q = q.filter(live.version > since)
+    rows = q.order_by(models.Driver.id.desc()).all()
 
     items = []
-    active_count = 0
-    for d in drivers:
-        last_trip = (
-            db.query(models.Trip)
-            .filter(models.Trip.driver_id == d.id)
-            .order_by(models.Trip.started_at.desc())
-            .first()
-        )
-        if not last_trip:
-            last_trip_status = "none"
-        elif last_trip.finished_at is None:
-            last_trip_status = "active"
-            active_count += 1
-        else:
-            last_trip_status = "completed"
+    for d, status in rows:
+        last_trip_status = status.trip_status if status else "none"
 
-        last_tel = (
-            db.query(models.TelemetryEvent)
-            .filter(models.TelemetryEvent.driver_id == d.id)
-            .order_by(models.TelemetryEvent.ts.desc())
-            .first()
-        )
-        last_event = None
-        if last_tel and (last_tel.brake_hard or last_tel.accel_hard or last_tel.cornering_hard):
-            flags = []
-            if last_tel.brake_hard:
-                flags.append("brake_hard")
-            if last_tel.accel_hard:
-                flags.append("accel_hard")
-            if last_tel.cornering_hard:
-                flags.append("cornering_hard")
-            last_event = {"type": "telemetry_flag", "flags": flags, "timestamp": last_tel.ts}
+        has_position = status is not None and status.last_ts is not None
+        flags = _live_flags(status) if has_position else []
+        last_event = {"type": "telemetry_flag", "flags": flags, "timestamp": status.last_ts} if flags else None
 
         items.append(
             {
@@ -318,58 +1060,103 @@ def get_operator_dashboard(db: Session, group_tag: Optional[str] = None, organiz
                 "last_trip_status": last_trip_status,
                 "last_telemetry": (
                     {
-                        "lat": last_tel.latitude,
-                        "lng": last_tel.longitude,
-                        "speed": last_tel.speed_kmh,
-                        "timestamp": last_tel.ts,
+                        "lat": status.last_latitude,
+                        "lng": status.last_longitude,
+                        "speed": status.last_speed_kmh,
+                        "timestamp": status.last_ts,
                     }
-                    if last_tel
+                    if has_position
                     else None
                 ),
                 "last_event": last_event,
             }
         )
 
-    return {"active_drivers": active_count, "drivers": items}
+    if active_count is None:
+        active_count = sum(1 for item in items if item["last_trip_status"] == "active")
+    result = {"active_drivers": active_count, "drivers": items, "cursor": cursor, "delta": since is not None}
+    if since is not None:
+        result["removed"] = _removed_since(db, since, group_tag, organization_id)
+    return result
 
 
-def get_recent_operator_events(db: Session, group_tag: Optional[str] = None, limit: int = 50) -> List[dict]:
-    q = db.query(models.TelemetryEvent, models.Driver).join(models.Driver, models.Driver.id == models.TelemetryEvent.driver_id)
-    if group_tag:
-        q = q.filter(models.Driver.group_tag == group_tag)
-    q = q.filter(
-        (models.TelemetryEvent.brake_hard == True)
-        | (models.TelemetryEvent.accel_hard == True)
-        | (models.TelemetryEvent.cornering_hard == True)
-    )
-    rows = q.order_by(models.TelemetryEvent.ts.desc()).limit(limit).all()
+def _removed_since(db: Session, since: int, group_tag: Optional[str], organization_id: Optional[int]) -> List[int]:
+    exits = models.DriverScopeExit
+    q = db.query(exits.driver_id).filter(exits.version > since)
+    if organization_id:
+        q = q.filter(exits.organization_id == organization_id)
+    elif group_tag:
+        q = q.filter(exits.group_tag == group_tag)
+    else:
+        q = q.filter(exits.deleted.is_(True))
+    candidates = {row.driver_id for row in q.distinct()}
+    if not candidates:
+        return []
+    # A driver that moved out and back in again is still listed.
+    present = db.query(models.Driver.id).filter(models.Driver.id.in_(candidates))
+    if organization_id:
+        present = present.filter(models.Driver.organization_id == organization_id)
+    elif group_tag:
+        present = present.filter(models.Driver.group_tag == group_tag)
+    return sorted(candidates - {row.id for row in present})
 
+
+def get_recent_operator_events(
+    db: Session,
+    group_tag: Optional[str] = None,
+    limit: int = 50,
+    organization_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+) -> List[dict]:
+    """Newest harsh events first; pass the last returned ``id`` as ``before_id`` for the next page."""
+    harsh = models.HarshEvent
+    q = db.query(harsh)
+    if organization_id:
+        q = q.filter(harsh.organization_id == organization_id)
+    elif group_tag:
+        q = q.filter(harsh.group_tag == group_tag)
+    if before_id is not None:
+        anchor = db.query(harsh.ts).filter(harsh.id == before_id).scalar()
+        if anchor is None:
+            return []
+        q = q.filter(tuple_(harsh.ts, harsh.id) < tuple_(anchor, before_id))
+    rows = q.order_by(harsh.ts.desc(), harsh.id.desc()).limit(limit).all()
+
+    drivers = {}
+    if rows:
+        drivers = {
+            d.id: d
+            for d in db.query(models.Driver.id, models.Driver.name, models.Driver.group_tag).filter(models.Driver.id.in_({r.driver_id for r in rows}))
+        }
     events = []
-    for tel, drv in rows:
+    for row in rows:
+        drv = drivers.get(row.driver_id)
         flags = []
-        if tel.brake_hard:
+        if row.brake_hard:
             flags.append("brake_hard")
-        if tel.accel_hard:
+        if row.accel_hard:
             flags.append("accel_hard")
-        if tel.cornering_hard:
+        if row.cornering_hard:
             flags.append("cornering_hard")
         events.append(
             {
-                "driver_id": drv.id,
-                "driver_name": drv.name,
-                "group_tag": drv.group_tag,
-                "trip_id": tel.trip_id,
+                "id": row.id,
+                "driver_id": row.driver_id,
+                "driver_name": drv.name if drv else None,
+                "group_tag": drv.group_tag if drv else row.group_tag,
+                "trip_id": row.trip_id,
                 "flags": flags,
-                "speed_kmh": tel.speed_kmh,
-                "latitude": tel.latitude,
-                "longitude": tel.longitude,
-                "timestamp": tel.ts,
+                "speed_kmh": row.speed_kmh,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "timestamp": row.ts,
             }
         )
     return events
 
 
 def revoke_session_token(db: Session, token: str) -> None:
+    session_cache.cache.invalidate(token)
     create_revoked_token(db, token)
     obj = db.query(models.SessionToken).filter(models.SessionToken.token == token).first()
     if obj:
@@ -380,6 +1167,8 @@ def revoke_session_token(db: Session, token: str) -> None:
 def create_revoked_token(db: Session, token: str) -> None:
     if not token:
         return
+    session_cache.cache.invalidate(token)
+    session_tokens.revocations.add(token)
     existing = db.query(models.RevokedToken).filter(models.RevokedToken.token == token).first()
     if existing:
         return
@@ -390,7 +1179,16 @@ def create_revoked_token(db: Session, token: str) -> None:
 def is_token_revoked(db: Session, token: str) -> bool:
     if not token:
         return False
-    return db.query(models.RevokedToken).filter(models.RevokedToken.token == token).first() is not None
+    return session_tokens.revocations.contains(db, token)
+
+
+def purge_expired_tokens(db: Session, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Delete revocations and idle sessions older than the session lifetime; returns ``(revoked, sessions)``."""
+    horizon = (now or datetime.utcnow()) - session_tokens.session_token_ttl()
+    revoked = db.query(models.RevokedToken).filter(models.RevokedToken.revoked_at < horizon).delete(synchronize_session=False)
+    sessions = db.query(models.SessionToken).filter(models.SessionToken.last_seen_at < horizon).delete(synchronize_session=False)
+    db.commit()
+    return revoked, sessions
 
 
 def list_organizations(db: Session, org_type: Optional[str] = None, status: Optional[str] = "active") -> List[models.Organization]:
@@ -418,8 +1216,14 @@ def delete_driver(db: Session, driver_id: int) -> bool:
     db.query(models.OrganizationMember).filter(models.OrganizationMember.driver_id == driver_id).delete()
     db.query(models.AssignmentClaim).filter(models.AssignmentClaim.driver_id == driver_id).delete()
     db.query(models.RewardEvent).filter(models.RewardEvent.driver_id == driver_id).delete()
+    db.query(models.DriverScoreStats).filter(models.DriverScoreStats.driver_id == driver_id).delete()
+    db.query(models.DriverScoreDaily).filter(models.DriverScoreDaily.driver_id == driver_id).delete()
+    db.query(models.DriverLiveStatus).filter(models.DriverLiveStatus.driver_id == driver_id).delete()
+    db.query(models.HarshEvent).filter(models.HarshEvent.driver_id == driver_id).delete()
     db.delete(driver)
     db.commit()
+    geo_index.index.remove(driver_id)
+    session_cache.cache.invalidate_driver(driver_id)
     return True
 
 
@@ -446,6 +1250,7 @@ def create_trial_attempt(
     )
     db.add(row)
     db.flush()
+    rate_limit.trial_window.record(ip_hash, email_hash, phone_hash, status in TRIAL_COUNTED_STATUSES, row.created_at)
     return row
 
 
@@ -470,31 +1275,50 @@ def count_trial_attempts_since(
     return q.count()
 
 
-def _retry_after_for_window(
-    db: Session,
+TRIAL_COUNTED_STATUSES = ("accepted", "created")
+
+
+def trial_rate_limit_checks(
     *,
-    now: datetime,
-    ip_hash: Optional[str] = None,
-    email_hash: Optional[str] = None,
-    phone_hash: Optional[str] = None,
-    statuses: Optional[tuple[str, ...]] = None,
-    window_sec: int,
-) -> int:
-    since = now - timedelta(seconds=window_sec)
-    q = db.query(models.TrialAttempt).filter(models.TrialAttempt.created_at >= since)
-    if ip_hash is not None:
-        q = q.filter(models.TrialAttempt.ip_hash == ip_hash)
-    if email_hash is not None:
-        q = q.filter(models.TrialAttempt.email_hash == email_hash)
-    if phone_hash is not None:
-        q = q.filter(models.TrialAttempt.phone_hash == phone_hash)
-    if statuses:
-        q = q.filter(models.TrialAttempt.status.in_(statuses))
-    oldest = q.order_by(models.TrialAttempt.created_at.asc()).first()
-    if not oldest:
-        return window_sec
-    elapsed = int((now - oldest.created_at).total_seconds())
-    return max(1, window_sec - elapsed)
+    ip_hash: str,
+    email_hash: str,
+    phone_hash: Optional[str],
+    short_window_sec: int,
+    long_window_sec: int,
+    max_ip_short: int,
+    max_email_short: int,
+    max_ip_email_short: int,
+    max_phone_short: int,
+    max_ip_long: int,
+    max_email_long: int,
+    max_phone_long: int,
+) -> List[dict]:
+    """Trial limiter windows in evaluation order; ``statuses`` None counts every attempt."""
+    counted = TRIAL_COUNTED_STATUSES
+    checks = [
+        {"limit": max_ip_short, "window": short_window_sec, "code": "RL_IP_SHORT", "filters": {"ip_hash": ip_hash}, "statuses": None},
+        {"limit": max_email_short, "window": short_window_sec, "code": "RL_EMAIL_SHORT", "filters": {"email_hash": email_hash}, "statuses": counted},
+        {"limit": max_ip_email_short, "window": short_window_sec, "code": "RL_IP_EMAIL_SHORT", "filters": {"ip_hash": ip_hash, "email_hash": email_hash}, "statuses": None},
+        {"limit": max_ip_long, "window": long_window_sec, "code": "RL_IP_LONG", "filters": {"ip_hash": ip_hash}, "statuses": None},
+        {"limit": max_email_long, "window": long_window_sec, "code": "RL_EMAIL_LONG", "filters": {"email_hash": email_hash}, "statuses": counted},
+    ]
+    if phone_hash:
+        checks.extend([
+            {"limit": max_phone_short, "window": short_window_sec, "code": "RL_PHONE_SHORT", "filters": {"phone_hash": phone_hash}, "statuses": counted},
+            {"limit": max_phone_long, "window": long_window_sec, "code": "RL_PHONE_LONG", "filters": {"phone_hash": phone_hash}, "statuses": counted},
+        ])
+    return checks
+
+
+def first_exceeded_trial_check(checks: List[dict], now: datetime, totals: List[Tuple[int, Optional[datetime]]]) -> tuple[bool, int, str]:
+    """Apply per-check ``(count, oldest)`` totals in order; retry_after is when the oldest attempt leaves its window."""
+    for check, (count, oldest) in zip(checks, totals):
+        if count >= check["limit"]:
+            if oldest is None:
+                return False, check["window"], check["code"]
+            elapsed = int((now - oldest).total_seconds())
+            return False, max(1, check["window"] - elapsed), check["code"]
+    return True, 0, ""
 
 
 def enforce_trial_rate_limit_db(
@@ -514,32 +1338,51 @@ def enforce_trial_rate_limit_db(
     max_email_long: int,
     max_phone_long: int,
 ) -> tuple[bool, int, str]:
-    short_since = now - timedelta(seconds=short_window_sec)
-    long_since = now - timedelta(seconds=long_window_sec)
+    """Evaluate every trial limiter window in one aggregate over ``trial_attempts``.
 
-    email_statuses = ("accepted", "created")
+    Each check becomes a ``SUM(CASE ...)`` count and a ``MIN(CASE ...)`` oldest timestamp over the
+    rows matching any of the hashes inside the widest window.
+    """
+    checks = trial_rate_limit_checks(
+        ip_hash=ip_hash,
+        email_hash=email_hash,
+        phone_hash=phone_hash,
+        short_window_sec=short_window_sec,
+        long_window_sec=long_window_sec,
+        max_ip_short=max_ip_short,
+        max_email_short=max_email_short,
+        max_ip_email_short=max_ip_email_short,
+        max_phone_short=max_phone_short,
+        max_ip_long=max_ip_long,
+        max_email_long=max_email_long,
+        max_phone_long=max_phone_long,
+    )
+    tel = models.TrialAttempt
+    columns = []
+    for check in checks:
+        cond = and_(
+            tel.created_at >= now - timedelta(seconds=check["window"]),
+            *(getattr(tel, field) == value for field, value in check["filters"].items()),
+        )
+        if check["statuses"]:
+            cond = and_(cond, tel.status.in_(check["statuses"]))
+        columns.append(func.coalesce(func.sum(case((cond, 1), else_=0)), 0))
+        columns.append(func.min(case((cond, tel.created_at), else_=None)))
 
-    checks = [
-        {"count": count_trial_attempts_since(db, since=short_since, ip_hash=ip_hash), "limit": max_ip_short, "window": short_window_sec, "code": "RL_IP_SHORT", "filters": {"ip_hash": ip_hash}, "statuses": None},
-        {"count": count_trial_attempts_since(db, since=short_since, email_hash=email_hash, statuses=email_statuses), "limit": max_email_short, "window": short_window_sec, "code": "RL_EMAIL_SHORT", "filters": {"email_hash": email_hash}, "statuses": email_statuses},
-        {"count": count_trial_attempts_since(db, since=short_since, ip_hash=ip_hash, email_hash=email_hash), "limit": max_ip_email_short, "window": short_window_sec, "code": "RL_IP_EMAIL_SHORT", "filters": {"ip_hash": ip_hash, "email_hash": email_hash}, "statuses": None},
-        {"count": count_trial_attempts_since(db, since=long_since, ip_hash=ip_hash), "limit": max_ip_long, "window": long_window_sec, "code": "RL_IP_LONG", "filters": {"ip_hash": ip_hash}, "statuses": None},
-        {"count": count_trial_attempts_since(db, since=long_since, email_hash=email_hash, statuses=email_statuses), "limit": max_email_long, "window": long_window_sec, "code": "RL_EMAIL_LONG", "filters": {"email_hash": email_hash}, "statuses": email_statuses},
-    ]
+    keys = [tel.ip_hash == ip_hash, tel.email_hash == email_hash]
     if phone_hash:
-        checks.extend([
-            {"count": count_trial_attempts_since(db, since=short_since, phone_hash=phone_hash, statuses=email_statuses), "limit": max_phone_short, "window": short_window_sec, "code": "RL_PHONE_SHORT", "filters": {"phone_hash": phone_hash}, "statuses": email_statuses},
-            {"count": count_trial_attempts_since(db, since=long_since, phone_hash=phone_hash, statuses=email_statuses), "limit": max_phone_long, "window": long_window_sec, "code": "RL_PHONE_LONG", "filters": {"phone_hash": phone_hash}, "statuses": email_statuses},
-        ])
+        keys.append(tel.phone_hash == phone_hash)
+    widest = max(check["window"] for check in checks)
+    row = db.execute(select(*columns).where(tel.created_at >= now - timedelta(seconds=widest), or_(*keys))).one()
+    totals = [(int(row[i]), row[i + 1]) for i in range(0, len(row), 2)]
+    return first_exceeded_trial_check(checks, now, totals)
 
-    for check in checks:
-        if check["count"] >= check["limit"]:
-            retry_after = _retry_after_for_window(
-                db,
-                now=now,
-                window_sec=check["window"],
-                statuses=check["statuses"],
-                **check["filters"],
-            )
-            return False, retry_after, check["code"]
-    return True, 0, ""
+
+def enforce_trial_rate_limit_memory(db: Session, *, now: datetime, checks: List[dict]) -> tuple[bool, int, str]:
+    """Same decision as :func:`enforce_trial_rate_limit_db` from the in-process sliding windows.
+
+    Only the first call reads ``trial_attempts``; counts are per worker process.
+    """
+    horizon = timedelta(seconds=max(check["window"] for check in checks))
+    rate_limit.trial_window.ensure_loaded(db, now, horizon, TRIAL_COUNTED_STATUSES)
+    return first_exceeded_trial_check(checks, now, rate_limit.trial_window.totals(checks, now))
@@ -122,6 +122,8 @@ def _run_sqlite_migrations() -> None:
             "verification_code": "ALTER TABLE drivers ADD COLUMN verification_code TEXT",
             "verification_expires_at": "ALTER TABLE drivers ADD COLUMN verification_expires_at DATETIME",
             "verification_channel": "ALTER TABLE drivers ADD COLUMN verification_channel TEXT",
+            "verification_delivery_status": "ALTER TABLE drivers ADD COLUMN verification_delivery_status TEXT",
+            "verification_delivery_at": "ALTER TABLE drivers ADD COLUMN verification_delivery_at DATETIME",
             "failed_attempts": "ALTER TABLE drivers ADD COLUMN failed_attempts INTEGER NOT NULL DEFAULT 0",
             "created_at": "ALTER TABLE drivers ADD COLUMN created_at DATETIME",
             "last_login_at": "ALTER TABLE drivers ADD COLUMN last_login_at DATETIME",
@@ -193,6 +195,12 @@ def _run_sqlite_migrations() -> None:
         _ensure_col(conn, "operator_tokens", "organization_id", "INTEGER")
         _ensure_col(conn, "operator_tokens", "expires_at", "DATETIME")
 
+        _ensure_col(conn, "telemetry_events", "device_ts", "DATETIME")
+        _ensure_col(conn, "telemetry_events", "seq", "INTEGER")
+        _ensure_col(conn, "telemetry_events", "received_at", "DATETIME")
+        _ensure_col(conn, "telemetry_events", "client_event_id", "TEXT")
+        _ensure_col(conn, "driver_live_status", "version", "INTEGER NOT NULL DEFAULT 0")
+
         voice_columns = _table_columns(conn, "voice_messages")
         for col, ddl in {
             "direction": "ALTER TABLE voice_messages ADD COLUMN direction TEXT NOT NULL DEFAULT 'up'",
@@ -201,6 +209,13 @@ def _run_sqlite_migrations() -> None:
             "group_tag": "ALTER TABLE voice_messages ADD COLUMN group_tag TEXT",
             "organization_id": "ALTER TABLE voice_messages ADD COLUMN organization_id INTEGER",
             "approved": "ALTER TABLE voice_messages ADD COLUMN approved INTEGER NOT NULL DEFAULT 0",
+            "file_size": "ALTER TABLE voice_messages ADD COLUMN file_size INTEGER",
+            "content_sha256": "ALTER TABLE voice_messages ADD COLUMN content_sha256 TEXT",
+            "waveform_peaks": "ALTER TABLE voice_messages ADD COLUMN waveform_peaks TEXT",
+            "media_status": "ALTER TABLE voice_messages ADD COLUMN media_status TEXT",
+            "media_processed_at": "ALTER TABLE voice_messages ADD COLUMN media_processed_at DATETIME",
+            "media_claimed_by": "ALTER TABLE voice_messages ADD COLUMN media_claimed_by TEXT",
+            "media_claimed_at": "ALTER TABLE voice_messages ADD COLUMN media_claimed_at DATETIME",
         }.items():
             if col not in voice_columns:
                 conn.execute(text(ddl))
@@ -216,9 +231,12 @@ def _run_sqlite_migrations() -> None:
             "CREATE UNIQUE INDEX IF NOT EXISTS ix_drivers_phone ON drivers(phone)",
             "CREATE UNIQUE INDEX IF NOT EXISTS ix_sessions_token ON sessions(token)",
             "CREATE UNIQUE INDEX IF NOT EXISTS ix_revoked_tokens_token ON revoked_tokens(token)",
+            "CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens(revoked_at)",
+            "CREATE INDEX IF NOT EXISTS idx_sessions_last_seen_at ON sessions(last_seen_at)",
             "CREATE INDEX IF NOT EXISTS ix_certifications_driver_id ON certifications(driver_id)",
             "CREATE INDEX IF NOT EXISTS idx_trips_group_tag ON trips(group_tag)",
             "CREATE INDEX IF NOT EXISTS idx_trips_assignment_id ON trips(assignment_id)",
+            "CREATE INDEX IF NOT EXISTS idx_trips_driver_started ON trips(driver_id, started_at)",
             "CREATE INDEX IF NOT EXISTS idx_tenant_branding_group_tag ON tenant_branding(group_tag)",
             "CREATE INDEX IF NOT EXISTS idx_operator_tokens_group_tag ON operator_tokens(group_tag)",
             "CREATE INDEX IF NOT EXISTS idx_operator_tokens_organization_id ON operator_tokens(organization_id)",
@@ -234,6 +252,8 @@ def _run_sqlite_migrations() -> None:
             "CREATE INDEX IF NOT EXISTS idx_voice_messages_organization_id ON voice_messages(organization_id)",
             "CREATE INDEX IF NOT EXISTS idx_voice_messages_driver_id ON voice_messages(driver_id)",
             "CREATE INDEX IF NOT EXISTS idx_voice_messages_created_at ON voice_messages(created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_voice_messages_content_sha256 ON voice_messages(content_sha256)",
+            "CREATE INDEX IF NOT EXISTS idx_voice_messages_media_processed_at ON voice_messages(media_processed_at)",
             "CREATE INDEX IF NOT EXISTS idx_payment_events_org_created ON payment_events(organization_id, created_at)",
             "CREATE INDEX IF NOT EXISTS idx_drivers_marketplace_opt_in ON drivers(marketplace_opt_in)",
             "CREATE INDEX IF NOT EXISTS idx_drivers_location ON drivers(country_code, region_code, city)",
@@ -241,14 +261,36 @@ def _run_sqlite_migrations() -> None:
             "CREATE INDEX IF NOT EXISTS idx_assignment_claims_assignment_status ON assignment_claims(assignment_id, status)",
             "CREATE INDEX IF NOT EXISTS idx_assignment_claims_driver_status ON assignment_claims(driver_id, status)",
             "CREATE INDEX IF NOT EXISTS idx_reward_events_org_driver ON reward_events(organization_id, driver_id)",
+            "CREATE INDEX IF NOT EXISTS idx_telemetry_events_driver_ts ON telemetry_events(driver_id, ts)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_telemetry_events_driver_client_event ON telemetry_events(driver_id, client_event_id)",
+            "CREATE INDEX IF NOT EXISTS idx_harsh_events_group_ts ON harsh_events(group_tag, ts, id)",
+            "CREATE INDEX IF NOT EXISTS idx_harsh_events_org_ts ON harsh_events(organization_id, ts, id)",
+            "CREATE INDEX IF NOT EXISTS idx_harsh_events_ts ON harsh_events(ts, id)",
+            "CREATE INDEX IF NOT EXISTS idx_driver_live_status_version ON driver_live_status(version)",
+            "CREATE INDEX IF NOT EXISTS idx_driver_score_snapshots_run_rank ON driver_score_snapshots(run_id, rank)",
+            "CREATE INDEX IF NOT EXISTS idx_score_recompute_runs_org_started ON score_recompute_runs(organization_id, started_at)",
         ]
         for stmt in index_statements:
             _safe_execute(conn, stmt)
 
 
+def _backfill_derived_tables() -> None:
+    from . import crud
+
+    db = SessionLocal()
+    try:
+        crud.backfill_derived_tables(db)
+    except Exception:
+        db.rollback()
+        logger.exception("DB migrate: derived table backfill failed")
+    finally:
+        db.close()
+
+
 def init_db() -> None:
     from . import models  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
     if DATABASE_URL.startswith("sqlite"):
         _run_sqlite_migrations()
+    _backfill_derived_tables()
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ScopeKey = Tuple[str, object]
+
+
+def _queue_size() -> int:
+    return max(1, int(os.getenv("OPERATOR_STREAM_QUEUE_SIZE", "1000")))
+
+
+def max_subscribers() -> int:
+    return max(1, int(os.getenv("OPERATOR_STREAM_MAX_CLIENTS", "2000")))
+
+
+def _scope_key(group_tag: Optional[str], organization_id: Optional[int]) -> ScopeKey:
+    if organization_id:
+        return ("org", int(organization_id))
+    if group_tag:
+        return ("group", group_tag)
+    return ("all", None)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+class Subscription:
+    """One open operator stream; events are handed over on the subscriber's own event loop."""
+
+    def __init__(self, hub: "FleetEventHub", key: ScopeKey, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.hub = hub
+        self.key = key
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def _deliver(self, message: str) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A console that cannot keep up gets a single resync marker instead of an unbounded backlog.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(format_event(0, "resync", {"reason": "slow_consumer"}))
+
+    async def get(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+def format_event(event_id: int, event_type: str, data: dict) -> str:
+    payload = json.dumps(data, default=_json_default, separators=(",", ":"))
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event_type}\ndata: {payload}\n\n"
+
+
+class FleetEventHub:
+    """In-process fan-out of fleet events to operator streams, indexed by tenant scope.
+
+    Publishers call :meth:`publish` once per change from any thread; the event is serialized once
+    and handed to each matching subscriber without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict[ScopeKey, Set[Subscription]] = {}
+        self._count = 0
+        self._ids = itertools.count(1)
+
+    def subscriber_count(self) -> int:
+        return self._count
+
+    def has_subscribers(self) -> bool:
+        return self._count > 0
+
+    def subscribe(self, group_tag: Optional[str], organization_id: Optional[int]) -> Optional[Subscription]:
+        sub = Subscription(self, _scope_key(group_tag, organization_id), asyncio.get_running_loop(), _queue_size())
+        with self._lock:
+            if self._count >= max_subscribers():
+                return None
+            self._subs.setdefault(sub.key, set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.key)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self._count -= 1
+                if not subs:
+                    del self._subs[sub.key]
+
+    def publish(self, event_type: str, data: dict, group_tag: Optional[str] = None, organization_id: Optional[int] = None) -> None:
+        if not self._count:
+            return
+        keys: List[ScopeKey] = [("all", None)]
+        if organization_id:
+            keys.append(("org", int(organization_id)))
+        if group_tag:
+            keys.append(("group", group_tag))
+        with self._lock:
+            targets = [sub for key in keys for sub in self._subs.get(key, ())]
+        if not targets:
+            return
+        message = format_event(next(self._ids), event_type, data)
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, message)
+            except RuntimeError:
+                # Loop already closed (worker shutting down); drop the stale subscriber.
+                self.unsubscribe(sub)
+
+
+hub = FleetEventHub()
+
+
+def _flags(row: dict) -> List[str]:
+    return [flag for flag in ("brake_hard", "accel_hard", "cornering_hard") if row.get(flag)]
+
+
+def publish_telemetry(rows: Iterable[dict], scopes: Dict[int, Tuple[Optional[str], Optional[int]]]) -> None:
+    """Publish the newest position per driver and every harsh event among freshly stored telemetry rows."""
+    latest: Dict[int, dict] = {}
+    for row in rows:
+        driver_id = row["driver_id"]
+        group_tag, organization_id = scopes.get(driver_id, (None, None))
+        flags = _flags(row)
+        if flags:
+            hub.publish(
+                "harsh",
+                {
+                    "driver_id": driver_id,
+                    "trip_id": row.get("trip_id"),
+                    "flags": flags,
+                    "lat": row.get("latitude"),
+                    "lng": row.get("longitude"),
+                    "speed": row.get("speed_kmh"),
+                    "timestamp": row["ts"],
+                },
+                group_tag,
+                organization_id,
+            )
+        if driver_id not in latest or row["ts"] >= latest[driver_id]["ts"]:
+            latest[driver_id] = row
+    for driver_id, row in latest.items():
+        group_tag, organization_id = scopes.get(driver_id, (None, None))
+        hub.publish(
+            "position",
+            {
+                "driver_id": driver_id,
+                "trip_id": row.get("trip_id"),
+                "lat": row.get("latitude"),
+                "lng": row.get("longitude"),
+                "speed": row.get("speed_kmh"),
+                "timestamp": row["ts"],
+            },
+            group_tag,
+            organization_id,
+        )
@@ -0,0 +1,300 @@
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+Cell = Tuple[int, int]
+ScopeKey = Tuple[str, object]
+Point = Tuple[float, float, Optional[datetime], Optional[float]]
+
+# Each coarser level groups LEVEL_FACTOR x LEVEL_FACTOR cells of the level below it.
+LEVEL_FACTOR = 10
+LEVELS = 3
+# A viewport is answered from the finest level that covers it with at most this many cells.
+CELL_BUDGET = 1024
+
+
+def grid_cell_deg() -> float:
+    return max(0.001, float(os.getenv("GEO_INDEX_CELL_DEG", "0.01")))
+
+
+def _scope_keys(group_tag: Optional[str], organization_id: Optional[int]) -> List[ScopeKey]:
+    keys: List[ScopeKey] = [("all", None)]
+    if organization_id:
+        keys.append(("org", int(organization_id)))
+    if group_tag:
+        keys.append(("group", group_tag))
+    return keys
+
+
+def query_scope(group_tag: Optional[str], organization_id: Optional[int]) -> ScopeKey:
+    if organization_id:
+        return ("org", int(organization_id))
+    if group_tag:
+        return ("group", group_tag)
+    return ("all", None)
+
+
+def _base_cell(lat: float, lng: float, cell_deg: float) -> Cell:
+    return (math.floor(lat / cell_deg), math.floor(lng / cell_deg))
+
+
+class _Grid:
+    """One pyramid level: cells of ``scale`` x ``scale`` base cells, with member points and a running
+    coordinate sum per occupied cell. Cells are derived from integer base-cell indices so every
+    level nests exactly inside the next coarser one."""
+
+    def __init__(self, scale: int):
+        self.scale = scale
+        self.cells: Dict[Cell, Dict[int, Point]] = {}
+        self.sums: Dict[Cell, List[float]] = {}
+
+    def put(self, base: Cell, driver_id: int, point: Point) -> None:
+        cell = (base[0] // self.scale, base[1] // self.scale)
+        self.cells.setdefault(cell, {})[driver_id] = point
+        acc = self.sums.setdefault(cell, [0.0, 0.0])
+        acc[0] += point[0]
+        acc[1] += point[1]
+
+    def drop(self, base: Cell, driver_id: int, point: Point) -> None:
+        cell = (base[0] // self.scale, base[1] // self.scale)
+        bucket = self.cells.get(cell)
+        if bucket is None or bucket.pop(driver_id, None) is None:
+            return
+        if not bucket:
+            del self.cells[cell]
+            del self.sums[cell]
+        else:
+            acc = self.sums[cell]
+            acc[0] -= point[0]
+            acc[1] -= point[1]
+
+    def cells_in(self, lo_r: int, lo_c: int, hi_r: int, hi_c: int) -> Iterator[Tuple[Cell, Dict[int, Point]]]:
+        """Occupied cells overlapping the inclusive base-cell range."""
+        lo_r, lo_c, hi_r, hi_c = lo_r // self.scale, lo_c // self.scale, hi_r // self.scale, hi_c // self.scale
+        if (hi_r - lo_r + 1) * (hi_c - lo_c + 1) <= len(self.cells):
+            for r in range(lo_r, hi_r + 1):
+                for c in range(lo_c, hi_c + 1):
+                    bucket = self.cells.get((r, c))
+                    if bucket:
+                        yield (r, c), bucket
+        else:
+            # Zoomed out past the occupied area: walking the occupied cells is cheaper than the viewport.
+            for (r, c), bucket in self.cells.items():
+                if lo_r <= r <= hi_r and lo_c <= c <= hi_c:
+                    yield (r, c), bucket
+
+    def span(self, lo_r: int, lo_c: int, hi_r: int, hi_c: int) -> int:
+        return (hi_r // self.scale - lo_r // self.scale + 1) * (hi_c // self.scale - lo_c // self.scale + 1)
+
+    def base_range(self, cell: Cell) -> Tuple[int, int, int, int]:
+        r, c = cell
+        return r * self.scale, c * self.scale, (r + 1) * self.scale - 1, (c + 1) * self.scale - 1
+
+
+class LivePositionIndex:
+    """Latest position per driver in per-scope grid pyramids, fed from telemetry ingest.
+
+    Every tenant scope (all / organization / group tag) owns ``LEVELS`` grids of growing cell size,
+    so a close-up viewport scans a few small cells and a zoomed-out one a few large cells whose
+    counts and centroids are kept up to date on write. A point older than the stored one is
+    ignored, so replayed backlog data cannot move a marker backwards.
+    """
+
+    def __init__(self, cell_deg: Optional[float] = None):
+        self.cell_deg = cell_deg or grid_cell_deg()
+        self._lock = threading.Lock()
+        self._grids: Dict[ScopeKey, List[_Grid]] = {}
+        self._drivers: Dict[int, Tuple[Point, List[ScopeKey]]] = {}
+        self._members: Dict[ScopeKey, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def _pyramid(self, key: ScopeKey) -> List[_Grid]:
+        grids = self._grids.get(key)
+        if grids is None:
+            grids = self._grids[key] = [_Grid(LEVEL_FACTOR**level) for level in range(LEVELS)]
+        return grids
+
+    def _place(self, driver_id: int, point: Point, keys: List[ScopeKey]) -> None:
+        old = self._drivers.get(driver_id)
+        if old is not None:
+            old_point, old_keys = old
+            old_base = _base_cell(old_point[0], old_point[1], self.cell_deg)
+            for key in old_keys:
+                for grid in self._grids[key]:
+                    grid.drop(old_base, driver_id, old_point)
+                self._members[key].discard(driver_id)
+        base = _base_cell(point[0], point[1], self.cell_deg)
+        for key in keys:
+            for grid in self._pyramid(key):
+                grid.put(base, driver_id, point)
+            self._members.setdefault(key, set()).add(driver_id)
+        self._drivers[driver_id] = (point, keys)
+
+    def update(
+        self,
+        driver_id: int,
+        lat: Optional[float],
+        lng: Optional[float],
+        ts: Optional[datetime],
+        speed_kmh: Optional[float] = None,
+        group_tag: Optional[str] = None,
+        organization_id: Optional[int] = None,
+    ) -> bool:
+        if lat is None or lng is None or not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            return False
+        with self._lock:
+            old = self._drivers.get(driver_id)
+            if old is not None and old[0][2] is not None and ts is not None and ts < old[0][2]:
+                return False
+            self._place(driver_id, (float(lat), float(lng), ts, speed_kmh), _scope_keys(group_tag, organization_id))
+        return True
+
+    def scope_tuple(self, driver_id: int) -> Optional[Tuple[Optional[str], Optional[int]]]:
+        """``(group_tag, organization_id)`` the driver was last indexed under, or None if unknown."""
+        entry = self._drivers.get(driver_id)
+        if entry is None:
+            return None
+        scope = dict(entry[1])
+        return scope.get("group"), scope.get("org")
+
+    def members(self, scope: ScopeKey) -> set:
+        """Driver ids currently indexed under ``scope``."""
+        with self._lock:
+            return set(self._members.get(scope, ()))
+
+    def rescope(self, driver_id: int, group_tag: Optional[str], organization_id: Optional[int]) -> None:
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is not None:
+                self._place(driver_id, entry[0], _scope_keys(group_tag, organization_id))
+
+    def remove(self, driver_id: int) -> None:
+        with self._lock:
+            old = self._drivers.pop(driver_id, None)
+            if old is not None:
+                point, keys = old
+                base = _base_cell(point[0], point[1], self.cell_deg)
+                for key in keys:
+                    for grid in self._grids[key]:
+                        grid.drop(base, driver_id, point)
+                    self._members[key].discard(driver_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._grids.clear()
+            self._drivers.clear()
+            self._members.clear()
+
+    def query(
+        self,
+        scope: ScopeKey,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        max_markers: int = 500,
+        cluster_grid: int = 16,
+    ) -> dict:
+        """Drivers inside the box, or up to ``cluster_grid``² clusters when more than ``max_markers`` match."""
+        lo_r, lo_c = _base_cell(min_lat, min_lng, self.cell_deg)
+        hi_r, hi_c = _base_cell(max_lat, max_lng, self.cell_deg)
+        whole: List[Tuple[Dict[int, Point], List[float]]] = []
+        partial: List[Tuple[int, Point]] = []
+
+        def collect(grids: List[_Grid], level: int, rng: Tuple[int, int, int, int]) -> None:
+            grid = grids[level]
+            for cell, bucket in grid.cells_in(*rng):
+                a_r, a_c, b_r, b_c = grid.base_range(cell)
+                if lo_r < a_r and b_r < hi_r and lo_c < a_c and b_c < hi_c:
+                    # Strictly inside the viewport's edge rows/columns, so every member matches.
+                    whole.append((bucket, list(grid.sums[cell])))
+                elif level == 0:
+                    partial.extend(
+                        (driver_id, p) for driver_id, p in bucket.items() if min_lat <= p[0] <= max_lat and min_lng <= p[1] <= max_lng
+                    )
+                else:
+                    # Edge cell: refine just the overlap on the next finer level.
+                    collect(grids, level - 1, (max(lo_r, a_r), max(lo_c, a_c), min(hi_r, b_r), min(hi_c, b_c)))
+
+        with self._lock:
+            grids = self._grids.get(scope)
+            if grids is not None:
+                level = next((i for i, g in enumerate(grids) if g.span(lo_r, lo_c, hi_r, hi_c) <= CELL_BUDGET), len(grids) - 1)
+                collect(grids, level, (lo_r, lo_c, hi_r, hi_c))
+                total = len(partial) + sum(len(bucket) for bucket, _sums in whole)
+                if total <= max_markers:
+                    markers = partial + [item for bucket, _sums in whole for item in bucket.items()]
+            else:
+                total, markers = 0, []
+
+        if total <= max_markers:
+            return {
+                "total": total,
+                "clustered": False,
+                "drivers": [
+                    {"id": driver_id, "lat": p[0], "lng": p[1], "timestamp": p[2], "speed": p[3]}
+                    for driver_id, p in sorted(markers)
+                ],
+                "clusters": [],
+            }
+
+        lat_step = max((max_lat - min_lat) / cluster_grid, 1e-9)
+        lng_step = max((max_lng - min_lng) / cluster_grid, 1e-9)
+        buckets: Dict[Cell, List[float]] = {}
+
+        def add(count: int, lat_sum: float, lng_sum: float) -> None:
+            r = min(int((lat_sum / count - min_lat) / lat_step), cluster_grid - 1)
+            c = min(int((lng_sum / count - min_lng) / lng_step), cluster_grid - 1)
+            acc = buckets.setdefault((r, c), [0, 0.0, 0.0])
+            acc[0] += count
+            acc[1] += lat_sum
+            acc[2] += lng_sum
+
+        # Cells wholly inside the box contribute their maintained centroid; edge cells contribute points.
+        for bucket, (lat_sum, lng_sum) in whole:
+            add(len(bucket), lat_sum, lng_sum)
+        for _driver_id, p in partial:
+            add(1, p[0], p[1])
+
+        clusters = [
+            {
+                "lat": lat_sum / count,
+                "lng": lng_sum / count,
+                "count": count,
+                "bbox": [
+                    min_lat + r * lat_step,
+                    min_lng + c * lng_step,
+                    min_lat + (r + 1) * lat_step,
+                    min_lng + (c + 1) * lng_step,
+                ],
+            }
+            for (r, c), (count, lat_sum, lng_sum) in sorted(buckets.items())
+        ]
+        return {"total": total, "clustered": True, "drivers": [], "clusters": clusters}
+
+
+index = LivePositionIndex()
+
+
+def feed(rows: Iterable[dict], scopes: Dict[int, Tuple[Optional[str], Optional[int]]]) -> None:
+    """Move each driver's marker to its newest point among freshly stored telemetry rows."""
+    latest: Dict[int, dict] = {}
+    for row in rows:
+        current = latest.get(row["driver_id"])
+        if current is None or row["ts"] >= current["ts"]:
+            latest[row["driver_id"]] = row
+    for driver_id, row in latest.items():
+        group_tag, organization_id = scopes.get(driver_id, (None, None))
+        index.update(
+            driver_id,
+            row.get("latitude"),
+            row.get("longitude"),
+            row["ts"],
+            row.get("speed_kmh"),
+            group_tag=group_tag,
+            organization_id=organization_id,
+        )
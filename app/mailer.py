@@ -0,0 +1,364 @@
+import heapq
+import itertools
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import make_msgid, parseaddr
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_, update
+
+from . import models
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_enabled() -> bool:
+    return (os.getenv("DRIVER_SMTP_ENABLED") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def smtp_configured() -> bool:
+    required = [
+        "DRIVER_SMTP_HOST",
+        "DRIVER_SMTP_PORT",
+        "DRIVER_SMTP_USER",
+        "DRIVER_SMTP_PASSWORD",
+        "DRIVER_SMTP_FROM",
+    ]
+    return all((os.getenv(key) or "").strip() for key in required)
+
+
+def _b2s(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8", "replace")
+        except Exception:
+            return repr(value)
+    return str(value)
+
+
+class SmtpSettings(NamedTuple):
+    host: str
+    port: int
+    user: str
+    password: str
+    sender: str
+    use_ssl: bool
+    timeout: int
+
+    @classmethod
+    def from_env(cls) -> "SmtpSettings":
+        user = os.getenv("DRIVER_SMTP_USER", "")
+        return cls(
+            host=os.getenv("DRIVER_SMTP_HOST", "").strip(),
+            port=int(os.getenv("DRIVER_SMTP_PORT", "465")),
+            user=user,
+            password=os.getenv("DRIVER_SMTP_PASSWORD", ""),
+            sender=(os.getenv("DRIVER_SMTP_FROM") or user).strip(),
+            use_ssl=os.getenv("DRIVER_SMTP_USE_SSL", "true").lower() in ("1", "true", "yes"),
+            timeout=int(os.getenv("DRIVER_SMTP_TIMEOUT", "10")),
+        )
+
+
+def build_code_message(settings: SmtpSettings, email: str, code: str, name_or_phone: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = "[Thronos Driver] Κωδικός σύνδεσης / Login code"
+    msg["From"] = settings.sender
+    msg["To"] = email
+    msg.set_content(
+        f"""Γεια σου {name_or_phone},
+
+Ο κωδικός σύνδεσης για την πλατφόρμα Thronos Driver είναι:
+
+    {code}
+
+Ο κωδικός ισχύει μόνο για λίγα λεπτά και μπορεί να χρησιμοποιηθεί μία φορά
+για να συνδεθείς από αυτή τη συσκευή.
+
+Αν δεν ζήτησες εσύ αυτόν τον κωδικό, μπορείς να αγνοήσεις αυτό το μήνυμα.
+
+
+Hi {name_or_phone},
+
+Your login code for the Thronos Driver platform is:
+
+    {code}
+
+This code is valid only for a few minutes and can be used once to sign in
+from this device.
+
+If you did not request this code, you can safely ignore this email.
+
+— Thronos Driver
+"""
+    )
+    if not msg.get("Message-ID"):
+        msg["Message-ID"] = make_msgid()
+    return msg
+
+
+class SmtpConnection:
+    """One authenticated SMTP session, reopened on demand and probed with NOOP after idling."""
+
+    def __init__(self, settings: SmtpSettings, idle_sec: float):
+        self.settings = settings
+        self.idle_sec = idle_sec
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _open(self) -> smtplib.SMTP:
+        s = self.settings
+        if s.use_ssl:
+            server = smtplib.SMTP_SSL(s.host, s.port, timeout=s.timeout)
+        else:
+            server = smtplib.SMTP(s.host, s.port, timeout=s.timeout)
+        try:
+            ehlo_code, ehlo_resp = server.ehlo()
+            logger.info("SMTP response EHLO: %s %s host=%s port=%s ssl=%s", ehlo_code, _b2s(ehlo_resp), s.host, s.port, s.use_ssl)
+            if not s.use_ssl:
+                tls_code, tls_resp = server.starttls()
+                logger.info("SMTP response STARTTLS: %s %s host=%s port=%s", tls_code, _b2s(tls_resp), s.host, s.port)
+                ehlo2_code, ehlo2_resp = server.ehlo()
+                logger.info("SMTP response EHLO2: %s %s host=%s port=%s", ehlo2_code, _b2s(ehlo2_resp), s.host, s.port)
+            login_code, login_resp = server.login(s.user, s.password)
+            logger.info("SMTP response LOGIN: %s %s host=%s port=%s ssl=%s", login_code, _b2s(login_resp), s.host, s.port, s.use_ssl)
+        except BaseException:
+            self._quietly_close(server)
+            raise
+        return server
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_sec:
+            try:
+                code, _resp = self._server.noop()
+                if code != 250:
+                    raise smtplib.SMTPServerDisconnected(f"NOOP returned {code}")
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._server is None:
+            self._server = self._open()
+        return self._server
+
+    def send(self, msg: EmailMessage, to_addr: str) -> bool:
+        """Send over the pooled session; a session dropped by the server is reopened once."""
+        from_addr = parseaddr(msg.get("From", ""))[1] or self.settings.user
+        for attempt in (1, 2):
+            server = self._ensure()
+            try:
+                refused = server.send_message(msg, from_addr=from_addr, to_addrs=[to_addr])
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if attempt == 2:
+                    raise
+                continue
+            except smtplib.SMTPRecipientsRefused:
+                self._last_used = time.monotonic()
+                return False
+            self._last_used = time.monotonic()
+            refused_list = list(refused.keys()) if isinstance(refused, dict) else []
+            return to_addr not in refused_list
+        return False
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            self._quietly_close(server)
+
+    @staticmethod
+    def _quietly_close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+def send_code_via_email(email: str, code: str, name_or_phone: str, connection: Optional[SmtpConnection] = None) -> bool:
+    """Deliver one login code; opens a throwaway session unless a pooled ``connection`` is given."""
+    if not email or not smtp_enabled() or not smtp_configured():
+        return False
+
+    settings = connection.settings if connection else SmtpSettings.from_env()
+    msg = build_code_message(settings, email, code, name_or_phone)
+    message_id = msg.get("Message-ID")
+    to_addr = parseaddr(email)[1] or email
+    conn = connection or SmtpConnection(settings, idle_sec=0)
+    try:
+        if not conn.send(msg, to_addr):
+            logger.error(
+                "smtp_send_refused host=%s port=%s ssl=%s message_id=%s to=%s",
+                settings.host,
+                settings.port,
+                settings.use_ssl,
+                message_id,
+                to_addr,
+            )
+            return False
+        logger.info(
+            "smtp_send_success host=%s port=%s ssl=%s message_id=%s to=%s",
+            settings.host,
+            settings.port,
+            settings.use_ssl,
+            message_id,
+            to_addr,
+        )
+        return True
+    except (smtplib.SMTPException, socket.error, OSError) as e:
+        conn.close()
+        logger.exception(
+            "SMTP send failure to=%s host=%s port=%s ssl=%s message_id=%s -> %s",
+            email,
+            settings.host,
+            settings.port,
+            settings.use_ssl,
+            message_id,
+            str(e),
+        )
+        return False
+    finally:
+        if connection is None:
+            conn.close()
+
+
+class CodeEmail(NamedTuple):
+    driver_id: int
+    email: str
+    code: str
+    name_or_phone: str
+    requested_at: datetime  # drivers.last_code_sent_at of the request; a newer code supersedes this one
+    attempt: int = 1
+
+
+def record_delivery(driver_id: int, requested_at: datetime, status: str) -> None:
+    """Store the delivery outcome on the driver unless a newer code has been requested since.
+
+    A code already marked ``sent`` stays so: a retry may be delivered by another sender before the
+    attempt that scheduled it records ``retrying``.
+    """
+    driver = models.Driver
+    db = SessionLocal()
+    try:
+        stmt = update(driver).where(driver.id == driver_id, driver.last_code_sent_at == requested_at)
+        if status != "sent":
+            stmt = stmt.where(or_(driver.verification_delivery_status.is_(None), driver.verification_delivery_status != "sent"))
+        db.execute(
+            stmt.values(verification_delivery_status=status, verification_delivery_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("otp_delivery_status update failed driver_id=%s status=%s", driver_id, status)
+    finally:
+        db.close()
+
+
+class CodeMailer:
+    """Background OTP email delivery: a bounded queue drained by ``pool_size`` senders, each holding
+    one persistent SMTP session. Failed sends are retried with exponential backoff up to
+    ``max_attempts`` times; the outcome lands in ``drivers.verification_delivery_status``.
+    """
+
+    def __init__(self, pool_size: int, queue_size: int, max_attempts: int, retry_sec: float, idle_sec: float):
+        self.pool_size = max(1, pool_size)
+        self.queue_size = max(1, queue_size)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_sec = max(0.0, retry_sec)
+        self.idle_sec = idle_sec
+        self._cond = threading.Condition()
+        self._jobs: List[Tuple[float, int, CodeEmail]] = []  # heap of (due, seq, job)
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls) -> "CodeMailer":
+        return cls(
+            pool_size=int(os.getenv("DRIVER_SMTP_POOL_SIZE", "2")),
+            queue_size=int(os.getenv("DRIVER_SMTP_QUEUE_SIZE", "1000")),
+            max_attempts=int(os.getenv("DRIVER_SMTP_MAX_ATTEMPTS", "3")),
+            retry_sec=float(os.getenv("DRIVER_SMTP_RETRY_SEC", "5")),
+            idle_sec=float(os.getenv("DRIVER_SMTP_IDLE_SEC", "60")),
+        )
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._jobs)
+
+    def enqueue(self, job: CodeEmail, delay: float = 0.0) -> bool:
+        """Queue a code email; False when the senders are not running or the queue is full."""
+        if not self.running:
+            return False
+        with self._cond:
+            if len(self._jobs) >= self.queue_size:
+                return False
+            heapq.heappush(self._jobs, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+        return True
+
+    def start(self) -> None:
+        if self.running or not (smtp_enabled() and smtp_configured()):
+            return
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"otp-mailer-{i}", daemon=True) for i in range(self.pool_size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        left = self.depth()
+        if left:
+            logger.error("otp_mailer_stop undelivered=%s", left)
+
+    def _next_job(self) -> Optional[CodeEmail]:
+        with self._cond:
+            while not self._stopping:
+                if self._jobs:
+                    wait = self._jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._jobs)[2]
+                else:
+                    wait = None
+                self._cond.wait(wait)
+            return None
+
+    def _run(self) -> None:
+        connection = SmtpConnection(SmtpSettings.from_env(), self.idle_sec)
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                if send_code_via_email(job.email, job.code, job.name_or_phone, connection):
+                    record_delivery(job.driver_id, job.requested_at, "sent")
+                    continue
+                if job.attempt < self.max_attempts:
+                    # Recorded before queueing: the retry can be sent, and marked sent, before enqueue returns.
+                    record_delivery(job.driver_id, job.requested_at, "retrying")
+                    if self.enqueue(job._replace(attempt=job.attempt + 1), delay=self.retry_sec * 2 ** (job.attempt - 1)):
+                        continue
+                logger.error("otp_email_failed driver_id=%s attempts=%s", job.driver_id, job.attempt)
+                record_delivery(job.driver_id, job.requested_at, "failed")
+        finally:
+            connection.close()
+
+
+mailer = CodeMailer.from_env()
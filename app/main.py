@@ -1,25 +1,27 @@
 import logging
 import hashlib
+import json
+import mimetypes
 import os
 import re
 import secrets
-import smtplib
-import socket
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
-from email.message import EmailMessage
-from email.utils import make_msgid, parseaddr
-from typing import List, Optional
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas
+from . import crud, fleet_events, geo_index, mailer, media_worker, models, multipart, rate_limit, schemas, score_recompute, scoring, session_gc, session_tokens, touch_tracker, voice_storage
 from .db import SessionLocal, init_db
 from .models import Driver
+from .telemetry_buffer import TelemetryBuffer, write_behind_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -106,6 +108,25 @@ def _trial_limits() -> dict:
     }
 
 
+def _telemetry_batch_max() -> int:
+    return int(os.getenv("TELEMETRY_BATCH_MAX", "500"))
+
+
+def _telemetry_replay_max() -> int:
+    return int(os.getenv("TELEMETRY_REPLAY_MAX", "5000"))
+
+
+def _device_ts_error(req: schemas.TelemetryCreate, now: datetime) -> Optional[str]:
+    if not req.device_ts:
+        return None
+    ts = crud.to_naive_utc(req.device_ts)
+    if ts > now + timedelta(seconds=int(os.getenv("TELEMETRY_MAX_FUTURE_SKEW_SEC", "300"))):
+        return "device_ts_in_future"
+    if ts < now - timedelta(seconds=int(os.getenv("TELEMETRY_MAX_BACKLOG_AGE_SEC", str(7 * 86400)))):
+        return "device_ts_too_old"
+    return None
+
+
 def enqueue_thronos_receipt(org_id: int, provider_event_id: str, amount: float, currency: str) -> dict:
     return {
         "queued": True,
@@ -148,170 +169,6 @@ def generate_otp_code() -> str:
     return str(secrets.randbelow(900000) + 100000)
 
 
-def _smtp_enabled() -> bool:
-    return (os.getenv("DRIVER_SMTP_ENABLED") or "").strip().lower() in {"1", "true", "yes", "on"}
-
-
-def _smtp_configured() -> bool:
-    required = [
-        "DRIVER_SMTP_HOST",
-        "DRIVER_SMTP_PORT",
-        "DRIVER_SMTP_USER",
-        "DRIVER_SMTP_PASSWORD",
-        "DRIVER_SMTP_FROM",
-    ]
-    return all((os.getenv(key) or "").strip() for key in required)
-
-
-def _b2s(value) -> str:
-    if value is None:
-        return ""
-    if isinstance(value, bytes):
-        try:
-            return value.decode("utf-8", "replace")
-        except Exception:
-            return repr(value)
-    return str(value)
-
-
-def send_code_via_email(email: str, code: str, name_or_phone: str) -> bool:
-    if not email or not _smtp_enabled() or not _smtp_configured():
-        return False
-
-    smtp_host = os.getenv("DRIVER_SMTP_HOST", "").strip()
-    smtp_port = int(os.getenv("DRIVER_SMTP_PORT", "465"))
-    smtp_user = os.getenv("DRIVER_SMTP_USER", "")
-    smtp_password = os.getenv("DRIVER_SMTP_PASSWORD", "")
-    smtp_from = (os.getenv("DRIVER_SMTP_FROM") or smtp_user).strip()
-    use_ssl = os.getenv("DRIVER_SMTP_USE_SSL", "true").lower() in ("1", "true", "yes")
-    timeout = int(os.getenv("DRIVER_SMTP_TIMEOUT", "10"))
-
-    msg = EmailMessage()
-    msg["Subject"] = "[Thronos Driver] Κωδικός σύνδεσης / Login code"
-    msg["From"] = smtp_from
-    msg["To"] = email
-    msg.set_content(
-        f"""Γεια σου {name_or_phone},
-
-Ο κωδικός σύνδεσης για την πλατφόρμα Thronos Driver είναι:
-
-    {code}
-
-Ο κωδικός ισχύει μόνο για λίγα λεπτά και μπορεί να χρησιμοποιηθεί μία φορά
-για να συνδεθείς από αυτή τη συσκευή.
-
-Αν δεν ζήτησες εσύ αυτόν τον κωδικό, μπορείς να αγνοήσεις αυτό το μήνυμα.
-
-
-Hi {name_or_phone},
-
-Your login code for the Thronos Driver platform is:
-
-    {code}
-
-This code is valid only for a few minutes and can be used once to sign in
-from this device.
-
-If you did not request this code, you can safely ignore this email.
-
-— Thronos Driver
-"""
-    )
-
-    if not msg.get("Message-ID"):
-        msg["Message-ID"] = make_msgid()
-
-    message_id = msg.get("Message-ID")
-
-    try:
-        if use_ssl:
-            server_ctx = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=timeout)
-        else:
-            server_ctx = smtplib.SMTP(smtp_host, smtp_port, timeout=timeout)
-
-        with server_ctx as server:
-            ehlo_code, ehlo_resp = server.ehlo()
-            logger.info(
-                "SMTP response EHLO: %s %s host=%s port=%s ssl=%s",
-                ehlo_code,
-                _b2s(ehlo_resp),
-                smtp_host,
-                smtp_port,
-                use_ssl,
-            )
-
-            if not use_ssl:
-                tls_code, tls_resp = server.starttls()
-                logger.info(
-                    "SMTP response STARTTLS: %s %s host=%s port=%s",
-                    tls_code,
-                    _b2s(tls_resp),
-                    smtp_host,
-                    smtp_port,
-                )
-                ehlo2_code, ehlo2_resp = server.ehlo()
-                logger.info(
-                    "SMTP response EHLO2: %s %s host=%s port=%s",
-                    ehlo2_code,
-                    _b2s(ehlo2_resp),
-                    smtp_host,
-                    smtp_port,
-                )
-
-            login_code, login_resp = server.login(smtp_user, smtp_password)
-            logger.info(
-                "SMTP response LOGIN: %s %s host=%s port=%s ssl=%s",
-                login_code,
-                _b2s(login_resp),
-                smtp_host,
-                smtp_port,
-                use_ssl,
-            )
-
-            from_addr = parseaddr(msg.get("From", ""))[1] or smtp_user
-            to_addr = parseaddr(email)[1] or email
-
-            refused = server.send_message(msg, from_addr=from_addr, to_addrs=[to_addr])
-            noop_code, noop_resp = server.noop()
-            refused_list = list(refused.keys()) if isinstance(refused, dict) else []
-
-            logger.info(
-                "smtp_send_success host=%s port=%s ssl=%s message_id=%s to=%s refused=%s server_noop=%s %s",
-                smtp_host,
-                smtp_port,
-                use_ssl,
-                message_id,
-                to_addr,
-                refused_list,
-                noop_code,
-                _b2s(noop_resp),
-            )
-
-            if to_addr in refused_list:
-                logger.error(
-                    "smtp_send_refused host=%s port=%s ssl=%s message_id=%s to=%s",
-                    smtp_host,
-                    smtp_port,
-                    use_ssl,
-                    message_id,
-                    to_addr,
-                )
-                return False
-
-        return True
-    except (smtplib.SMTPException, socket.error, OSError) as e:
-        logger.exception(
-            "SMTP send failure to=%s host=%s port=%s ssl=%s message_id=%s -> %s",
-            email,
-            smtp_host,
-            smtp_port,
-            use_ssl,
-            message_id,
-            str(e),
-        )
-        return False
-
-
 def get_current_driver(
     authorization: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
@@ -320,17 +177,9 @@ def get_current_driver(
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     token = authorization.split(" ", 1)[1].strip()
-    if crud.is_token_revoked(db, token):
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    session = crud.get_session_by_token(db, token)
-    if not session:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
-    driver = crud.get_driver(db, session.driver_id)
+    driver = crud.resolve_session_driver(db, token)
     if not driver:
         raise HTTPException(status_code=401, detail="Unauthorized")
-
-    crud.touch_session(db, session)
     return driver
 
 
@@ -344,18 +193,7 @@ def get_current_driver_optional(
         return None
 
     token = authorization.split(" ", 1)[1].strip()
-    if not token:
-        return None
-    if crud.is_token_revoked(db, token):
-        return None
-    session = crud.get_session_by_token(db, token)
-    if not session:
-        return None
-    driver = crud.get_driver(db, session.driver_id)
-    if not driver:
-        return None
-    crud.touch_session(db, session)
-    return driver
+    return crud.resolve_session_driver(db, token)
 
 
 def _get_admin_token() -> str:
@@ -369,7 +207,7 @@ def require_admin_token(x_admin_token: Optional[str] = Header(default=None)) ->
 
 
 def _voice_storage_base() -> Path:
-    return Path("/app/data/voice")
+    return voice_storage.storage.root
 
 
 
@@ -390,15 +228,12 @@ def _resolve_operator_scope(db: Session, token: Optional[str]) -> tuple[Optional
     if global_token and token == global_token:
         return None, None  # full access
 
-    hashed = _hash_token(token)
-    row = db.query(models.OperatorToken).filter(models.OperatorToken.token_hash == hashed).first()
-    if not row:
+    scope = crud.resolve_operator_token(db, _hash_token(token))
+    if not scope:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    if row.expires_at and row.expires_at < datetime.utcnow():
+    if scope.expires_at and scope.expires_at < datetime.utcnow():
         raise HTTPException(status_code=401, detail="Token expired")
-    row.last_used_at = datetime.utcnow()
-    db.commit()
-    return row.group_tag, row.organization_id
+    return scope.group_tag, scope.organization_id
 
 
 def _branding_defaults(group_tag: Optional[str]) -> dict:
@@ -458,63 +293,29 @@ def is_feature_enabled(org: Optional[models.Organization], feature: str) -> bool
         base.add("exports_pdf")
     return feature in base
 
-def _parse_multipart_voice_payload(raw_body: bytes, content_type: str) -> tuple[bytes, str, Optional[int], Optional[str], Optional[str], Optional[int], Optional[str]]:
-    boundary_marker = "boundary="
-    if boundary_marker not in content_type:
-        raise HTTPException(status_code=400, detail="Invalid multipart payload")
-
-    boundary = content_type.split(boundary_marker, 1)[1].strip()
-    if boundary.startswith('"') and boundary.endswith('"'):
-        boundary = boundary[1:-1]
-
-    delimiter = ("--" + boundary).encode()
-    file_bytes = b""
-    filename = "voice.webm"
-    trip_id: Optional[int] = None
-    note: Optional[str] = None
-    target: Optional[str] = "cb"
-    driver_id: Optional[int] = None
-    group_tag: Optional[str] = None
-
-    for part in raw_body.split(delimiter):
-        part = part.strip()
-        if not part or part in {b"--", b"--\r\n"}:
-            continue
-        if b"\r\n\r\n" not in part:
-            continue
-        headers_raw, data = part.split(b"\r\n\r\n", 1)
-        headers_text = headers_raw.decode("utf-8", errors="ignore")
-        value = data.rstrip(b"\r\n")
-
-        if 'name="file"' in headers_text:
-            file_bytes = value
-            if 'filename="' in headers_text:
-                filename = headers_text.split('filename="', 1)[1].split('"', 1)[0] or filename
-        elif 'name="trip_id"' in headers_text:
-            txt = value.decode("utf-8", errors="ignore").strip()
-            if txt:
-                trip_id = int(txt)
-        elif 'name="note"' in headers_text:
-            note = value.decode("utf-8", errors="ignore").strip() or None
-        elif 'name="target"' in headers_text:
-            target = value.decode("utf-8", errors="ignore").strip() or "cb"
-        elif 'name="driver_id"' in headers_text:
-            txt = value.decode("utf-8", errors="ignore").strip()
-            if txt:
-                driver_id = int(txt)
-        elif 'name="group_tag"' in headers_text:
-            group_tag = value.decode("utf-8", errors="ignore").strip() or None
+async def _read_voice_upload(request: Request) -> multipart.VoiceUpload:
+    """Stream a voice multipart request; the clip is spooled on the voice I/O pool, never held in memory."""
+    return await multipart.read_voice_upload(request.stream(), request.headers.get("content-type", ""), voice_storage.storage)
 
-    if not file_bytes:
-        raise HTTPException(status_code=400, detail="Missing file part")
 
-    return file_bytes, filename, trip_id, note, target, driver_id, group_tag
+async def _place_voice_upload(upload: multipart.VoiceUpload, directory: Path) -> Path:
+    """Publish an upload into the blob store, or under ``directory`` with the ``dated`` layout."""
+    suffix = Path(upload.filename).suffix or ".webm"
+    try:
+        if voice_storage.voice_storage_layout() == "dated":
+            return await voice_storage.storage.publish(upload.temp_path, directory, suffix)
+        return await voice_storage.storage.publish_blob(upload.temp_path, upload.sha256, suffix)
+    except BaseException:
+        await voice_storage.storage.discard(upload.temp_path)
+        raise
 
 
 
 
 init_db()
 
+telemetry_buffer: Optional[TelemetryBuffer] = TelemetryBuffer.from_env() if write_behind_enabled() else None
+
 app = FastAPI(title="Thronos Driver Service", version="0.1.0")
 app.add_middleware(
     CORSMiddleware,
@@ -525,6 +326,35 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def _start_background_workers():
+    db = SessionLocal()
+    try:
+        indexed = crud.load_live_position_index(db)
+        logger.info("live_position_index loaded drivers=%s", indexed)
+    except Exception:
+        logger.exception("live_position_index load failed")
+    finally:
+        db.close()
+    if telemetry_buffer is not None:
+        telemetry_buffer.start()
+    touch_tracker.tracker.start()
+    session_gc.collector.start()
+    mailer.mailer.start()
+    media_worker.pool.start()
+
+
+@app.on_event("shutdown")
+def _stop_background_workers():
+    if telemetry_buffer is not None:
+        telemetry_buffer.stop()
+    touch_tracker.tracker.stop()
+    session_gc.collector.stop()
+    mailer.mailer.stop()
+    media_worker.pool.stop()
+    voice_storage.storage.shutdown()
+
+
 auth_router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 
@@ -583,14 +413,27 @@ def request_code(req: schemas.AuthRequestCode, db: Session = Depends(get_db)):
     channel = "sms"
     recipient_name = (req.name or driver.name or phone).strip()
 
-    if req.email and _smtp_enabled() and _smtp_configured():
-        if send_code_via_email(req.email, code, recipient_name):
-            delivery = "email"
-            channel = "email"
+    driver.verification_delivery_status = None
+    driver.verification_delivery_at = None
+    email_code = bool(req.email and mailer.smtp_enabled() and mailer.smtp_configured())
+    if email_code:
+        # Committed before anything is sent, so a mailer thread's record_delivery finds this code.
+        delivery = "email"
+        channel = "email"
+        driver.verification_delivery_status = "queued"
+    elif req.email:
+        logger.warning("SMTP disabled or incomplete; falling back to log-only OTP mode for %s", req.email)
+
+    driver.verification_channel = channel
+    db.commit()
+
+    if email_code and not mailer.mailer.enqueue(mailer.CodeEmail(driver.id, req.email, code, recipient_name, now)):
+        if mailer.send_code_via_email(req.email, code, recipient_name):
+            mailer.record_delivery(driver.id, now, "sent")
         else:
             logger.warning("OTP delivery fell back to log-only mode for %s", req.email)
-    elif req.email and (not _smtp_enabled() or not _smtp_configured()):
-        logger.warning("SMTP disabled or incomplete; falling back to log-only OTP mode for %s", req.email)
+            mailer.record_delivery(driver.id, now, "failed")
+            delivery = "log"
 
     if delivery == "log":
         if is_production_env():
@@ -598,9 +441,6 @@ def request_code(req: schemas.AuthRequestCode, db: Session = Depends(get_db)):
         else:
             logger.info("[DEV] login code for %s is %s", phone, code)
 
-    driver.verification_channel = channel
-    db.commit()
-
     return {"ok": True, "delivery": delivery, "masked": mask_value(req.email, phone)}
 
 
@@ -630,8 +470,11 @@ def verify_code(req: schemas.AuthVerifyCode, db: Session = Depends(get_db)):
     driver.last_login_at = now
     db.commit()
 
-    token = secrets.token_hex(32)
-    crud.create_session_token(db, driver_id=driver.id, token=token)
+    if session_tokens.signed_tokens_enabled():
+        token = session_tokens.issue(driver.id)
+    else:
+        token = secrets.token_hex(32)
+        crud.create_session_token(db, driver_id=driver.id, token=token)
     return {
         "ok": True,
         "driver": {"id": driver.id, "name": driver.name, "role": driver.role, "phone": driver.phone, "group_tag": driver.group_tag, "organization_id": driver.organization_id, "approved": bool(driver.approved)},
@@ -745,35 +588,48 @@ async def api_create_voice_message(
     if "multipart/form-data" not in content_type:
         raise HTTPException(status_code=400, detail="Expected multipart/form-data")
 
-    raw_body = await request.body()
-    file_bytes, incoming_filename, trip_id, note, target, _driver_id, _group_tag = _parse_multipart_voice_payload(raw_body, content_type)
-    target = target or "center"
-
-    now = datetime.utcnow()
-    ts = now.strftime("%Y%m%d%H%M%S%f")
-    suffix = Path(incoming_filename).suffix or ".webm"
-    driver_dir = _voice_storage_base() / str(current_driver.id)
-    driver_dir.mkdir(parents=True, exist_ok=True)
-    absolute_path = driver_dir / f"{ts}{suffix}"
-    absolute_path.write_bytes(file_bytes)
+    upload = await _read_voice_upload(request)
+    absolute_path = await _place_voice_upload(upload, _voice_storage_base() / str(current_driver.id))
 
     msg = crud.create_voice_message(
         db,
         driver_id=current_driver.id,
-        trip_id=trip_id,
+        trip_id=upload.trip_id,
         file_path=str(absolute_path),
+        file_size=upload.size,
+        content_sha256=upload.sha256,
         duration_sec=None,
-        target=target,
-        note=note,
+        target=upload.target or "center",
+        note=upload.note,
         status="received",
     )
     msg.direction = "up"
     msg.group_tag = current_driver.group_tag
     db.commit()
     db.refresh(msg)
+    media_worker.schedule(db, msg)
+    _publish_voice(msg, current_driver)
     return msg
 
 
+def _publish_voice(msg: models.VoiceMessage, driver: Driver) -> None:
+    # Call after commit: stream subscribers reload the inbox and must find the row.
+    fleet_events.hub.publish(
+        "voice",
+        {
+            "id": msg.id,
+            "driver_id": msg.driver_id,
+            "trip_id": msg.trip_id,
+            "target": msg.target,
+            "direction": msg.direction,
+            "note": msg.note,
+            "created_at": msg.created_at,
+        },
+        driver.group_tag,
+        driver.organization_id,
+    )
+
+
 
 @app.post("/api/v1/voice-messages/send", response_model=schemas.VoiceMessageRead)
 async def api_create_voice_message_send_alias(
@@ -784,6 +640,10 @@ async def api_create_voice_message_send_alias(
     return await api_create_voice_message(request=request, current_driver=current_driver, db=db)
 
 
+def _voice_peaks(row: models.VoiceMessage) -> Optional[List[int]]:
+    return json.loads(row.waveform_peaks) if row.waveform_peaks else None
+
+
 @app.get("/api/v1/voice-messages/recent")
 def api_recent_voice_messages(
     limit: int = Query(default=20, ge=1, le=200),
@@ -806,6 +666,7 @@ def api_recent_voice_messages(
                 "trip_id": row.trip_id,
                 "file_path": row.file_path,
                 "duration_sec": row.duration_sec,
+                "waveform_peaks": _voice_peaks(row),
                 "target": row.target,
                 "status": row.status,
                 "created_at": row.created_at,
@@ -847,9 +708,7 @@ def api_create_trial(req: schemas.TrialCreateRequest, request: Request, db: Sess
     phone_hash = _sha(phone_norm) if phone_norm else None
 
     limits = _trial_limits()
-    allowed, retry_after, error_code = crud.enforce_trial_rate_limit_db(
-        db,
-        now=now,
+    limit_args = dict(
         ip_hash=ip_hash,
         email_hash=email_hash,
         phone_hash=phone_hash,
@@ -863,7 +722,18 @@ def api_create_trial(req: schemas.TrialCreateRequest, request: Request, db: Sess
         max_email_long=limits["email_long"],
         max_phone_long=limits["phone_long"],
     )
+    in_memory = rate_limit.trial_limiter_mode() == "memory"
+    if in_memory:
+        checks = crud.trial_rate_limit_checks(**limit_args)
+        allowed, retry_after, error_code = crud.enforce_trial_rate_limit_memory(db, now=now, checks=checks)
+    else:
+        allowed, retry_after, error_code = crud.enforce_trial_rate_limit_db(db, now=now, **limit_args)
 
+    if not allowed and in_memory:
+        # Rejections stay off the database in memory mode; they still count against the IP windows.
+        rate_limit.trial_window.record(ip_hash, email_hash, phone_hash, False, now)
+        logger.info("trial_rate_limited code=%s ip_hash=%s retry_after=%s", error_code, ip_hash[:10], retry_after)
+        return JSONResponse(status_code=429, content={"error": "TRIAL_RATE_LIMIT", "retry_after": retry_after})
     if not allowed:
         crud.create_trial_attempt(
             db,
@@ -1058,14 +928,80 @@ def api_organization_member_approve(
 @app.get("/api/operator/dashboard")
 def api_operator_dashboard(
     group_tag: Optional[str] = None,
+    since: Optional[int] = Query(default=None, ge=0),
     x_admin_token: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
 ):
     forced_group, forced_org = _resolve_operator_scope(db, x_admin_token)
     if forced_org:
-        return crud.get_operator_dashboard(db, organization_id=forced_org)
+        return crud.get_operator_dashboard(db, organization_id=forced_org, since=since)
     effective_group = forced_group or group_tag
-    return crud.get_operator_dashboard(db, group_tag=effective_group)
+    return crud.get_operator_dashboard(db, group_tag=effective_group, since=since)
+
+
+def _operator_stream_keepalive_sec() -> float:
+    return max(1.0, float(os.getenv("OPERATOR_STREAM_KEEPALIVE_SEC", "15")))
+
+
+def _resolve_operator_scope_standalone(token: Optional[str]) -> tuple[Optional[str], Optional[int]]:
+    # The stream outlives the request, so it must not hold a request-scoped session open.
+    db = SessionLocal()
+    try:
+        return _resolve_operator_scope(db, token)
+    finally:
+        db.close()
+
+
+@app.get("/api/operator/stream")
+async def api_operator_stream(
+    request: Request,
+    group_tag: Optional[str] = None,
+    token: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Server-Sent Events feed of position, trip, harsh and voice events for the operator's scope.
+
+    EventSource cannot send headers, so the operator token may also be passed as ``?token=``. The
+    token is checked again every keep-alive interval; the stream ends once it is revoked, expired
+    or re-scoped.
+    """
+    credential = x_admin_token or token
+    forced_group, forced_org = await run_in_threadpool(_resolve_operator_scope_standalone, credential)
+    scope_group = None if forced_org else (forced_group or group_tag)
+    sub = fleet_events.hub.subscribe(scope_group, forced_org)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Too many open operator streams", headers={"Retry-After": "5"})
+    keepalive = _operator_stream_keepalive_sec()
+
+    async def still_authorized() -> bool:
+        try:
+            scope = await run_in_threadpool(_resolve_operator_scope_standalone, credential)
+        except HTTPException:
+            return False
+        return scope == (forced_group, forced_org)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            yield fleet_events.format_event(0, "ready", {"group_tag": scope_group, "organization_id": forced_org})
+            checked_at = time.monotonic()
+            while True:
+                message = await sub.get(keepalive)
+                if await request.is_disconnected():
+                    return
+                if time.monotonic() - checked_at >= keepalive:
+                    if not await still_authorized():
+                        return
+                    checked_at = time.monotonic()
+                yield message if message is not None else ": keepalive\n\n"
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/operator/pending-drivers")
@@ -1096,6 +1032,26 @@ def api_operator_pending_drivers(
     ]}
 
 
+@app.get("/api/operator/drivers/in-bbox")
+def api_operator_drivers_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    group_tag: Optional[str] = None,
+    max_markers: int = Query(default=500, ge=1, le=5000),
+    x_admin_token: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    """Latest driver positions inside a map viewport, clustered into counts when too dense."""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    forced_group, forced_org = _resolve_operator_scope(db, x_admin_token)
+    scope = geo_index.query_scope(None if forced_org else (forced_group or group_tag), forced_org)
+    crud.sync_geo_scope(db, scope)
+    return geo_index.index.query(scope, min_lat, min_lng, max_lat, max_lng, max_markers=max_markers)
+
+
 @app.post("/api/operator/drivers/{driver_id}/approve")
 def api_operator_approve_driver(
     driver_id: int,
@@ -1383,16 +1339,16 @@ async def api_stripe_webhook(request: Request, stripe_signature: Optional[str] =
 def api_operator_recent_events(
     group_tag: Optional[str] = None,
     limit: int = Query(default=50, ge=1, le=500),
+    before_id: Optional[int] = Query(default=None, ge=1),
     x_admin_token: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
 ):
     forced_group, forced_org = _resolve_operator_scope(db, x_admin_token)
     if forced_org:
-        org = crud.get_organization(db, forced_org)
-        effective_group = (org.default_group_tag if org else None) or forced_group
+        events = crud.get_recent_operator_events(db, organization_id=forced_org, limit=limit, before_id=before_id)
     else:
-        effective_group = forced_group or group_tag
-    return {"events": crud.get_recent_operator_events(db, group_tag=effective_group, limit=limit)}
+        events = crud.get_recent_operator_events(db, group_tag=forced_group or group_tag, limit=limit, before_id=before_id)
+    return {"events": events, "next_before_id": events[-1]["id"] if len(events) == limit else None}
 
 
 
@@ -1481,6 +1437,7 @@ def branding_file(group_tag: str, filename: str):
 def api_operator_voice_inbox(
     group_tag: Optional[str] = None,
     limit: int = Query(default=50, ge=1, le=500),
+    sort: str = Query(default="newest", pattern="^(newest|longest|shortest)$"),
     x_admin_token: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
 ):
@@ -1491,9 +1448,14 @@ def api_operator_voice_inbox(
         q = q.join(models.Driver, models.Driver.id == models.VoiceMessage.driver_id).filter(models.Driver.organization_id == forced_org)
     if effective_group:
         q = q.filter(models.VoiceMessage.group_tag == effective_group)
-    rows = q.order_by(models.VoiceMessage.created_at.desc()).limit(limit).all()
+    order = {
+        "newest": [models.VoiceMessage.created_at.desc()],
+        "longest": [models.VoiceMessage.duration_sec.desc().nullslast(), models.VoiceMessage.created_at.desc()],
+        "shortest": [models.VoiceMessage.duration_sec.asc().nullslast(), models.VoiceMessage.created_at.desc()],
+    }[sort]
+    rows = q.order_by(*order).limit(limit).all()
     return {"items": [
-        {"id": r.id, "driver_id": r.driver_id, "trip_id": r.trip_id, "group_tag": r.group_tag, "note": r.note, "created_at": r.created_at, "audio_url": f"/api/v1/voice-messages/{r.id}/download"}
+        {"id": r.id, "driver_id": r.driver_id, "trip_id": r.trip_id, "group_tag": r.group_tag, "note": r.note, "created_at": r.created_at, "duration_sec": r.duration_sec, "waveform_peaks": _voice_peaks(r), "audio_url": f"/api/v1/voice-messages/{r.id}/download"}
         for r in rows
     ]}
 
@@ -1529,9 +1491,16 @@ async def api_operator_voice_send(
     if "multipart/form-data" not in (request.headers.get("content-type") or ""):
         raise HTTPException(status_code=400, detail="Expected multipart/form-data")
 
-    raw = await request.body()
-    file_bytes, incoming_filename, trip_id, note, _target, payload_driver_id, payload_group_tag = _parse_multipart_voice_payload(raw, request.headers.get("content-type", ""))
+    upload = await _read_voice_upload(request)
+    try:
+        return await _store_operator_voice(db, upload, forced_group, forced_org)
+    except BaseException:
+        await voice_storage.storage.discard(upload.temp_path)
+        raise
+
 
+async def _store_operator_voice(db: Session, upload: multipart.VoiceUpload, forced_group: Optional[str], forced_org: Optional[int]) -> dict:
+    payload_driver_id, payload_group_tag = upload.driver_id, upload.group_tag
     target_group = forced_group or payload_group_tag
     target_driver = None
     if payload_driver_id:
@@ -1555,19 +1524,16 @@ async def api_operator_voice_send(
     else:
         raise HTTPException(status_code=400, detail="driver_id or group_tag required")
 
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    suffix = Path(incoming_filename).suffix or ".webm"
-    ddir = _voice_storage_base() / str(target_driver.id) / "down"
-    ddir.mkdir(parents=True, exist_ok=True)
-    path = ddir / f"{ts}{suffix}"
-    path.write_bytes(file_bytes)
+    path = await _place_voice_upload(upload, _voice_storage_base() / str(target_driver.id) / "down")
 
     row = crud.create_voice_message(
         db,
         driver_id=target_driver.id,
-        trip_id=trip_id,
+        trip_id=upload.trip_id,
         file_path=str(path),
-        note=note,
+        file_size=upload.size,
+        content_sha256=upload.sha256,
+        note=upload.note,
         target="cb",
         status="received",
     )
@@ -1576,6 +1542,8 @@ async def api_operator_voice_send(
     row.group_tag = target_driver.group_tag or target_group
     db.commit()
     db.refresh(row)
+    media_worker.schedule(db, row)
+    _publish_voice(row, target_driver)
     return {"ok": True, "id": row.id, "driver_id": row.driver_id, "group_tag": row.group_tag}
 
 
@@ -1604,22 +1572,19 @@ async def api_operator_voice_reply(
 
     if "multipart/form-data" not in (request.headers.get("content-type") or ""):
         raise HTTPException(status_code=400, detail="Expected multipart/form-data")
-    raw = await request.body()
-    file_bytes, incoming_filename, _trip_id, note, _target, _driver_id, _group_tag = _parse_multipart_voice_payload(raw, request.headers.get("content-type",""))
-
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    suffix = Path(incoming_filename).suffix or ".webm"
-    ddir = _voice_storage_base() / str(parent.driver_id) / "down"
-    ddir.mkdir(parents=True, exist_ok=True)
-    path = ddir / f"{ts}{suffix}"
-    path.write_bytes(file_bytes)
+    upload = await _read_voice_upload(request)
+    path = await _place_voice_upload(upload, _voice_storage_base() / str(parent.driver_id) / "down")
 
-    row = crud.create_voice_message(db, driver_id=parent.driver_id, trip_id=parent.trip_id, file_path=str(path), note=note, target="cb", status="received")
+    row = crud.create_voice_message(db, driver_id=parent.driver_id, trip_id=parent.trip_id, file_path=str(path), file_size=upload.size, content_sha256=upload.sha256, note=upload.note, target="cb", status="received")
     row.direction = "down"
     row.target = "driver"
     row.in_reply_to = parent.id
     row.group_tag = parent.group_tag
     db.commit(); db.refresh(row)
+    media_worker.schedule(db, row)
+    driver = crud.get_driver(db, parent.driver_id)
+    if driver:
+        _publish_voice(row, driver)
     return {"ok": True, "id": row.id}
 
 
@@ -1640,7 +1605,7 @@ def api_driver_voice_inbox(
         except Exception:
             pass
     rows = q.order_by(models.VoiceMessage.created_at.desc()).limit(100).all()
-    return {"items": [{"id":r.id,"note":r.note,"created_at":r.created_at,"read_at":r.read_at,"from_center":True,"audio_url":f"/api/v1/voice-messages/{r.id}/download"} for r in rows]}
+    return {"items": [{"id":r.id,"note":r.note,"created_at":r.created_at,"read_at":r.read_at,"from_center":True,"duration_sec":r.duration_sec,"waveform_peaks":_voice_peaks(r),"audio_url":f"/api/v1/voice-messages/{r.id}/download"} for r in rows]}
 
 
 @app.post("/api/v1/voice-messages/{msg_id}/ack")
@@ -1653,9 +1618,49 @@ def api_driver_voice_ack(msg_id: int, current_driver: Driver = Depends(get_curre
     return {"ok": True}
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored.
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _voice_file_response(request: Request, row: models.VoiceMessage) -> Response:
+    """Serve a stored clip. Clips never change once written, so the ETag is derived from the message id
+    and size and browsers may keep them for a year; Range/If-Range requests are answered by
+    ``FileResponse``, or by the fronting proxy in ``accel``/``sendfile`` mode."""
+    mode = voice_storage.voice_download_mode()
+    path = Path(row.file_path)
+    accel_uri = voice_storage.storage.internal_uri(path) if mode == "accel" else None
+    stat_result = None
+    size = row.file_size
+    if size is None or (mode != "sendfile" and accel_uri is None):
+        try:
+            stat_result = path.stat()
+        except OSError:
+            raise HTTPException(status_code=404, detail="Voice file not found")
+        size = stat_result.st_size
+
+    etag = f'"voice-{row.id}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if accel_uri is not None:
+        return Response(headers={**headers, "X-Accel-Redirect": accel_uri}, media_type=media_type)
+    if mode == "sendfile":
+        return Response(headers={**headers, "X-Sendfile": str(path)}, media_type=media_type)
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
+
+
 @app.get("/api/v1/voice-messages/{msg_id}/download")
 def api_voice_download(
     msg_id: int,
+    request: Request,
     authorization: Optional[str] = Header(default=None),
     x_admin_token: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
@@ -1667,16 +1672,15 @@ def api_voice_download(
     # driver auth path
     if authorization and authorization.startswith("Bearer "):
         token = authorization.split(" ",1)[1].strip()
-        if not crud.is_token_revoked(db, token):
-            sess = crud.get_session_by_token(db, token)
-            if sess and sess.driver_id == row.driver_id:
-                return FileResponse(row.file_path)
+        driver = crud.resolve_session_driver(db, token)
+        if driver and driver.id == row.driver_id:
+            return _voice_file_response(request, row)
 
     forced_group, forced_org = _resolve_operator_scope(db, x_admin_token)
     if forced_group is not None and row.group_tag != forced_group:
         raise HTTPException(status_code=403, detail="Forbidden")
     if x_admin_token:
-        return FileResponse(row.file_path)
+        return _voice_file_response(request, row)
 
     raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -1991,9 +1995,103 @@ def api_create_telemetry(
     resolved_driver_id = current_driver.id if current_driver else req.driver_id
     if not resolved_driver_id or not crud.get_driver(db, int(resolved_driver_id)):
         raise HTTPException(status_code=401, detail="Unauthorized")
+    ts_error = _device_ts_error(req, datetime.utcnow())
+    if ts_error:
+        raise HTTPException(status_code=400, detail=ts_error)
+    if telemetry_buffer is not None:
+        if not telemetry_buffer.offer(crud.build_telemetry_row(req, driver_id=int(resolved_driver_id))):
+            raise HTTPException(status_code=503, detail="Telemetry buffer full", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={"queued": True})
     return crud.create_telemetry(db, req, driver_id=int(resolved_driver_id))
 
 
+def _prepare_telemetry_items(
+    db: Session,
+    items: List[Any],
+    current_driver: Optional[Driver],
+    max_items: int,
+    now: datetime,
+) -> tuple[List[dict], List[tuple[int, dict]]]:
+    if current_driver:
+        _require_driver_approved(current_driver)
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty telemetry batch")
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"Telemetry batch too large (max {max_items})")
+
+    results: List[dict] = [{"index": idx, "id": None, "duplicate": False, "error": None} for idx in range(len(items))]
+    parsed: List[tuple[int, schemas.TelemetryCreate]] = []
+    for idx, raw in enumerate(items):
+        if not isinstance(raw, dict):
+            results[idx]["error"] = "invalid_payload"
+            continue
+        try:
+            parsed.append((idx, schemas.TelemetryCreate(**raw)))
+        except ValidationError:
+            results[idx]["error"] = "invalid_payload"
+
+    if current_driver:
+        known_driver_ids = {current_driver.id}
+    else:
+        wanted = {int(req.driver_id) for _, req in parsed if req.driver_id}
+        known_driver_ids = {row[0] for row in db.query(models.Driver.id).filter(models.Driver.id.in_(wanted))} if wanted else set()
+
+    prepared: List[tuple[int, dict]] = []
+    for idx, req in parsed:
+        resolved_driver_id = current_driver.id if current_driver else req.driver_id
+        if not resolved_driver_id or int(resolved_driver_id) not in known_driver_ids:
+            results[idx]["error"] = "unauthorized"
+            continue
+        ts_error = _device_ts_error(req, now)
+        if ts_error:
+            results[idx]["error"] = ts_error
+            continue
+        prepared.append((idx, crud.build_telemetry_row(req, driver_id=int(resolved_driver_id), now=now)))
+    return results, prepared
+
+
+def _apply_telemetry_insert(db: Session, results: List[dict], prepared: List[tuple[int, dict]]) -> dict:
+    inserted = 0
+    for (idx, _), (event_id, was_inserted) in zip(prepared, crud.bulk_insert_telemetry(db, [row for _, row in prepared])):
+        results[idx]["id"] = event_id
+        results[idx]["duplicate"] = not was_inserted
+        inserted += int(was_inserted)
+    return {"inserted": inserted, "results": results}
+
+
+@app.post("/api/v1/telemetry/batch")
+def api_create_telemetry_batch(
+    items: List[Any] = Body(...),
+    current_driver: Optional[Driver] = Depends(get_current_driver_optional),
+    db: Session = Depends(get_db),
+):
+    results, prepared = _prepare_telemetry_items(db, items, current_driver, _telemetry_batch_max(), datetime.utcnow())
+    return _apply_telemetry_insert(db, results, prepared)
+
+
+@app.post("/api/v1/telemetry/replay")
+def api_replay_telemetry(
+    items: List[Any] = Body(...),
+    current_driver: Optional[Driver] = Depends(get_current_driver_optional),
+    db: Session = Depends(get_db),
+):
+    results, prepared = _prepare_telemetry_items(db, items, current_driver, _telemetry_replay_max(), datetime.utcnow())
+
+    # A backlog chunk re-sent after a timeout can repeat sequence numbers; keep the first copy only.
+    seen_seq: set[tuple[int, int]] = set()
+    unique: List[tuple[int, dict]] = []
+    for idx, row in prepared:
+        if row["seq"] is not None:
+            key = (row["driver_id"], row["seq"])
+            if key in seen_seq:
+                results[idx]["error"] = "duplicate_seq"
+                continue
+            seen_seq.add(key)
+        unique.append((idx, row))
+    unique.sort(key=lambda item: (item[1]["driver_id"], item[1]["ts"], item[1]["seq"] if item[1]["seq"] is not None else -1))
+    return _apply_telemetry_insert(db, results, unique)
+
+
 @app.get("/api/v1/telemetry", response_model=List[schemas.TelemetryRead])
 def api_list_telemetry(
     driver_id: Optional[int] = None,
@@ -2032,13 +2130,21 @@ def api_list_voice_events(
     return crud.list_voice_events_for_driver(db, driver_id=resolved_driver_id, limit=min(limit, 500))
 
 
+def _require_score_window(window: str) -> str:
+    if window not in scoring.SCORE_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Invalid score window (expected one of: {', '.join(scoring.SCORE_WINDOWS)})")
+    return window
+
+
 @app.get("/api/v1/score/driver/{driver_id}", response_model=schemas.DriverScore)
-def api_driver_score(driver_id: int, db: Session = Depends(get_db)):
+def api_driver_score(driver_id: int, window: str = "lifetime", db: Session = Depends(get_db)):
+    _require_score_window(window)
     if not crud.get_driver(db, driver_id):
         raise HTTPException(status_code=404, detail="Driver not found")
-    total_trips, total_events, harsh_events, harsh_ratio, avg_speed, score = crud.compute_driver_score(db, driver_id)
+    total_trips, total_events, harsh_events, harsh_ratio, avg_speed, score = scoring.compute_score(db, driver_id, window)
     return schemas.DriverScore(
         driver_id=driver_id,
+        window=window,
         total_trips=total_trips,
         total_events=total_events,
         harsh_events=harsh_events,
@@ -2062,11 +2168,101 @@ def api_organizations_nearby(
     return q.order_by(models.Organization.name).limit(50).all()
 
 
+def _run_score_recompute(organization_id: int, run_id: int) -> None:
+    db = SessionLocal()
+    try:
+        run = db.get(models.ScoreRecomputeRun, run_id)
+        score_recompute.recompute_organization_scores(db, organization_id, run=run)
+    except Exception:
+        logger.exception("score_recompute failed org=%s run=%s", organization_id, run_id)
+    finally:
+        db.close()
+
+
+def _score_run_payload(db: Session, run: models.ScoreRecomputeRun, limit: int, offset: int) -> dict:
+    rows = score_recompute.list_snapshots(db, run.id, limit=limit, offset=offset) if run.status == "done" else []
+    return {
+        "run": {
+            "id": run.id,
+            "organization_id": run.organization_id,
+            "status": run.status,
+            "driver_count": run.driver_count,
+            "event_count": run.event_count,
+            "error": run.error,
+            "started_at": run.started_at,
+            "finished_at": run.finished_at,
+        },
+        "results": [
+            {
+                "rank": row.rank,
+                "driver_id": row.driver_id,
+                "total_trips": row.total_trips,
+                "total_events": row.total_events,
+                "harsh_events": row.harsh_events,
+                "harsh_ratio": row.harsh_ratio,
+                "avg_speed_kmh": row.avg_speed_kmh,
+                "score_0_100": row.score_0_100,
+            }
+            for row in rows
+        ],
+    }
+
+
+@app.post("/api/admin/organizations/{org_id}/score-recompute", status_code=202)
+def api_admin_score_recompute(
+    org_id: int,
+    background_tasks: BackgroundTasks,
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    if not db.get(models.Organization, org_id):
+        raise HTTPException(status_code=404, detail="Organization not found")
+    run = score_recompute.create_run(db, org_id)
+    background_tasks.add_task(_run_score_recompute, org_id, run.id)
+    return {"run_id": run.id, "status": run.status}
+
+
+@app.get("/api/admin/voice-media/queue")
+def api_admin_voice_media_queue(_: None = Depends(require_admin_token)):
+    """Media worker pool metrics: ``queued + in_flight`` is the processing backlog."""
+    return {**media_worker.pool.stats(), "depth": media_worker.pool.depth()}
+
+
+@app.get("/api/admin/score-runs/{run_id}")
+def api_admin_score_run(
+    run_id: int,
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    run = db.get(models.ScoreRecomputeRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Score run not found")
+    return _score_run_payload(db, run, limit, offset)
+
+
+@app.get("/api/admin/organizations/{org_id}/leaderboard")
+def api_admin_org_leaderboard(
+    org_id: int,
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    run = score_recompute.latest_run(db, org_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="No completed score run for this organization")
+    return _score_run_payload(db, run, limit, offset)
+
+
 @app.get("/api/school/students")
 def api_school_students(
+    window: str = "lifetime",
     current_driver: Driver = Depends(get_current_driver),
     db: Session = Depends(get_db),
 ):
+    _require_score_window(window)
     if current_driver.role != "school":
         raise HTTPException(status_code=403, detail="School instructors only")
     if not current_driver.organization_id:
@@ -2079,12 +2275,15 @@ def api_school_students(
         )
         .all()
     )
+    member_ids = [m.driver_id for m in members]
+    drivers_by_id = {d.id: d for d in db.query(models.Driver).filter(models.Driver.id.in_(member_ids))} if member_ids else {}
+    scores = scoring.compute_scores(db, drivers_by_id.keys(), window)
     students = []
     for m in members:
-        d = crud.get_driver(db, m.driver_id)
+        d = drivers_by_id.get(m.driver_id)
         if not d:
             continue
-        total_trips, _, _, _, _, score = crud.compute_driver_score(db, d.id)
+        total_trips, _, _, _, _, score = scores[d.id]
         students.append({
             "id": d.id,
             "name": d.name,
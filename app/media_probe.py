@@ -0,0 +1,201 @@
+"""Container-level probing of voice clips: duration and a compact waveform, without an audio codec.
+
+Runs inside the media worker processes, so it deliberately imports nothing from the app's database
+layer. Duration comes from the container (Ogg granule positions, WebM ``Duration`` or block
+timecodes). Peaks are decoded PCM amplitudes when an ``ffmpeg`` binary is available and otherwise
+the per-packet size envelope, which for VBR speech codecs such as Opus tracks loudness closely.
+"""
+
+import array
+import os
+import shutil
+import struct
+import subprocess
+import sys
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple
+
+DEFAULT_BUCKETS = 64
+
+# EBML ids (marker bits included) of the WebM elements the probe reads.
+_EBML = 0x1A45DFA3
+_SEGMENT = 0x18538067
+_INFO = 0x1549A966
+_TIMECODE_SCALE = 0x2AD7B1
+_DURATION = 0x4489
+_CLUSTER = 0x1F43B675
+_CLUSTER_TIMECODE = 0xE7
+_BLOCK_GROUP = 0xA0
+_BLOCK = 0xA1
+_SIMPLE_BLOCK = 0xA3
+_DESCEND = {_SEGMENT, _INFO, _CLUSTER, _BLOCK_GROUP}
+
+
+class MediaInfo(NamedTuple):
+    duration_sec: Optional[float]
+    peaks: Optional[List[int]]  # ``buckets`` values in 0..255
+
+
+def _vint(fh: BinaryIO, keep_marker: bool) -> Optional[Tuple[int, int, bool]]:
+    """Read an EBML variable-length integer; returns ``(value, length, all_ones)``, None at EOF."""
+    first = fh.read(1)
+    if not first:
+        return None
+    b = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not b & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("invalid EBML vint")
+    rest = fh.read(length - 1)
+    if len(rest) != length - 1:
+        return None
+    value = b if keep_marker else b & (mask - 1)
+    all_ones = (b & (mask - 1)) == mask - 1
+    for byte in rest:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    return value, length, all_ones
+
+
+def _webm(fh: BinaryIO) -> Tuple[Optional[float], List[int]]:
+    scale = 1_000_000
+    declared: Optional[float] = None
+    cluster_tc = 0
+    track: Optional[int] = None
+    first_tc: Optional[int] = None
+    last_tc: Optional[int] = None
+    blocks = 0
+    sizes: List[int] = []
+    while True:
+        head = _vint(fh, keep_marker=True)
+        if head is None:
+            break
+        element = head[0]
+        size_vint = _vint(fh, keep_marker=False)
+        if size_vint is None:
+            break
+        size, _length, unknown = size_vint
+        if element in _DESCEND:
+            continue  # children follow inline; unknown sizes (live MediaRecorder output) are fine
+        if unknown:
+            break
+        if element == _TIMECODE_SCALE:
+            scale = int.from_bytes(fh.read(size), "big") or scale
+        elif element == _DURATION:
+            raw = fh.read(size)
+            declared = struct.unpack(">f" if size == 4 else ">d", raw)[0] if size in (4, 8) else None
+        elif element == _CLUSTER_TIMECODE:
+            cluster_tc = int.from_bytes(fh.read(size), "big")
+        elif element in (_SIMPLE_BLOCK, _BLOCK):
+            start = fh.tell()
+            number = _vint(fh, keep_marker=False)
+            rel = fh.read(2)
+            if number is None or len(rel) != 2:
+                break
+            if track is None:
+                track = number[0]
+            if number[0] == track:
+                tc = cluster_tc + struct.unpack(">h", rel)[0]
+                first_tc = tc if first_tc is None else min(first_tc, tc)
+                last_tc = tc if last_tc is None else max(last_tc, tc)
+                blocks += 1
+                sizes.append(size - number[1] - 3)
+            fh.seek(start + size)
+        else:
+            fh.seek(size, os.SEEK_CUR)
+    if declared:
+        return declared * scale / 1e9, sizes
+    if last_tc is None:
+        return None, sizes
+    span = last_tc - first_tc
+    # The last block still plays for one frame; estimate it from the average spacing.
+    frame = span / (blocks - 1) if blocks > 1 else 0
+    return (span + frame) * scale / 1e9, sizes
+
+
+def _ogg(fh: BinaryIO) -> Tuple[Optional[float], List[int]]:
+    serial: Optional[int] = None
+    rate = 0
+    pre_skip = 0
+    last_granule = -1
+    packets: List[int] = []
+    packet = 0
+    header_packets = 0
+    while True:
+        header = fh.read(27)
+        if len(header) < 27 or header[:4] != b"OggS":
+            break
+        granule, page_serial = struct.unpack_from("<qI", header, 6)
+        lacing = fh.read(header[26])
+        body = fh.read(sum(lacing))
+        if serial is None:
+            serial = page_serial
+            if body.startswith(b"OpusHead") and len(body) >= 12:
+                rate, pre_skip, header_packets = 48000, struct.unpack_from("<H", body, 10)[0], 2
+            elif body.startswith(b"\x01vorbis") and len(body) >= 16:
+                rate, header_packets = struct.unpack_from("<I", body, 12)[0], 3
+            else:
+                raise ValueError("unsupported Ogg codec")
+        if page_serial != serial:
+            continue
+        if granule >= 0:
+            last_granule = granule
+        for seg in lacing:
+            packet += seg
+            if seg < 255:
+                packets.append(packet)
+                packet = 0
+    if not rate or last_granule < 0:
+        return None, packets[header_packets:]
+    return max(0, last_granule - pre_skip) / rate, packets[header_packets:]
+
+
+def _bucket_peaks(values, buckets: int) -> Optional[List[int]]:
+    if not len(values) or buckets <= 0:
+        return None
+    n = len(values)
+    peaks = []
+    for i in range(buckets):
+        lo = i * n // buckets
+        hi = max(lo + 1, (i + 1) * n // buckets)
+        peaks.append(max(values[lo:hi]) if lo < n else 0)
+    top = max(peaks) or 1
+    return [round(255 * p / top) for p in peaks]
+
+
+def _ffmpeg_peaks(path: str, buckets: int, ffmpeg: str) -> Optional[Tuple[float, List[int]]]:
+    """Decode to 8 kHz mono PCM through ffmpeg; returns ``(duration, peaks)``."""
+    proc = subprocess.run(
+        [ffmpeg, "-v", "quiet", "-i", path, "-ac", "1", "-ar", "8000", "-f", "s16le", "-"],
+        stdout=subprocess.PIPE,
+        timeout=120,
+        check=False,
+    )
+    if proc.returncode != 0 or len(proc.stdout) < 2:
+        return None
+    samples = array.array("h")
+    samples.frombytes(proc.stdout[: len(proc.stdout) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return len(samples) / 8000, _bucket_peaks([abs(s) for s in samples], buckets)
+
+
+def analyze(path: str, buckets: int = DEFAULT_BUCKETS, ffmpeg: Optional[str] = None) -> MediaInfo:
+    """Duration and waveform peaks of a WebM or Ogg clip; fields are None when they cannot be derived."""
+    with open(path, "rb") as fh:
+        magic = fh.read(4)
+        fh.seek(0)
+        if magic == b"OggS":
+            duration, sizes = _ogg(fh)
+        elif magic == struct.pack(">I", _EBML):
+            duration, sizes = _webm(fh)
+        else:
+            raise ValueError("unsupported container")
+    binary = shutil.which(ffmpeg) if ffmpeg else None
+    if binary:
+        decoded = _ffmpeg_peaks(path, buckets, binary)
+        if decoded is not None:
+            return MediaInfo(duration if duration is not None else decoded[0], decoded[1])
+    return MediaInfo(duration, _bucket_peaks(sizes, buckets))
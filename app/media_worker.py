@@ -0,0 +1,417 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import and_, bindparam, or_, update
+from sqlalchemy.orm import Session
+
+from . import media_probe, models
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# (voice message id, duration, peaks JSON, status) waiting for the batched write-back.
+Result = Tuple[int, Optional[float], Optional[str], str]
+
+# Probes of one clip that may take a worker process down before the clip is written off as "failed".
+MAX_CRASHES = 2
+
+
+def voice_ffmpeg_binary() -> Optional[str]:
+    """ffmpeg used for decoded waveform peaks when installed; set ``VOICE_FFMPEG=`` to always use packet sizes."""
+    value = os.getenv("VOICE_FFMPEG", "ffmpeg").strip()
+    return value or None
+
+
+def voice_media_claim_sec() -> int:
+    """How long a claimed clip stays reserved for the worker that claimed it; a crashed worker's clips are retried after this."""
+    return max(30, int(os.getenv("VOICE_MEDIA_CLAIM_SEC", "600")))
+
+
+def probe_clip(path: str, buckets: int, ffmpeg: Optional[str]) -> Tuple[Optional[float], Optional[str], str]:
+    """``(duration_sec, waveform_peaks, media_status)`` for one clip; runs in a worker process."""
+    try:
+        info = media_probe.analyze(path, buckets=buckets, ffmpeg=ffmpeg)
+    except FileNotFoundError:
+        return None, None, "missing"
+    except (OSError, ValueError, struct.error, IndexError, subprocess.TimeoutExpired):
+        return None, None, "unsupported"
+    peaks = json.dumps(info.peaks, separators=(",", ":")) if info.peaks is not None else None
+    return info.duration_sec, peaks, "ok" if info.duration_sec is not None else "unsupported"
+
+
+def write_results(db: Session, results: List[Result]) -> None:
+    """Store probe results with one executemany UPDATE."""
+    vm = models.VoiceMessage.__table__
+    db.connection().execute(
+        update(vm)
+        .where(vm.c.id == bindparam("b_id"))
+        .values(
+            duration_sec=bindparam("b_duration"),
+            waveform_peaks=bindparam("b_peaks"),
+            media_status=bindparam("b_status"),
+            media_processed_at=bindparam("b_at"),
+            media_claimed_by=None,
+            media_claimed_at=None,
+        ),
+        [
+            {"b_id": msg_id, "b_duration": duration, "b_peaks": peaks, "b_status": status, "b_at": datetime.utcnow()}
+            for msg_id, duration, peaks, status in results
+        ],
+    )
+    db.commit()
+
+
+def _unclaimed(now: datetime):
+    vm = models.VoiceMessage
+    stale = now - timedelta(seconds=voice_media_claim_sec())
+    return and_(vm.media_processed_at.is_(None), or_(vm.media_claimed_at.is_(None), vm.media_claimed_at < stale))
+
+
+def pending_clips(db: Session, limit: int, after_id: int = 0) -> List[Tuple[int, str]]:
+    """Unprocessed clips no live worker has claimed."""
+    vm = models.VoiceMessage
+    rows = (
+        db.query(vm.id, vm.file_path)
+        .filter(_unclaimed(datetime.utcnow()), vm.id > after_id)
+        .order_by(vm.id)
+        .limit(limit)
+        .all()
+    )
+    return [(row.id, row.file_path) for row in rows]
+
+
+def claim_clips(db: Session, ids: List[int], owner: str) -> Set[int]:
+    """Reserve clips for ``owner`` before probing; returns the ids this call won.
+
+    Several app processes sweep the same table on startup, so a clip is only probed by the worker
+    whose conditional UPDATE took it.
+    """
+    if not ids:
+        return set()
+    vm = models.VoiceMessage
+    now = datetime.utcnow()
+    db.query(vm).filter(vm.id.in_(ids), _unclaimed(now)).update(
+        {vm.media_claimed_by: owner, vm.media_claimed_at: now}, synchronize_session=False
+    )
+    db.commit()
+    won = db.query(vm.id).filter(vm.id.in_(ids), vm.media_claimed_by == owner, vm.media_claimed_at == now).all()
+    return {row.id for row in won}
+
+
+def release_clips(db: Session, ids: List[int], owner: str) -> None:
+    """Hand unfinished claims back so the next sweep picks the clips up straight away."""
+    if not ids:
+        return
+    vm = models.VoiceMessage
+    db.query(vm).filter(vm.id.in_(ids), vm.media_claimed_by == owner, vm.media_processed_at.is_(None)).update(
+        {vm.media_claimed_by: None, vm.media_claimed_at: None}, synchronize_session=False
+    )
+    db.commit()
+
+
+class MediaWorkerPool:
+    """Duration and waveform extraction for voice clips on a pool of worker processes.
+
+    Uploads enqueue ``(message id, path)``; a dispatcher thread claims queued clips in the
+    database, keeps at most two jobs per process in flight and writes results back in batches of
+    ``flush_rows`` or every ``flush_interval_ms``. On start it also queues clips left unprocessed
+    by earlier runs. A worker process dying breaks the executor; it is replaced and the affected
+    clips are queued again.
+    """
+
+    def __init__(self, workers: int, queue_size: int, flush_rows: int, flush_interval_ms: int, buckets: int):
+        self.workers = max(0, workers)
+        self.queue_size = max(1, queue_size)
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.buckets = buckets
+        self._queue: deque = deque()
+        self._queued_ids: set = set()
+        self._results: List[Result] = []
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._broken = False
+        self._crashes: dict = {}
+        self._claimed: Set[int] = set()
+        self.owner = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @classmethod
+    def from_env(cls) -> "MediaWorkerPool":
+        return cls(
+            workers=int(os.getenv("VOICE_MEDIA_WORKERS", "2")),
+            queue_size=int(os.getenv("VOICE_MEDIA_QUEUE_SIZE", "10000")),
+            flush_rows=int(os.getenv("VOICE_MEDIA_FLUSH_ROWS", "50")),
+            flush_interval_ms=int(os.getenv("VOICE_MEDIA_FLUSH_INTERVAL_MS", "1000")),
+            buckets=int(os.getenv("VOICE_WAVEFORM_BUCKETS", str(media_probe.DEFAULT_BUCKETS))),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def depth(self) -> int:
+        """Clips waiting for or being processed."""
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self.running,
+                "workers": self.workers,
+                "queued": len(self._queue),
+                "in_flight": self._in_flight,
+                "pending_writes": len(self._results),
+                "processed": self._processed,
+                "failed": self._failed,
+                "crashed_jobs": sum(self._crashes.values()),
+            }
+
+    def enqueue(self, msg_id: int, path: str) -> bool:
+        """Queue a clip; False when the pool is not running or full (the startup sweep picks it up later)."""
+        if not self.running:
+            return False
+        with self._cond:
+            if msg_id in self._queued_ids:
+                return True
+            if len(self._queue) >= self.queue_size:
+                return False
+            self._queue.append((msg_id, path))
+            self._queued_ids.add(msg_id)
+            self._cond.notify()
+        return True
+
+    def start(self) -> None:
+        if self.workers <= 0 or self.running:
+            return
+        self._stopping = False
+        self._executor = self._new_executor()
+        self._thread = threading.Thread(target=self._run, name="voice-media", daemon=True)
+        self._thread.start()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already runs server and database threads is unsafe.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self) -> None:
+        old, self._executor = self._executor, self._new_executor()
+        with self._cond:
+            self._broken = False
+        if old is not None:
+            old.shutdown(wait=False, cancel_futures=True)
+        logger.warning("voice_media_pool replaced a broken process pool")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self.flush()
+        with self._cond:
+            unfinished = sorted(self._claimed)
+            self._queue.clear()
+            self._queued_ids.clear()
+            self._claimed.clear()
+        db = SessionLocal()
+        try:
+            release_clips(db, unfinished, self.owner)
+        except Exception:
+            db.rollback()
+            logger.exception("voice_media_release failed rows=%s", len(unfinished))
+        finally:
+            db.close()
+
+    def _requeue_crashed(self, msg_id: int, path: str) -> None:
+        # Caller holds self._cond. A clip that keeps killing workers is written off instead of looping.
+        crashes = self._crashes.get(msg_id, 0) + 1
+        if crashes > MAX_CRASHES:
+            self._crashes.pop(msg_id, None)
+            self._queued_ids.discard(msg_id)
+            self._claimed.discard(msg_id)
+            self._results.append((msg_id, None, None, "failed"))
+            self._failed += 1
+            logger.error("voice_media_probe id=%s crashed the worker %s times; marked failed", msg_id, crashes - 1)
+            return
+        self._crashes[msg_id] = crashes
+        self._queue.appendleft((msg_id, path))
+
+    def _done(self, msg_id: int, path: str, future: Future) -> None:
+        # Cancelled probes (shutdown) stay unprocessed; their claims are released by stop().
+        error = None if future.cancelled() else future.exception()
+        with self._cond:
+            self._in_flight -= 1
+            if isinstance(error, BrokenProcessPool):
+                self._broken = True
+                self._requeue_crashed(msg_id, path)
+            else:
+                self._queued_ids.discard(msg_id)
+                self._crashes.pop(msg_id, None)
+                if error is not None:
+                    logger.error("voice_media_probe failed id=%s: %s", msg_id, error)
+                    self._claimed.discard(msg_id)
+                    self._failed += 1
+                elif not future.cancelled():
+                    self._results.append((msg_id, *future.result()))
+                    self._processed += 1
+            self._cond.notify()
+
+    def _sweep(self) -> None:
+        after_id = 0
+        while not self._stopping:
+            with self._cond:
+                room = self.queue_size - len(self._queue)
+            if room <= 0:
+                return
+            db = SessionLocal()
+            try:
+                rows = pending_clips(db, limit=min(room, 1000), after_id=after_id)
+            finally:
+                db.close()
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            for msg_id, path in rows:
+                self.enqueue(msg_id, path)
+
+    def _run(self) -> None:
+        try:
+            self._sweep()
+        except Exception:
+            logger.exception("voice_media_sweep failed")
+        last_flush = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._stopping and (not self._queue or self._in_flight >= 2 * self.workers):
+                    if len(self._results) >= self.flush_rows or (self._results and time.monotonic() - last_flush >= self.flush_interval):
+                        break
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+                broken = self._broken
+                jobs = []
+                while self._queue and self._in_flight + len(jobs) < 2 * self.workers:
+                    jobs.append(self._queue.popleft())
+            if broken:
+                self._replace_executor()
+            if jobs:
+                self._submit(jobs)
+            if len(self._results) >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def _claim(self, jobs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        fresh = [msg_id for msg_id, _path in jobs if msg_id not in self._claimed]
+        db = SessionLocal()
+        try:
+            won = claim_clips(db, fresh, self.owner)
+        finally:
+            db.close()
+        with self._cond:
+            self._claimed.update(won)
+            lost = [msg_id for msg_id, _path in jobs if msg_id not in self._claimed]
+            self._queued_ids.difference_update(lost)
+            return [(msg_id, path) for msg_id, path in jobs if msg_id in self._claimed]
+
+    def _submit(self, jobs: List[Tuple[int, str]]) -> None:
+        try:
+            jobs = self._claim(jobs)
+        except Exception:
+            logger.exception("voice_media_claim failed; requeueing %s clips", len(jobs))
+            with self._cond:
+                self._queue.extendleft(reversed(jobs))
+                self._cond.wait(self.flush_interval)
+            return
+        for i, (msg_id, path) in enumerate(jobs):
+            try:
+                future = self._executor.submit(probe_clip, path, self.buckets, voice_ffmpeg_binary())
+            except BrokenProcessPool:
+                # A worker died since the last dispatch; the unsubmitted jobs go back to the queue front.
+                with self._cond:
+                    self._queue.extendleft(reversed(jobs[i:]))
+                self._replace_executor()
+                return
+            with self._cond:
+                self._in_flight += 1
+            future.add_done_callback(lambda f, msg_id=msg_id, path=path: self._done(msg_id, path, f))
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._cond:
+                batch, self._results = self._results, []
+            if not batch:
+                return 0
+            db = SessionLocal()
+            try:
+                write_results(db, batch)
+                with self._cond:
+                    self._claimed.difference_update(msg_id for msg_id, *_rest in batch)
+            except Exception:
+                db.rollback()
+                logger.exception("voice_media_flush failed rows=%s; requeueing", len(batch))
+                with self._cond:
+                    self._results[:0] = batch
+                return 0
+            finally:
+                db.close()
+            return len(batch)
+
+
+def process_pending(db: Session, batch_size: int = 50, buckets: int = media_probe.DEFAULT_BUCKETS) -> int:
+    """Probe every unclaimed, unprocessed clip in this process, for the CLI; returns the number written."""
+    owner = f"cli:{socket.gethostname()[:40]}:{os.getpid()}"
+    done = 0
+    after_id = 0
+    while True:
+        rows = pending_clips(db, limit=batch_size, after_id=after_id)
+        if not rows:
+            return done
+        after_id = rows[-1][0]
+        won = claim_clips(db, [msg_id for msg_id, _path in rows], owner)
+        results = [(msg_id, *probe_clip(path, buckets, voice_ffmpeg_binary())) for msg_id, path in rows if msg_id in won]
+        if not results:
+            continue
+        write_results(db, results)
+        done += len(results)
+
+
+pool = MediaWorkerPool.from_env()
+
+
+def schedule(db: Session, message: models.VoiceMessage) -> None:
+    """Reuse the results of an identical clip already probed, otherwise hand the clip to the pool."""
+    vm = models.VoiceMessage
+    if message.content_sha256:
+        twin = (
+            db.query(vm.duration_sec, vm.waveform_peaks, vm.media_status)
+            .filter(vm.content_sha256 == message.content_sha256, vm.media_processed_at.isnot(None), vm.id != message.id)
+            .first()
+        )
+        if twin is not None:
+            write_results(db, [(message.id, twin.duration_sec, twin.waveform_peaks, twin.media_status)])
+            db.refresh(message)
+            return
+    pool.enqueue(message.id, message.file_path)
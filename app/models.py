@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 
 from .db import Base
@@ -20,6 +20,8 @@ class Driver(Base):
     verification_code = Column(String(16), nullable=True)
     verification_expires_at = Column(DateTime, nullable=True)
     verification_channel = Column(String(16), nullable=True)
+    verification_delivery_status = Column(String(16), nullable=True)  # queued / retrying / sent / failed
+    verification_delivery_at = Column(DateTime, nullable=True)
     failed_attempts = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_login_at = Column(DateTime, nullable=True)
@@ -84,6 +86,8 @@ class Trip(Base):
 
 class TelemetryEvent(Base):
     __tablename__ = "telemetry_events"
+    # Arbiter of crud._insert_or_ignore's ON CONFLICT; declared here so create_all builds it on every backend.
+    __table_args__ = (Index("ux_telemetry_events_driver_client_event", "driver_id", "client_event_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
@@ -100,11 +104,127 @@ class TelemetryEvent(Base):
     road_type = Column(String(64), nullable=True)
     weather = Column(String(64), nullable=True)
     raw_notes = Column(Text, nullable=True)
+    device_ts = Column(DateTime, nullable=True)
+    seq = Column(Integer, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+    client_event_id = Column(String(64), nullable=True)
 
     driver = relationship("Driver", back_populates="telemetry_events")
     trip = relationship("Trip", back_populates="telemetry_events")
 
 
+class DriverScoreStats(Base):
+    __tablename__ = "driver_score_stats"
+
+    driver_id = Column(Integer, ForeignKey("drivers.id"), primary_key=True)
+    event_count = Column(Integer, nullable=False, default=0)
+    harsh_count = Column(Integer, nullable=False, default=0)
+    speed_sum = Column(Float, nullable=False, default=0.0)
+    speed_count = Column(Integer, nullable=False, default=0)
+    trip_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class DriverScoreDaily(Base):
+    __tablename__ = "driver_score_daily"
+
+    driver_id = Column(Integer, ForeignKey("drivers.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    event_count = Column(Integer, nullable=False, default=0)
+    harsh_count = Column(Integer, nullable=False, default=0)
+    speed_sum = Column(Float, nullable=False, default=0.0)
+    speed_count = Column(Integer, nullable=False, default=0)
+    trip_count = Column(Integer, nullable=False, default=0)
+
+
+class HarshEvent(Base):
+    __tablename__ = "harsh_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    telemetry_event_id = Column(Integer, ForeignKey("telemetry_events.id"), nullable=False, unique=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
+    trip_id = Column(Integer, nullable=True)
+    group_tag = Column(String(64), nullable=True)  # driver scope at ingest time
+    organization_id = Column(Integer, nullable=True)
+    ts = Column(DateTime, nullable=False)
+    brake_hard = Column(Boolean, nullable=False, default=False)
+    accel_hard = Column(Boolean, nullable=False, default=False)
+    cornering_hard = Column(Boolean, nullable=False, default=False)
+    speed_kmh = Column(Float, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+
+
+class DriverLiveStatus(Base):
+    __tablename__ = "driver_live_status"
+
+    driver_id = Column(Integer, ForeignKey("drivers.id"), primary_key=True)
+    trip_id = Column(Integer, nullable=True)
+    trip_status = Column(String(16), nullable=False, default="none")  # none | active | completed
+    trip_started_at = Column(DateTime, nullable=True)
+    last_ts = Column(DateTime, nullable=True)
+    last_latitude = Column(Float, nullable=True)
+    last_longitude = Column(Float, nullable=True)
+    last_speed_kmh = Column(Float, nullable=True)
+    last_brake_hard = Column(Boolean, nullable=True)
+    last_accel_hard = Column(Boolean, nullable=True)
+    last_cornering_hard = Column(Boolean, nullable=True)
+    last_seen_at = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False, default=0)  # change_counters["driver_state"] value of the last change
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChangeCounter(Base):
+    __tablename__ = "change_counters"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class DriverScopeExit(Base):
+    """A driver leaving an operator scope (re-scoped or deleted), so dashboard deltas can drop it."""
+
+    __tablename__ = "driver_scope_exits"
+
+    id = Column(Integer, primary_key=True, index=True)
+    driver_id = Column(Integer, nullable=False, index=True)  # no FK: outlives deleted drivers
+    group_tag = Column(String(64), nullable=True)
+    organization_id = Column(Integer, nullable=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    version = Column(Integer, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class ScoreRecomputeRun(Base):
+    __tablename__ = "score_recompute_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    status = Column(String(32), nullable=False, default="running")  # running | done | failed
+    driver_count = Column(Integer, nullable=False, default=0)
+    event_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class DriverScoreSnapshot(Base):
+    __tablename__ = "driver_score_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("score_recompute_runs.id"), nullable=False, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
+    total_trips = Column(Integer, nullable=False, default=0)
+    total_events = Column(Integer, nullable=False, default=0)
+    harsh_events = Column(Integer, nullable=False, default=0)
+    harsh_ratio = Column(Float, nullable=False, default=0.0)
+    avg_speed_kmh = Column(Float, nullable=True)
+    score_0_100 = Column(Float, nullable=False, default=100.0)
+    rank = Column(Integer, nullable=False, default=0)
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class VoiceEvent(Base):
     __tablename__ = "voice_events"
 
@@ -127,7 +247,14 @@ class VoiceMessage(Base):
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
     trip_id = Column(Integer, ForeignKey("trips.id"), nullable=True, index=True)
     file_path = Column(String(512), nullable=False)
+    file_size = Column(Integer, nullable=True)
+    content_sha256 = Column(String(64), nullable=True, index=True)
     duration_sec = Column(Float, nullable=True)
+    waveform_peaks = Column(Text, nullable=True)  # JSON array of 0..255 peaks, see media_probe
+    media_status = Column(String(16), nullable=True)
+    media_processed_at = Column(DateTime, nullable=True)
+    media_claimed_by = Column(String(64), nullable=True)  # media worker probing the clip
+    media_claimed_at = Column(DateTime, nullable=True)
     target = Column(String(64), nullable=True)
     note = Column(Text, nullable=True)
     status = Column(String(32), nullable=False, default="received")
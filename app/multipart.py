@@ -0,0 +1,176 @@
+import os
+from pathlib import Path
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .voice_storage import VoiceStorage
+
+# Largest small form field and part header block kept in memory.
+MAX_FIELD_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+
+def voice_upload_max_bytes() -> int:
+    return max(0, int(os.getenv("VOICE_UPLOAD_MAX_BYTES", str(50 * 1024 * 1024))))
+
+
+class VoiceUpload(NamedTuple):
+    temp_path: Path  # closed spool file; publish or discard it through the voice storage
+    size: int
+    sha256: str
+    filename: str
+    trip_id: Optional[int]
+    note: Optional[str]
+    target: Optional[str]
+    driver_id: Optional[int]
+    group_tag: Optional[str]
+
+
+def _boundary(content_type: str) -> bytes:
+    marker = "boundary="
+    if marker not in content_type:
+        raise HTTPException(status_code=400, detail="Invalid multipart payload")
+    boundary = content_type.split(marker, 1)[1].split(";", 1)[0].strip()
+    if boundary.startswith('"') and boundary.endswith('"'):
+        boundary = boundary[1:-1]
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Invalid multipart payload")
+    return boundary.encode("latin-1")
+
+
+def _disposition(headers_raw: bytes) -> Dict[str, str]:
+    """``name``/``filename`` parameters of the part's Content-Disposition header."""
+    params: Dict[str, str] = {}
+    for line in headers_raw.decode("utf-8", errors="ignore").split("\r\n"):
+        key, _, value = line.partition(":")
+        if key.strip().lower() != "content-disposition":
+            continue
+        for item in value.split(";")[1:]:
+            pname, _, pvalue = item.strip().partition("=")
+            pvalue = pvalue.strip()
+            if len(pvalue) >= 2 and pvalue[0] == pvalue[-1] == '"':
+                pvalue = pvalue[1:-1]
+            params[pname.strip().lower()] = pvalue
+    return params
+
+
+async def _parts(chunks: AsyncIterator[bytes], boundary: bytes) -> AsyncIterator[Tuple[str, object]]:
+    """Incremental multipart tokenizer yielding ``("headers", bytes)``, ``("data", bytes)`` and ``("end", None)``.
+
+    Only the current header block and at most one delimiter's worth of look-behind are buffered,
+    so memory stays flat however large a part is.
+    """
+    first = b"--" + boundary
+    delimiter = b"\r\n--" + boundary
+    buf = bytearray()
+    state = "preamble"
+    async for chunk in chunks:
+        buf += chunk
+        while True:
+            if state == "preamble":
+                idx = buf.find(first)
+                if idx < 0:
+                    del buf[: max(0, len(buf) - len(first))]
+                    break
+                del buf[: idx + len(first)]
+                state = "after_delimiter"
+            elif state == "after_delimiter":
+                if len(buf) < 2:
+                    break
+                if buf[:2] == b"--":
+                    return
+                idx = buf.find(b"\r\n")
+                if idx < 0:
+                    break
+                del buf[: idx + 2]  # CRLF (after optional transport padding) ends the delimiter line
+                state = "headers"
+            elif state == "headers":
+                idx = buf.find(b"\r\n\r\n")
+                if idx < 0:
+                    if len(buf) > MAX_HEADER_BYTES:
+                        raise HTTPException(status_code=400, detail="Invalid multipart payload")
+                    break
+                yield "headers", bytes(buf[:idx])
+                del buf[: idx + 4]
+                state = "body"
+            else:
+                idx = buf.find(delimiter)
+                if idx >= 0:
+                    if idx:
+                        yield "data", bytes(buf[:idx])
+                    yield "end", None
+                    del buf[: idx + len(delimiter)]
+                    state = "after_delimiter"
+                    continue
+                keep = len(delimiter) - 1
+                if len(buf) > keep:
+                    yield "data", bytes(buf[:-keep])
+                    del buf[:-keep]
+                break
+    raise HTTPException(status_code=400, detail="Invalid multipart payload")
+
+
+async def read_voice_upload(chunks: AsyncIterator[bytes], content_type: str, storage: VoiceStorage) -> VoiceUpload:
+    """Stream a voice multipart body: the ``file`` part is spooled through ``storage`` chunk by chunk,
+    the small form fields are collected in memory."""
+    boundary = _boundary(content_type)
+    max_bytes = voice_upload_max_bytes()
+    spool = await storage.spool()
+    fields: Dict[str, str] = {}
+    filename = "voice.webm"
+    size = 0
+    seen_file = False
+    try:
+        name: Optional[str] = None
+        value = bytearray()
+        async for kind, payload in _parts(chunks, boundary):
+            if kind == "headers":
+                params = _disposition(payload)
+                name = params.get("name")
+                value.clear()
+                if name == "file":
+                    seen_file = True
+                    filename = params.get("filename") or filename
+            elif kind == "data":
+                if name == "file":
+                    size += len(payload)
+                    if max_bytes and size > max_bytes:
+                        raise HTTPException(status_code=413, detail="Voice file too large")
+                    await spool.write(payload)
+                elif name is not None:
+                    value += payload
+                    if len(value) > MAX_FIELD_BYTES:
+                        raise HTTPException(status_code=400, detail="Invalid multipart payload")
+            else:
+                if name is not None and name != "file":
+                    fields[name] = value.decode("utf-8", errors="ignore").strip()
+                name = None
+        if not seen_file or not size:
+            raise HTTPException(status_code=400, detail="Missing file part")
+
+        def as_int(key: str) -> Optional[int]:
+            txt = fields.get(key)
+            if not txt:
+                return None
+            try:
+                return int(txt)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid {key}")
+
+        trip_id, driver_id = as_int("trip_id"), as_int("driver_id")
+        await spool.close()
+        return VoiceUpload(
+            temp_path=spool.path,
+            size=size,
+            sha256=spool.sha256,
+            filename=filename,
+            trip_id=trip_id,
+            note=fields.get("note") or None,
+            target=fields.get("target") or "cb",
+            driver_id=driver_id,
+            group_tag=fields.get("group_tag") or None,
+        )
+    except BaseException:
+        await spool.abort()
+        raise
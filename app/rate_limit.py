@@ -0,0 +1,105 @@
+import bisect
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+Key = Tuple[str, ...]
+
+
+def trial_limiter_mode() -> str:
+    """``db`` (default) counts attempts in ``trial_attempts``; ``memory`` keeps sliding windows in process."""
+    return (os.getenv("TRIAL_RL_MODE") or "db").strip().lower()
+
+
+def _key(filters: Dict[str, str], counted_only: bool) -> Key:
+    return (("counted",) if counted_only else ("all",)) + tuple(f"{field}={filters[field]}" for field in sorted(filters))
+
+
+class SlidingWindowCounter:
+    """Per-key sorted attempt timestamps for the trial limiter, so a check is two bisects.
+
+    Keys mirror ``crud.trial_rate_limit_checks``: every attempt is recorded under its IP and
+    IP+email keys, and attempts with a counted status also under their email and phone keys.
+    The first check loads the widest window from ``trial_attempts`` so a restart does not reset
+    the limits; attempts are only recorded once that has happened.
+    """
+
+    PRUNE_EVERY = timedelta(minutes=10)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamps: Dict[Key, List[datetime]] = {}
+        self._loaded = False
+        self._next_prune: Optional[datetime] = None
+
+    def _add(self, ip_hash: str, email_hash: str, phone_hash: Optional[str], counted: bool, at: datetime) -> None:
+        keys = [_key({"ip_hash": ip_hash}, False), _key({"ip_hash": ip_hash, "email_hash": email_hash}, False)]
+        if counted:
+            keys.append(_key({"email_hash": email_hash}, True))
+            if phone_hash:
+                keys.append(_key({"phone_hash": phone_hash}, True))
+        for key in keys:
+            stamps = self._stamps.setdefault(key, [])
+            if stamps and stamps[-1] > at:
+                bisect.insort(stamps, at)
+            else:
+                stamps.append(at)
+
+    def record(self, ip_hash: str, email_hash: str, phone_hash: Optional[str], counted: bool, at: datetime) -> None:
+        with self._lock:
+            if self._loaded:
+                self._add(ip_hash, email_hash, phone_hash, counted, at)
+
+    def ensure_loaded(self, db: Session, now: datetime, horizon: timedelta, counted_statuses: Tuple[str, ...]) -> None:
+        if self._loaded:
+            return
+        tel = models.TrialAttempt
+        rows = (
+            db.query(tel.ip_hash, tel.email_hash, tel.phone_hash, tel.status, tel.created_at)
+            .filter(tel.created_at >= now - horizon)
+            .all()
+        )
+        with self._lock:
+            if self._loaded:
+                return
+            for ip_hash, email_hash, phone_hash, status, created_at in rows:
+                self._add(ip_hash, email_hash, phone_hash, status in counted_statuses, created_at)
+            self._loaded = True
+            self._next_prune = now + self.PRUNE_EVERY
+
+    def totals(self, checks: List[dict], now: datetime) -> List[Tuple[int, Optional[datetime]]]:
+        """``(count, oldest)`` inside each check's window, in the shape ``crud.first_exceeded_trial_check`` takes."""
+        horizon = now - timedelta(seconds=max(check["window"] for check in checks))
+        out = []
+        with self._lock:
+            if self._next_prune is not None and now >= self._next_prune:
+                # Keys nobody asks about again would otherwise stay forever.
+                self._stamps = {key: stamps for key, stamps in self._stamps.items() if stamps[-1] >= horizon}
+                self._next_prune = now + self.PRUNE_EVERY
+            for check in checks:
+                key = _key(check["filters"], bool(check["statuses"]))
+                stamps = self._stamps.get(key)
+                if stamps:
+                    expired = bisect.bisect_left(stamps, horizon)
+                    if expired:
+                        del stamps[:expired]
+                if not stamps:
+                    out.append((0, None))
+                    continue
+                start = bisect.bisect_left(stamps, now - timedelta(seconds=check["window"]))
+                out.append((len(stamps) - start, stamps[start] if start < len(stamps) else None))
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stamps.clear()
+            self._loaded = False
+            self._next_prune = None
+
+
+trial_window = SlidingWindowCounter()
@@ -88,12 +88,16 @@ class TelemetryCreate(BaseModel):
     road_type: Optional[str] = None
     weather: Optional[str] = None
     raw_notes: Optional[str] = None
+    device_ts: Optional[datetime] = None  # capture time on the device, used as the event time
+    seq: Optional[int] = Field(None, ge=0)  # per-device monotonic counter
+    client_event_id: Optional[str] = Field(None, max_length=64)  # idempotency key, unique per driver
 
 
 class TelemetryRead(TelemetryCreate):
     id: int
     driver_id: int
     ts: datetime
+    received_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -117,6 +121,7 @@ class VoiceEventRead(VoiceEventCreate):
 
 class DriverScore(BaseModel):
     driver_id: int
+    window: str = "lifetime"  # lifetime | 7d | 30d | 90d | decayed
     total_trips: int
     total_events: int
     harsh_events: int
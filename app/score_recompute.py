@@ -0,0 +1,178 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+from sqlalchemy import case, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50000
+
+ProgressFn = Callable[[int, int], None]
+
+
+def organization_driver_ids(db: Session, organization_id: int) -> List[int]:
+    members = select(models.OrganizationMember.driver_id).where(models.OrganizationMember.organization_id == organization_id)
+    rows = db.execute(
+        select(models.Driver.id)
+        .where(or_(models.Driver.organization_id == organization_id, models.Driver.id.in_(members)))
+        .order_by(models.Driver.id)
+    )
+    return [row[0] for row in rows]
+
+
+def score_arrays(events, harsh, speed_sum, speed_count):
+    """Vectorized ``crud.score_from_totals``: returns ``(harsh_ratio, avg_speed, score)`` arrays."""
+    events = np.asarray(events, dtype=np.float64)
+    harsh = np.asarray(harsh, dtype=np.float64)
+    speed_sum = np.asarray(speed_sum, dtype=np.float64)
+    speed_count = np.asarray(speed_count, dtype=np.float64)
+
+    harsh_ratio = np.divide(harsh, events, out=np.zeros_like(events), where=events > 0)
+    avg_speed = np.divide(speed_sum, speed_count, out=np.full_like(speed_sum, np.nan), where=speed_count > 0)
+    over = np.nan_to_num(avg_speed - crud.SCORE_SPEED_LIMIT_KMH, nan=0.0)
+    speed_penalty = np.minimum(np.clip(over, 0.0, None) * crud.SCORE_SPEED_PENALTY_PER_KMH, crud.SCORE_SPEED_PENALTY_MAX)
+    score = np.clip(100.0 - harsh_ratio * crud.SCORE_HARSH_RATIO_WEIGHT - speed_penalty, 0.0, 100.0)
+    return harsh_ratio, avg_speed, score
+
+
+def _accumulate_telemetry(db: Session, driver_ids, chunk_rows: int, progress: Optional[ProgressFn]):
+    """Scan the drivers' telemetry in id-ordered chunks, summing per-driver counters with ``bincount``."""
+    tel = models.TelemetryEvent
+    n = len(driver_ids)
+    events = np.zeros(n, dtype=np.int64)
+    harsh = np.zeros(n, dtype=np.int64)
+    speed_sum = np.zeros(n, dtype=np.float64)
+    speed_count = np.zeros(n, dtype=np.int64)
+
+    id_list = driver_ids.tolist()
+    total = db.query(func.count(tel.id)).filter(tel.driver_id.in_(id_list)).scalar() or 0
+    harsh_col = case((tel.brake_hard | tel.accel_hard | tel.cornering_hard, 1), else_=0)
+    scanned = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(tel.id, tel.driver_id, tel.speed_kmh, harsh_col)
+            .where(tel.driver_id.in_(id_list), tel.id > last_id)
+            .order_by(tel.id)
+            .limit(chunk_rows)
+        ).all()
+        if not rows:
+            break
+        ids, drv, speed, is_harsh = zip(*rows)
+        last_id = ids[-1]
+        idx = np.searchsorted(driver_ids, np.asarray(drv, dtype=np.int64))
+        speed_arr = np.array(speed, dtype=np.float64)
+        has_speed = ~np.isnan(speed_arr)
+
+        events += np.bincount(idx, minlength=n)
+        harsh += np.bincount(idx, weights=np.asarray(is_harsh, dtype=np.float64), minlength=n).astype(np.int64)
+        speed_sum += np.bincount(idx[has_speed], weights=speed_arr[has_speed], minlength=n)
+        speed_count += np.bincount(idx[has_speed], minlength=n)
+
+        scanned += len(rows)
+        if progress:
+            progress(scanned, total)
+    return events, harsh, speed_sum, speed_count
+
+
+def _trip_counts(db: Session, driver_ids):
+    trips = np.zeros(len(driver_ids), dtype=np.int64)
+    rows = (
+        db.query(models.Trip.driver_id, func.count(models.Trip.id))
+        .filter(models.Trip.driver_id.in_(driver_ids.tolist()))
+        .group_by(models.Trip.driver_id)
+        .all()
+    )
+    if rows:
+        drv, counts = zip(*rows)
+        trips[np.searchsorted(driver_ids, np.asarray(drv, dtype=np.int64))] = counts
+    return trips
+
+
+def recompute_organization_scores(
+    db: Session,
+    organization_id: int,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    progress: Optional[ProgressFn] = None,
+    run: Optional[models.ScoreRecomputeRun] = None,
+) -> models.ScoreRecomputeRun:
+    """Recompute every driver score in an organization from raw telemetry and store a ranked snapshot."""
+    if run is None:
+        run = create_run(db, organization_id)
+    try:
+        driver_ids = np.asarray(organization_driver_ids(db, organization_id), dtype=np.int64)
+        if len(driver_ids):
+            events, harsh, speed_sum, speed_count = _accumulate_telemetry(db, driver_ids, max(1, chunk_rows), progress)
+            trips = _trip_counts(db, driver_ids)
+            harsh_ratio, avg_speed, score = score_arrays(events, harsh, speed_sum, speed_count)
+            order = np.lexsort((driver_ids, -score))
+            rank = np.empty(len(driver_ids), dtype=np.int64)
+            rank[order] = np.arange(1, len(driver_ids) + 1)
+
+            now = datetime.utcnow()
+            snapshot_rows = [
+                {
+                    "run_id": run.id,
+                    "organization_id": organization_id,
+                    "driver_id": int(driver_ids[i]),
+                    "total_trips": int(trips[i]),
+                    "total_events": int(events[i]),
+                    "harsh_events": int(harsh[i]),
+                    "harsh_ratio": float(harsh_ratio[i]),
+                    "avg_speed_kmh": None if np.isnan(avg_speed[i]) else float(avg_speed[i]),
+                    "score_0_100": float(score[i]),
+                    "rank": int(rank[i]),
+                    "computed_at": now,
+                }
+                for i in range(len(driver_ids))
+            ]
+            db.execute(insert(models.DriverScoreSnapshot), snapshot_rows)
+            run.event_count = int(events.sum())
+        run.driver_count = int(len(driver_ids))
+        run.status = "done"
+        run.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        run.status = "failed"
+        run.error = str(exc)[:1000]
+        run.finished_at = datetime.utcnow()
+        db.commit()
+        raise
+    logger.info(
+        "score_recompute org=%s run=%s drivers=%s events=%s", organization_id, run.id, run.driver_count, run.event_count
+    )
+    return run
+
+
+def create_run(db: Session, organization_id: int) -> models.ScoreRecomputeRun:
+    run = models.ScoreRecomputeRun(organization_id=organization_id, status="running", started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def list_snapshots(db: Session, run_id: int, limit: int = 100, offset: int = 0) -> List[models.DriverScoreSnapshot]:
+    return (
+        db.query(models.DriverScoreSnapshot)
+        .filter(models.DriverScoreSnapshot.run_id == run_id)
+        .order_by(models.DriverScoreSnapshot.rank.asc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+
+def latest_run(db: Session, organization_id: int) -> Optional[models.ScoreRecomputeRun]:
+    return (
+        db.query(models.ScoreRecomputeRun)
+        .filter(models.ScoreRecomputeRun.organization_id == organization_id, models.ScoreRecomputeRun.status == "done")
+        .order_by(models.ScoreRecomputeRun.started_at.desc(), models.ScoreRecomputeRun.id.desc())
+        .first()
+    )
@@ -0,0 +1,102 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+ScoreTuple = Tuple[int, int, int, float, Optional[float], float]
+
+SCORE_WINDOW_DAYS = {"7d": 7, "30d": 30, "90d": 90}
+SCORE_WINDOWS = ("lifetime", *SCORE_WINDOW_DAYS, "decayed")
+DECAY_HORIZON_DAYS = 365
+
+
+def decay_half_life_days() -> float:
+    return float(os.getenv("SCORE_DECAY_HALF_LIFE_DAYS", "30"))
+
+
+def _score_tuple(trips, events, harsh, speed_sum, speed_count) -> ScoreTuple:
+    avg_speed = float(speed_sum) / speed_count if speed_count else None
+    harsh_ratio, score = crud.score_from_totals(events, harsh, avg_speed)
+    return int(round(trips)), int(round(events)), int(round(harsh)), harsh_ratio, avg_speed, score
+
+
+def _lifetime_scores(db: Session, driver_ids: list[int]) -> Dict[int, ScoreTuple]:
+    stats = models.DriverScoreStats
+    rows = db.query(stats).filter(stats.driver_id.in_(driver_ids)).all()
+    return {
+        row.driver_id: _score_tuple(row.trip_count, row.event_count, row.harsh_count, row.speed_sum, row.speed_count)
+        for row in rows
+    }
+
+
+def _window_scores(db: Session, driver_ids: list[int], since: date) -> Dict[int, ScoreTuple]:
+    daily = models.DriverScoreDaily
+    rows = (
+        db.query(
+            daily.driver_id,
+            func.sum(daily.trip_count),
+            func.sum(daily.event_count),
+            func.sum(daily.harsh_count),
+            func.sum(daily.speed_sum),
+            func.sum(daily.speed_count),
+        )
+        .filter(daily.driver_id.in_(driver_ids), daily.day >= since)
+        .group_by(daily.driver_id)
+        .all()
+    )
+    return {row[0]: _score_tuple(*(value or 0 for value in row[1:])) for row in rows}
+
+
+def _decayed_scores(db: Session, driver_ids: list[int], today: date) -> Dict[int, ScoreTuple]:
+    daily = models.DriverScoreDaily
+    half_life = max(decay_half_life_days(), 0.1)
+    rows = (
+        db.query(daily)
+        .filter(daily.driver_id.in_(driver_ids), daily.day >= today - timedelta(days=DECAY_HORIZON_DAYS))
+        .all()
+    )
+    acc: Dict[int, list] = {}
+    for row in rows:
+        weight = 0.5 ** (max((today - row.day).days, 0) / half_life)
+        # [trips, events, harsh, weighted events, weighted harsh, weighted speed sum, weighted speed count]
+        totals = acc.setdefault(row.driver_id, [0, 0, 0, 0.0, 0.0, 0.0, 0.0])
+        totals[0] += row.trip_count
+        totals[1] += row.event_count
+        totals[2] += row.harsh_count
+        totals[3] += row.event_count * weight
+        totals[4] += row.harsh_count * weight
+        totals[5] += row.speed_sum * weight
+        totals[6] += row.speed_count * weight
+
+    out: Dict[int, ScoreTuple] = {}
+    for driver_id, (trips, events, harsh, w_events, w_harsh, w_speed_sum, w_speed_count) in acc.items():
+        avg_speed = w_speed_sum / w_speed_count if w_speed_count else None
+        harsh_ratio, score = crud.score_from_totals(w_events, w_harsh, avg_speed)
+        out[driver_id] = (trips, events, harsh, harsh_ratio, avg_speed, score)
+    return out
+
+
+def compute_scores(db: Session, driver_ids: Iterable[int], window: str = "lifetime", today: Optional[date] = None) -> Dict[int, ScoreTuple]:
+    """Score many drivers from the pre-aggregated tables; drivers without activity get a clean score."""
+    ids = sorted({int(d) for d in driver_ids})
+    if not ids:
+        return {}
+    today = today or datetime.utcnow().date()
+    if window == "lifetime":
+        scores = _lifetime_scores(db, ids)
+    elif window == "decayed":
+        scores = _decayed_scores(db, ids, today)
+    elif window in SCORE_WINDOW_DAYS:
+        scores = _window_scores(db, ids, today - timedelta(days=SCORE_WINDOW_DAYS[window] - 1))
+    else:
+        raise ValueError(f"unknown score window: {window}")
+    empty = _score_tuple(0, 0, 0, 0, 0)
+    return {driver_id: scores.get(driver_id, empty) for driver_id in ids}
+
+
+def compute_score(db: Session, driver_id: int, window: str = "lifetime") -> ScoreTuple:
+    return compute_scores(db, [driver_id], window)[driver_id]
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Generic, NamedTuple, Optional, Set, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+def session_cache_ttl_sec() -> float:
+    return max(0.0, float(os.getenv("SESSION_CACHE_TTL_SEC", "30")))
+
+
+def session_cache_max_entries() -> int:
+    return max(0, int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000")))
+
+
+def operator_token_cache_ttl_sec() -> float:
+    return max(0.0, float(os.getenv("OPERATOR_TOKEN_CACHE_TTL_SEC", "60")))
+
+
+def operator_token_cache_max_entries() -> int:
+    return max(0, int(os.getenv("OPERATOR_TOKEN_CACHE_MAX_ENTRIES", "1000")))
+
+
+class CachedSession(NamedTuple):
+    driver_id: int
+    session_id: Optional[int]  # None for signed tokens, which have no sessions row
+    driver: object  # detached Driver snapshot; attach with Session.merge(..., load=False)
+
+
+class CachedOperatorToken(NamedTuple):
+    token_id: int
+    group_tag: Optional[str]
+    organization_id: Optional[int]
+    expires_at: Optional[datetime]
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU with a TTL on every entry; ``ttl_sec`` or ``max_entries`` of 0 disables it."""
+
+    def __init__(self, ttl_sec: float, max_entries: int):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, V]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0 and self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[V]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: V) -> V:
+        if not self.enabled:
+            return value
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_sec, value)
+            self._added(key, value)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def _added(self, key: str, value: V) -> None:
+        pass
+
+    def _drop(self, key: str) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        return None if entry is None else entry[1]
+
+
+class SessionCache(TTLCache[CachedSession]):
+    """Bearer token -> resolved session.
+
+    Entries are dropped immediately on revocation in this process; other workers see a revocation
+    at the latest when their entry expires.
+    """
+
+    def __init__(self, ttl_sec: float, max_entries: int):
+        super().__init__(ttl_sec, max_entries)
+        self._by_driver: Dict[int, Set[str]] = {}
+
+    @classmethod
+    def from_env(cls) -> "SessionCache":
+        return cls(ttl_sec=session_cache_ttl_sec(), max_entries=session_cache_max_entries())
+
+    def invalidate_driver(self, driver_id: int) -> None:
+        with self._lock:
+            for token in list(self._by_driver.get(driver_id, ())):
+                self._drop(token)
+
+    def _added(self, key: str, value: CachedSession) -> None:
+        self._by_driver.setdefault(value.driver_id, set()).add(key)
+
+    def _drop(self, key: str) -> Optional[CachedSession]:
+        value = super()._drop(key)
+        if value is not None:
+            tokens = self._by_driver.get(value.driver_id)
+            if tokens is not None:
+                tokens.discard(key)
+                if not tokens:
+                    del self._by_driver[value.driver_id]
+        return value
+
+
+class OperatorTokenCache(TTLCache[CachedOperatorToken]):
+    """Operator token hash -> scope and expiry, so polling consoles authenticate without SQL."""
+
+    @classmethod
+    def from_env(cls) -> "OperatorTokenCache":
+        return cls(ttl_sec=operator_token_cache_ttl_sec(), max_entries=operator_token_cache_max_entries())
+
+
+cache = SessionCache.from_env()
+operator_tokens = OperatorTokenCache.from_env()
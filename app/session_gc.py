@@ -0,0 +1,60 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+from . import crud
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def session_gc_interval_sec() -> float:
+    return max(0.0, float(os.getenv("SESSION_GC_INTERVAL_SEC", "3600")))
+
+
+class SessionGarbageCollector:
+    """Background purge of revoked tokens and idle sessions past the session lifetime."""
+
+    def __init__(self, interval_sec: float):
+        self.interval_sec = interval_sec
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "SessionGarbageCollector":
+        return cls(interval_sec=session_gc_interval_sec())
+
+    def start(self) -> None:
+        if self.interval_sec <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="session-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread, self._thread = self._thread, None
+        if thread:
+            self._wake.set()
+            thread.join(timeout)
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            revoked, sessions = crud.purge_expired_tokens(db)
+            if revoked or sessions:
+                logger.info("session_gc purged revoked_tokens=%s sessions=%s", revoked, sessions)
+        except Exception:
+            db.rollback()
+            logger.exception("session_gc failed")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            self.run_once()
+            if self._wake.wait(self.interval_sec):
+                return
+
+
+collector = SessionGarbageCollector.from_env()
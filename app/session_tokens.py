@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# v1.<driver_id>.<issued_at>.<expires_at>.<nonce>.<signature>; ids and epoch seconds in base 36.
+SIGNED_PREFIX = "v1."
+
+
+def session_token_mode() -> str:
+    return (os.getenv("SESSION_TOKEN_MODE") or "opaque").strip().lower()
+
+
+def _signing_secret() -> bytes:
+    return (os.getenv("SESSION_SIGNING_SECRET") or "").strip().encode("utf-8")
+
+
+def signed_tokens_enabled() -> bool:
+    return session_token_mode() == "signed" and bool(_signing_secret())
+
+
+def session_token_ttl() -> timedelta:
+    return timedelta(seconds=max(60, int(os.getenv("SESSION_TOKEN_TTL_SEC", str(30 * 24 * 3600)))))
+
+
+def revocation_refresh_sec() -> float:
+    return max(1.0, float(os.getenv("SESSION_REVOCATION_REFRESH_SEC", "30")))
+
+
+class SignedSession(NamedTuple):
+    driver_id: int
+    issued_at: datetime
+    expires_at: datetime
+
+
+def _b36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        value, rem = divmod(value, 36)
+        out = digits[rem] + out
+        if not value:
+            return out
+
+
+def _sign(payload: str, secret: bytes) -> str:
+    mac = hmac.new(secret, payload.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode("ascii")
+
+
+def is_signed(token: str) -> bool:
+    return token.startswith(SIGNED_PREFIX)
+
+
+def issue(driver_id: int, now: Optional[datetime] = None) -> str:
+    secret = _signing_secret()
+    if not secret:
+        raise RuntimeError("SESSION_SIGNING_SECRET is required for signed session tokens")
+    now = now or datetime.utcnow()
+    issued = int((now - datetime(1970, 1, 1)).total_seconds())
+    expires = issued + int(session_token_ttl().total_seconds())
+    payload = f"{SIGNED_PREFIX}{_b36(driver_id)}.{_b36(issued)}.{_b36(expires)}.{secrets.token_hex(6)}"
+    return f"{payload}.{_sign(payload, secret)}"
+
+
+def verify(token: str, now: Optional[datetime] = None) -> Optional[SignedSession]:
+    """Claims of a well-formed, correctly signed, unexpired token; CPU only, no database access."""
+    secret = _signing_secret()
+    # Headers arrive latin-1 decoded; anything non-ASCII is malformed and must not reach the signer.
+    if not secret or not is_signed(token) or len(token) > 128 or not token.isascii():
+        return None
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature.encode("ascii"), _sign(payload, secret).encode("ascii")):
+        return None
+    try:
+        driver_id, issued, expires = (int(part, 36) for part in payload[len(SIGNED_PREFIX):].split(".")[:3])
+    except ValueError:
+        return None
+    epoch = datetime(1970, 1, 1)
+    claims = SignedSession(driver_id, epoch + timedelta(seconds=issued), epoch + timedelta(seconds=expires))
+    if claims.expires_at <= (now or datetime.utcnow()):
+        return None
+    return claims
+
+
+class RevocationSet:
+    """Every revoked bearer token held in memory, so checking revocation needs no query.
+
+    Logouts in this process are added directly; revocations made by other workers are picked up by
+    an incremental ``revoked_tokens.id`` scan at most every ``refresh_sec`` seconds. Entries older
+    than ``max_age`` are dropped: a token revoked that long ago is past its lifetime anyway, and the
+    garbage collector removes its row.
+    """
+
+    def __init__(self, refresh_sec: float, max_age: timedelta):
+        self.refresh_sec = refresh_sec
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, datetime] = {}
+        self._last_id = 0
+        self._next_refresh = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def add(self, token: str, revoked_at: Optional[datetime] = None) -> None:
+        with self._lock:
+            self._tokens[token] = revoked_at or datetime.utcnow()
+
+    def contains(self, db: Session, token: str) -> bool:
+        if time.monotonic() >= self._next_refresh:
+            self.refresh(db)
+        return token in self._tokens
+
+    def refresh(self, db: Session) -> None:
+        horizon = datetime.utcnow() - self.max_age
+        rows = (
+            db.query(models.RevokedToken.id, models.RevokedToken.token, models.RevokedToken.revoked_at)
+            .filter(models.RevokedToken.id > self._last_id)
+            .order_by(models.RevokedToken.id)
+            .all()
+        )
+        with self._lock:
+            for row_id, token, revoked_at in rows:
+                if revoked_at >= horizon:
+                    self._tokens[token] = revoked_at
+                self._last_id = max(self._last_id, row_id)
+            self._tokens = {token: at for token, at in self._tokens.items() if at >= horizon}
+            self._next_refresh = time.monotonic() + self.refresh_sec
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._last_id = 0
+            self._next_refresh = 0.0
+
+
+revocations = RevocationSet(revocation_refresh_sec(), session_token_ttl())
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+from . import crud
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled() -> bool:
+    return (os.getenv("TELEMETRY_WRITE_BEHIND") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+class TelemetryBuffer:
+    """Bounded in-process queue of prepared telemetry rows, persisted by a background group commit.
+
+    A failed flush puts the batch back at the head of the queue and backs off exponentially. After
+    ``max_attempts`` failures of the same head batch its rows are inserted one by one, and rows that
+    still fail are logged and dropped so one bad row cannot stall ingest.
+    """
+
+    def __init__(
+        self,
+        max_rows: int,
+        flush_rows: int,
+        flush_interval_ms: int,
+        max_attempts: int = 5,
+        backoff_ms: int = 250,
+        max_backoff_ms: int = 30000,
+    ):
+        self.max_rows = max(1, max_rows)
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = max(1, backoff_ms) / 1000.0
+        self.max_backoff = max(self.backoff, max_backoff_ms / 1000.0)
+        self._failures = 0
+        self._retry_at = 0.0
+        self._dropped = 0
+        self._rows: deque = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls) -> "TelemetryBuffer":
+        return cls(
+            max_rows=int(os.getenv("TELEMETRY_BUFFER_MAX_ROWS", "20000")),
+            flush_rows=int(os.getenv("TELEMETRY_FLUSH_MAX_ROWS", "500")),
+            flush_interval_ms=int(os.getenv("TELEMETRY_FLUSH_INTERVAL_MS", "250")),
+            max_attempts=int(os.getenv("TELEMETRY_FLUSH_MAX_ATTEMPTS", "5")),
+            backoff_ms=int(os.getenv("TELEMETRY_FLUSH_BACKOFF_MS", "250")),
+            max_backoff_ms=int(os.getenv("TELEMETRY_FLUSH_MAX_BACKOFF_MS", "30000")),
+        )
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._rows)
+
+    def offer(self, row: dict) -> bool:
+        with self._cond:
+            if len(self._rows) >= self.max_rows:
+                return False
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify()
+        return True
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="telemetry-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        left = self.depth()
+        if left:
+            logger.error("telemetry_buffer_stop lost_rows=%s", left)
+
+    def dropped(self) -> int:
+        """Rows discarded because they failed on their own after the batch retries ran out."""
+        with self._cond:
+            return self._dropped
+
+    @staticmethod
+    def _insert(rows: List[dict]) -> None:
+        db = SessionLocal()
+        try:
+            crud.bulk_insert_telemetry(db, rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _insert_each(self, batch: List[dict]) -> int:
+        """Insert rows one at a time after repeated batch failures; returns the number stored."""
+        stored = 0
+        for row in batch:
+            try:
+                self._insert([row])
+            except Exception:
+                logger.exception(
+                    "telemetry_buffer_drop driver_id=%s client_event_id=%s ts=%s",
+                    row.get("driver_id"),
+                    row.get("client_event_id"),
+                    row.get("ts"),
+                )
+                with self._cond:
+                    self._dropped += 1
+                continue
+            stored += 1
+        return stored
+
+    def flush(self) -> int:
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch: List[dict] = [self._rows.popleft() for _ in range(min(self.flush_rows, len(self._rows)))]
+                if not batch:
+                    return flushed
+                if self._failures >= self.max_attempts:
+                    # The batch keeps failing as a whole: isolate the rows that cannot be written.
+                    logger.error("telemetry_buffer_flush giving up on batch after %s attempts; inserting rows=%s one by one", self._failures, len(batch))
+                    self._failures = 0
+                    flushed += self._insert_each(batch)
+                    continue
+                try:
+                    self._insert(batch)
+                except Exception:
+                    self._failures += 1
+                    delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+                    logger.exception(
+                        "telemetry_buffer_flush failed rows=%s attempt=%s; retrying in %.2fs", len(batch), self._failures, delay
+                    )
+                    with self._cond:
+                        self._rows.extendleft(reversed(batch))
+                        self._retry_at = time.monotonic() + delay
+                    return flushed
+                self._failures = 0
+                flushed += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stopping:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._cond.wait(backoff)
+                    elif len(self._rows) < self.flush_rows:
+                        self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            if stopping:
+                return
+            if time.monotonic() >= self._retry_at:
+                self.flush()
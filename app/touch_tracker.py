@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, or_, update
+
+from . import models
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# kind -> (table, timestamp column) of the rows whose last use is tracked.
+TARGETS = {
+    "session": (models.SessionToken.__table__, "last_seen_at"),
+    "operator_token": (models.OperatorToken.__table__, "last_used_at"),
+}
+
+
+def touch_flush_interval_sec() -> float:
+    return max(0.1, float(os.getenv("LAST_SEEN_FLUSH_SEC", "15")))
+
+
+def touch_granularity() -> timedelta:
+    return timedelta(seconds=max(0.0, float(os.getenv("LAST_SEEN_GRANULARITY_SEC", "60"))))
+
+
+class TouchTracker:
+    """Coalesces ``last_seen_at``/``last_used_at`` touches in memory and writes them in one batched
+    UPDATE per table every ``flush_interval`` seconds.
+
+    A row is only rewritten when its stored value is older than ``granularity``, so an active
+    session costs at most one write per granule instead of one commit per request. While the
+    flusher thread is not running (CLI, tests) :meth:`record` refuses touches and callers write
+    them directly.
+    """
+
+    def __init__(self, flush_interval: float, granularity: timedelta):
+        self.flush_interval = flush_interval
+        self.granularity = granularity
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int], datetime] = {}
+        self._written: Dict[Tuple[str, int], datetime] = {}
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "TouchTracker":
+        return cls(flush_interval=touch_flush_interval_sec(), granularity=touch_granularity())
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def is_fresh(self, stored: Optional[datetime], now: datetime) -> bool:
+        return stored is not None and now - stored < self.granularity
+
+    def record(self, kind: str, row_id: int, now: Optional[datetime] = None) -> bool:
+        """Queue a touch; False when the flusher is not running and the caller must write it itself."""
+        if not self.running:
+            return False
+        now = now or datetime.utcnow()
+        key = (kind, row_id)
+        with self._lock:
+            if not self.is_fresh(self._written.get(key), now):
+                self._pending[key] = now
+        return True
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="last-seen-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread, self._thread = self._thread, None
+        if thread:
+            self._wake.set()
+            thread.join(timeout)
+        self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            batches: Dict[str, list] = {}
+            for (kind, row_id), seen in pending.items():
+                batches.setdefault(kind, []).append({"b_id": row_id, "b_seen": seen, "b_stale": seen - self.granularity})
+            db = SessionLocal()
+            try:
+                conn = db.connection()
+                for kind, params in batches.items():
+                    table, column = TARGETS[kind]
+                    col = table.c[column]
+                    stmt = (
+                        update(table)
+                        .where(table.c.id == bindparam("b_id"), or_(col.is_(None), col < bindparam("b_stale")))
+                        .values({column: bindparam("b_seen")})
+                    )
+                    conn.execute(stmt, params)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("last_seen_flush failed rows=%s; requeueing", len(pending))
+                with self._lock:
+                    for key, seen in pending.items():
+                        if self._pending.get(key, seen) <= seen:
+                            self._pending[key] = seen
+                return 0
+            finally:
+                db.close()
+            with self._lock:
+                self._written.update(pending)
+                horizon = datetime.utcnow() - self.granularity
+                self._written = {key: seen for key, seen in self._written.items() if seen >= horizon}
+            return len(pending)
+
+    def _run(self) -> None:
+        while not self._wake.wait(self.flush_interval):
+            self.flush()
+
+
+tracker = TouchTracker.from_env()
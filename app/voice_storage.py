@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Upload chunks are collected up to this size before a write is handed to the I/O pool.
+WRITE_BATCH_BYTES = 256 * 1024
+
+
+def voice_storage_root() -> Path:
+    return Path(os.getenv("VOICE_STORAGE_DIR") or "/app/data/voice")
+
+
+def voice_storage_layout() -> str:
+    """``sharded`` (default) keeps every distinct clip once, at ``blobs/<ab>/<cd>/<sha256><ext>``;
+    ``dated`` writes ``<driver_id>/<timestamp><ext>`` files as before."""
+    return (os.getenv("VOICE_STORAGE_LAYOUT") or "sharded").strip().lower()
+
+
+def voice_io_workers() -> int:
+    return max(0, int(os.getenv("VOICE_IO_WORKERS", "4")))
+
+
+def voice_fsync_enabled() -> bool:
+    return (os.getenv("VOICE_FSYNC") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def voice_download_mode() -> str:
+    """``direct`` (default) streams clips from Python; ``accel`` answers with ``X-Accel-Redirect`` (nginx)
+    and ``sendfile`` with ``X-Sendfile`` (Apache, lighttpd), leaving the bytes to the fronting proxy."""
+    return (os.getenv("VOICE_DOWNLOAD_MODE") or "direct").strip().lower()
+
+
+def voice_accel_prefix() -> str:
+    """Internal proxy location mapped onto the storage root, for ``accel`` mode."""
+    return "/" + (os.getenv("VOICE_ACCEL_PREFIX") or "/internal/voice/").strip("/") + "/"
+
+
+def clean_suffix(suffix: str) -> str:
+    suffix = (suffix or "").lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,8}", suffix) else ".webm"
+
+
+def _fsync_dir(directory: Path) -> None:
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SpoolFile:
+    """Temp file filled from an upload; writes are batched and executed on the storage pool."""
+
+    def __init__(self, storage: "VoiceStorage", path: Path, fh):
+        self.storage = storage
+        self.path = path
+        self._fh = fh
+        self._pending = bytearray()
+        self._digest = hashlib.sha256()
+
+    async def write(self, data: bytes) -> None:
+        self._pending += data
+        if len(self._pending) >= WRITE_BATCH_BYTES:
+            await self._drain()
+
+    async def _drain(self) -> None:
+        if self._pending:
+            batch, self._pending = bytes(self._pending), bytearray()
+            await self.storage.run(self._write, batch)
+
+    def _write(self, batch: bytes) -> None:
+        self._fh.write(batch)
+        self._digest.update(batch)
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of everything written so far; complete once the file is closed."""
+        return self._digest.hexdigest()
+
+    async def close(self) -> None:
+        await self._drain()
+        await self.storage.run(self._finish)
+
+    def _finish(self) -> None:
+        self._fh.flush()
+        if self.storage.fsync:
+            os.fsync(self._fh.fileno())
+        self._fh.close()
+
+    async def abort(self) -> None:
+        self._pending.clear()
+        await self.storage.run(self._abort)
+
+    def _abort(self) -> None:
+        self._fh.close()
+        self.path.unlink(missing_ok=True)
+
+
+class VoiceStorage:
+    """Voice file persistence off the event loop.
+
+    Every filesystem call runs on a dedicated thread pool (``workers`` threads; 0 runs them inline
+    on the loop, the old behaviour). Files are spooled under ``<root>/.incoming`` and published with
+    an atomic rename, so readers never see a partial clip; with ``fsync`` the data and the directory
+    entry are flushed before the rename is reported.
+    """
+
+    def __init__(self, root: Path, workers: int, fsync: bool):
+        self.root = root
+        self.workers = workers
+        self.fsync = fsync
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "VoiceStorage":
+        return cls(root=voice_storage_root(), workers=voice_io_workers(), fsync=voice_fsync_enabled())
+
+    @property
+    def spool_dir(self) -> Path:
+        return self.root / ".incoming"
+
+    async def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="voice-io")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_spool(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix="upload-", suffix=".part", dir=str(self.spool_dir))
+        return Path(name), os.fdopen(fd, "wb")
+
+    async def spool(self) -> SpoolFile:
+        path, fh = await self.run(self._open_spool)
+        return SpoolFile(self, path, fh)
+
+    def _publish(self, temp_path: Path, directory: Path, suffix: str) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}{suffix}"
+        os.replace(temp_path, path)
+        if self.fsync:
+            _fsync_dir(directory)
+        return path
+
+    async def publish(self, temp_path: Path, directory: Path, suffix: str) -> Path:
+        """Move a closed spool file to ``directory/<timestamp><suffix>`` and return the final path."""
+        return await self.run(self._publish, temp_path, directory, suffix)
+
+    @property
+    def blob_dir(self) -> Path:
+        return self.root / "blobs"
+
+    def is_blob(self, path: str) -> bool:
+        try:
+            Path(path).resolve().relative_to(self.blob_dir.resolve())
+        except ValueError:
+            return False
+        return True
+
+    def blob_path(self, sha256: str, suffix: str) -> Path:
+        return self.blob_dir / sha256[:2] / sha256[2:4] / f"{sha256}{clean_suffix(suffix)}"
+
+    def store_blob(self, source: Path, sha256: str, suffix: str, keep_source: bool = False) -> Tuple[Path, bool]:
+        """Put ``source`` into the blob store under its content hash; returns ``(path, created)``.
+
+        An existing blob wins and the new copy is dropped. A spool file is renamed into place; with
+        ``keep_source`` the file is hard-linked instead (copied across filesystems) and left alone.
+        """
+        target = self.blob_path(sha256, suffix)
+        if target.exists():
+            if not keep_source:
+                source.unlink(missing_ok=True)
+            return target, False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not keep_source:
+            os.replace(source, target)
+        else:
+            try:
+                os.link(source, target)
+            except FileExistsError:
+                return target, False
+            except OSError:
+                self.spool_dir.mkdir(parents=True, exist_ok=True)
+                fd, name = tempfile.mkstemp(prefix="migrate-", suffix=".part", dir=str(self.spool_dir))
+                try:
+                    with os.fdopen(fd, "wb") as out, open(source, "rb") as src:
+                        shutil.copyfileobj(src, out)
+                        if self.fsync:
+                            out.flush()
+                            os.fsync(out.fileno())
+                    os.replace(name, target)
+                except BaseException:
+                    Path(name).unlink(missing_ok=True)
+                    raise
+        if self.fsync:
+            _fsync_dir(target.parent)
+        return target, True
+
+    async def publish_blob(self, temp_path: Path, sha256: str, suffix: str) -> Path:
+        """Move a closed spool file into the blob store; an identical clip already stored is reused."""
+        path, _created = await self.run(self.store_blob, temp_path, sha256, suffix)
+        return path
+
+    def internal_uri(self, path: Path) -> Optional[str]:
+        """``X-Accel-Redirect`` target for a stored clip; None when it lies outside the storage root."""
+        try:
+            relative = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        return voice_accel_prefix() + quote(relative.as_posix())
+
+    async def discard(self, temp_path: Path) -> None:
+        await self.run(temp_path.unlink, True)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+storage = VoiceStorage.from_env()
+
+
+def _hash_file(path: Path) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+def migrate_to_blobs(
+    db: Session,
+    store: VoiceStorage,
+    batch_size: int = 500,
+    grace_sec: float = 5.0,
+    dry_run: bool = False,
+) -> Tuple[int, int, int]:
+    """Move clips stored in the ``dated`` layout into the blob store; returns ``(migrated, deduplicated, missing)``.
+
+    Candidates are rows whose file lies outside ``<root>/blobs``. ``content_sha256`` is no guide:
+    uploads made with ``VOICE_STORAGE_LAYOUT=dated`` record their hash too.
+
+    Safe to run while the API serves traffic and to re-run: a clip is linked into the blob store
+    before its row is re-pointed with a compare-and-set UPDATE, and an original file is only removed
+    ``grace_sec`` after its batch commits, once no row references it, so downloads that already
+    resolved the old path still find it.
+    """
+    vm = models.VoiceMessage
+    blob_prefixes = {str(store.blob_dir) + os.sep, str(store.blob_dir.resolve()) + os.sep}
+    migrated = deduplicated = missing = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(vm.id, vm.file_path)
+            .filter(vm.id > last_id, *(~vm.file_path.startswith(prefix, autoescape=True) for prefix in blob_prefixes))
+            .order_by(vm.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        replaced = []
+        for row_id, file_path in rows:
+            if store.is_blob(file_path):
+                continue  # stored through a symlinked or relative root spelling
+            source = Path(file_path)
+            try:
+                sha256 = _hash_file(source)
+            except FileNotFoundError:
+                missing += 1
+                logger.warning("voice_migrate_missing id=%s path=%s", row_id, file_path)
+                continue
+            if dry_run:
+                migrated += 1
+                continue
+            target, created = store.store_blob(source, sha256, source.suffix, keep_source=True)
+            result = db.execute(
+                update(vm)
+                .where(vm.id == row_id, vm.file_path == file_path)
+                .values(file_path=str(target), content_sha256=sha256, file_size=target.stat().st_size)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                migrated += 1
+                deduplicated += 0 if created else 1
+                if source != target:
+                    replaced.append(source)
+        db.commit()
+        if replaced and grace_sec > 0:
+            time.sleep(grace_sec)
+        for source in replaced:
+            if db.query(vm.id).filter(vm.file_path == str(source)).first() is None:
+                source.unlink(missing_ok=True)
+                try:
+                    source.parent.rmdir()
+                except OSError:
+                    pass
+        logger.info("voice_migrate_batch last_id=%s migrated=%s deduplicated=%s missing=%s", last_id, migrated, deduplicated, missing)
+    return migrated, deduplicated, missing
@@ -0,0 +1,105 @@
+"""Query count and latency of ``crud.get_operator_dashboard`` as the fleet grows.
+
+Run from the repository root::
+
+    python benchmarks/operator_dashboard_queries.py --sizes 10 100 1000 2000
+
+Uses a throwaway SQLite database; the query count must not depend on the fleet size.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("DRIVER_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="dash-bench-"), "bench.db"))
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.db import SessionLocal, engine, init_db  # noqa: E402
+
+
+def seed(db, group_tag: str, drivers: int, trips_per_driver: int, events_per_driver: int) -> None:
+    now = datetime.utcnow()
+    start = db.query(models.Driver).count()
+    db.execute(
+        insert(models.Driver),
+        [
+            {"phone": f"+3069{start + i:08d}", "name": f"bench-{start + i}", "group_tag": group_tag, "approved": True}
+            for i in range(drivers)
+        ],
+    )
+    ids = [row[0] for row in db.query(models.Driver.id).filter(models.Driver.group_tag == group_tag).order_by(models.Driver.id.desc()).limit(drivers)]
+    trips, events = [], []
+    for driver_id in ids:
+        for t in range(trips_per_driver):
+            started = now - timedelta(hours=trips_per_driver - t)
+            finished = None if t == trips_per_driver - 1 and driver_id % 3 == 0 else started + timedelta(minutes=30)
+            trips.append({"driver_id": driver_id, "started_at": started, "finished_at": finished, "group_tag": group_tag})
+        for e in range(events_per_driver):
+            events.append(
+                {
+                    "driver_id": driver_id,
+                    "ts": now - timedelta(seconds=events_per_driver - e),
+                    "latitude": 37.9 + e * 1e-4,
+                    "longitude": 23.7,
+                    "speed_kmh": 40.0 + e % 30,
+                    "brake_hard": e % 7 == 0,
+                }
+            )
+    db.execute(insert(models.Trip), trips)
+    db.execute(insert(models.TelemetryEvent), events)
+    db.commit()
+    # Rows were inserted behind crud's back, so refresh the derived live-status table.
+    crud.rebuild_driver_live_status(db)
+
+
+def measure(db, group_tag: str) -> tuple:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        t0 = time.perf_counter()
+        payload = crud.get_operator_dashboard(db, group_tag=group_tag)
+        elapsed = time.perf_counter() - t0
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return len(statements), elapsed, len(payload["drivers"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 2000])
+    parser.add_argument("--trips", type=int, default=3, help="Trips per driver")
+    parser.add_argument("--events", type=int, default=20, help="Telemetry events per driver")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    print(f"{'drivers':>8} {'queries':>8} {'ms':>9}")
+    counts = set()
+    try:
+        for size in args.sizes:
+            group_tag = f"bench-{size}"
+            seed(db, group_tag, size, args.trips, args.events)
+            db.expire_all()
+            queries, elapsed, rows = measure(db, group_tag)
+            assert rows == size, (rows, size)
+            counts.add(queries)
+            print(f"{size:>8} {queries:>8} {elapsed * 1000:>9.1f}")
+    finally:
+        db.close()
+    if len(counts) != 1:
+        raise SystemExit(f"query count varies with fleet size: {sorted(counts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Voice upload latency and event-loop stalls under concurrent load.
+
+Run from the repository root::
+
+    python benchmarks/voice_upload_latency.py --uploads 64 --concurrency 16 --size-kb 512 --fsync
+
+Drives ``POST /api/v1/voice-messages`` in-process through httpx's ASGI transport, once with file
+I/O inline on the event loop (``VOICE_IO_WORKERS=0``, the old behaviour) and once on the voice I/O
+pool, while a ticker coroutine records how late the loop wakes it up. Uses a throwaway SQLite
+database and voice directory.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+_tmp = tempfile.mkdtemp(prefix="voice-bench-")
+os.environ.setdefault("DRIVER_DB_PATH", os.path.join(_tmp, "bench.db"))
+os.environ.setdefault("VOICE_STORAGE_DIR", os.path.join(_tmp, "voice"))
+
+import httpx  # noqa: E402
+
+from app import crud, models, voice_storage  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+
+BOUNDARY = "voicebenchboundary"
+
+
+def seed_driver() -> str:
+    db = SessionLocal()
+    try:
+        driver = models.Driver(phone="+306900000999", name="voice-bench", approved=True)
+        db.add(driver)
+        db.commit()
+        token = "voice-bench-token"
+        crud.create_session_token(db, driver_id=driver.id, token=token)
+        return token
+    finally:
+        db.close()
+
+
+def multipart_body(size: int) -> bytes:
+    head = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="note"\r\n\r\nbench\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="clip.webm"\r\n'
+        "Content-Type: audio/webm\r\n\r\n"
+    ).encode()
+    return head + os.urandom(size) + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def ticker(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run(token: str, uploads: int, concurrency: int, body: bytes) -> tuple:
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    latencies, lags = [], []
+    sem = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+
+        async def one() -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/api/v1/voice-messages", content=body, headers=headers)
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        tick = asyncio.create_task(ticker(stop, lags))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(uploads)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        await tick
+    return latencies, lags, wall
+
+
+def pct(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4, help="Voice I/O pool size for the pooled run")
+    parser.add_argument("--fsync", action="store_true", help="fsync each clip and its directory (VOICE_FSYNC)")
+    args = parser.parse_args()
+
+    token = seed_driver()
+    body = multipart_body(args.size_kb * 1024)
+    storage = voice_storage.storage
+    storage.fsync = args.fsync
+
+    print(f"{'mode':>8} {'uploads/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'loop lag p99 ms':>16} {'lag max ms':>11}")
+    for label, workers in (("inline", 0), ("pool", args.workers)):
+        storage.shutdown()
+        storage.workers = workers
+        latencies, lags, wall = asyncio.run(run(token, args.uploads, args.concurrency, body))
+        print(
+            f"{label:>8} {args.uploads / wall:>10.1f} {pct(latencies, 0.5):>8.1f} {pct(latencies, 0.95):>8.1f} "
+            f"{max(latencies) * 1000:>8.1f} {pct(lags, 0.99):>16.1f} {max(lags) * 1000:>11.1f}"
+        )
+        print(f"{'':>8} median loop lag {statistics.median(lags) * 1000:.2f} ms over {len(lags)} ticks")
+    storage.shutdown()
+
+
+if __name__ == "__main__":
+    main()
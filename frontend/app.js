@@ -96,6 +96,11 @@ let cbInboxTimer = null;
 let autoGpsWatchId = null;
 let autoGpsSendTimer = null;
 let lastGpsPoint = null;
+let telemetryReplayInFlight = false;
+let telemetryReplayPaused = false;
+const TELEMETRY_BACKLOG_KEY = "telemetry_backlog";
+const TELEMETRY_BACKLOG_MAX = 5000;
+const TELEMETRY_REPLAY_CHUNK = 500;
 const DEFAULT_FAVICON = "https://thronoschain.org/thronos-coin.png";
 
 function $(id) { return document.getElementById(id); }
@@ -212,6 +217,7 @@ function getToken() { return localStorage.getItem("driverSessionToken"); }
 function setSession(data) {
   localStorage.setItem("driverSessionToken", data.session_token);
   localStorage.setItem("driverProfile", JSON.stringify(data.driver));
+  telemetryReplayPaused = false;
 }
 function clearSession() {
   localStorage.removeItem("driverSessionToken");
@@ -547,10 +553,82 @@ async function sendTelemetry() {
     road_type: null,
     weather: $("weather").value || null,
     raw_notes: $("telemetryNotes").value.trim() || null,
+    device_ts: new Date().toISOString(),
+    seq: nextTelemetrySeq(),
+    client_event_id: newClientEventId(),
   };
-  const resp = await apiFetch("/api/v1/telemetry", { method: "POST", body: JSON.stringify(payload) });
+  let resp = null;
+  try {
+    resp = await apiFetch("/api/v1/telemetry", { method: "POST", body: JSON.stringify(payload) });
+  } catch (e) {
+    if (e.message === "Unauthorized") throw e;
+  }
+  if (!resp || resp.status >= 500) {
+    queueTelemetryBacklog(payload);
+    $("telemetryNotes").value = "";
+    return;
+  }
   if (!resp.ok) return toast("Σφάλμα αποστολής telemetry.");
   $("telemetryNotes").value = "";
+  replayTelemetryBacklog().catch(() => {});
+}
+
+function newClientEventId() {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function nextTelemetrySeq() {
+  const seq = Number(localStorage.getItem("telemetry_seq") || "0") + 1;
+  localStorage.setItem("telemetry_seq", String(seq));
+  return seq;
+}
+
+function readTelemetryBacklog() {
+  try {
+    return JSON.parse(localStorage.getItem(TELEMETRY_BACKLOG_KEY) || "[]");
+  } catch (e) {
+    return [];
+  }
+}
+
+function queueTelemetryBacklog(payload) {
+  const backlog = readTelemetryBacklog();
+  backlog.push(payload);
+  localStorage.setItem(TELEMETRY_BACKLOG_KEY, JSON.stringify(backlog.slice(-TELEMETRY_BACKLOG_MAX)));
+}
+
+async function replayTelemetryBacklog() {
+  if (telemetryReplayInFlight || telemetryReplayPaused) return;
+  telemetryReplayInFlight = true;
+  try {
+    // Points queued by older builds carry no client_event_id; give them one so they can be matched below.
+    let backlog = readTelemetryBacklog().map((p) => (p.client_event_id ? p : { ...p, client_event_id: newClientEventId() }));
+    localStorage.setItem(TELEMETRY_BACKLOG_KEY, JSON.stringify(backlog));
+    while (backlog.length) {
+      const chunk = backlog.slice(0, TELEMETRY_REPLAY_CHUNK);
+      let resp;
+      try {
+        resp = await apiFetch("/api/v1/telemetry/replay", { method: "POST", body: JSON.stringify(chunk) });
+      } catch (e) {
+        if (e.message === "Unauthorized") telemetryReplayPaused = true;
+        throw e;
+      }
+      if (resp.status === 401 || resp.status === 403) {
+        // The session expired or was revoked: keep the backlog until the driver signs in again.
+        telemetryReplayPaused = true;
+        return;
+      }
+      // Only rejected data (too old, invalid) is dropped; retrying it cannot succeed. Anything else is retried later.
+      if (!resp.ok && resp.status !== 400 && resp.status !== 422) return;
+      // Remove by id: points queued (or trimmed off the front) during the request shift positions.
+      const sent = new Set(chunk.map((p) => p.client_event_id));
+      backlog = readTelemetryBacklog().filter((p) => !sent.has(p.client_event_id));
+      localStorage.setItem(TELEMETRY_BACKLOG_KEY, JSON.stringify(backlog));
+    }
+  } finally {
+    telemetryReplayInFlight = false;
+  }
 }
 
 
@@ -776,7 +854,91 @@ async function loadOperatorDashboard() {
   const resp = await fetch(`${API_BASE}/api/operator/dashboard?${qs.toString()}`, { headers: { "X-Admin-Token": token } });
   if (!resp.ok) return toast("Operator auth/data error");
   const data = await resp.json();
+  operatorData = data;
   renderOperatorData(data);
+  connectOperatorStream();
+}
+
+let operatorData = null;
+let operatorStream = null;
+let operatorStreamKey = "";
+let operatorRenderTimer = null;
+
+async function refreshOperatorDelta() {
+  if (!operatorData || operatorData.cursor == null) return loadOperatorDashboard();
+  const qs = new URLSearchParams({ since: String(operatorData.cursor) });
+  const groupTag = getOperatorGroupTag();
+  if (groupTag) qs.set("group_tag", groupTag);
+  const resp = await fetch(`${API_BASE}/api/operator/dashboard?${qs.toString()}`, { headers: { "X-Admin-Token": getOperatorToken() } });
+  if (!resp.ok) return;
+  const delta = await resp.json();
+  const byId = new Map(delta.delta ? (operatorData.drivers || []).map((d) => [d.id, d]) : []);
+  (delta.removed || []).forEach((id) => byId.delete(id));
+  (delta.drivers || []).forEach((d) => byId.set(d.id, d));
+  operatorData = {
+    ...operatorData,
+    drivers: [...byId.values()].sort((a, b) => b.id - a.id),
+    active_drivers: delta.active_drivers,
+    cursor: delta.cursor,
+  };
+  scheduleOperatorRender();
+}
+
+function scheduleOperatorRender() {
+  if (operatorRenderTimer) return;
+  operatorRenderTimer = setTimeout(() => {
+    operatorRenderTimer = null;
+    if (operatorData) renderOperatorData(operatorData);
+  }, 500);
+}
+
+function applyOperatorEvent(type, ev) {
+  if (!operatorData) return;
+  const d = (operatorData.drivers || []).find((x) => x.id === ev.driver_id);
+  if (!d) return loadOperatorDashboard();
+  if (type === "position") {
+    const prev = d.last_telemetry;
+    if (!prev || !prev.timestamp || prev.timestamp <= ev.timestamp) {
+      d.last_telemetry = { lat: ev.lat, lng: ev.lng, speed: ev.speed, timestamp: ev.timestamp };
+      // Like the dashboard payload, last_event reflects only the newest sample: a later clean one clears it.
+      if (d.last_event && d.last_event.timestamp < ev.timestamp) d.last_event = null;
+    }
+  } else if (type === "harsh") {
+    const prev = d.last_event;
+    if (!prev || !prev.timestamp || prev.timestamp <= ev.timestamp) {
+      d.last_event = { type: "telemetry_flag", flags: ev.flags, timestamp: ev.timestamp };
+    }
+  } else if (type === "trip") {
+    const was = d.last_trip_status;
+    d.last_trip_status = ev.status;
+    if (was !== "active" && ev.status === "active") operatorData.active_drivers = (operatorData.active_drivers || 0) + 1;
+    if (was === "active" && ev.status !== "active") operatorData.active_drivers = Math.max(0, (operatorData.active_drivers || 0) - 1);
+  }
+  scheduleOperatorRender();
+}
+
+function connectOperatorStream() {
+  if (!window.EventSource) return;
+  const token = getOperatorToken();
+  const groupTag = getOperatorGroupTag();
+  const key = `${token}|${groupTag}`;
+  if (operatorStream && operatorStreamKey === key) return;
+  if (operatorStream) operatorStream.close();
+  const qs = new URLSearchParams({ token });
+  if (groupTag) qs.set("group_tag", groupTag);
+  operatorStreamKey = key;
+  operatorStream = new EventSource(`${API_BASE}/api/operator/stream?${qs.toString()}`);
+  ["position", "harsh", "trip"].forEach((type) => {
+    operatorStream.addEventListener(type, (e) => applyOperatorEvent(type, JSON.parse(e.data)));
+  });
+  operatorStream.addEventListener("voice", () => loadOperatorVoice());
+  operatorStream.addEventListener("resync", () => loadOperatorDashboard());
+  let connectedOnce = false;
+  operatorStream.addEventListener("ready", () => {
+    // Events sent while the browser was reconnecting are lost, so catch up from the last cursor.
+    if (connectedOnce) refreshOperatorDelta();
+    connectedOnce = true;
+  });
 }
 
 